@@ -1,19 +1,44 @@
-from typing import List
-
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Literal
+from urllib.parse import urlencode
+
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastui import FastUI, AnyComponent, prebuilt_html, components as c
 from fastui.components.display import DisplayMode, DisplayLookup
 from fastui.events import GoToEvent, BackEvent, PageEvent
 from fastui.forms import SelectSearchResponse
-from pydantic import BaseModel, Field
-import uvicorn
+from pydantic import BaseModel, Field, field_validator
 
-from .helper import db_init, get_from_cache, set_to_cache, format_dt, get_hn_link_user, get_hn_link_comment
+from . import export_jobs
+from . import metrics
+from .helper import db_init, db_run, db_executor_shutdown, decode_filters, encode_filters, format_dt, get_data_version, \
+    get_hn_link_user, get_hn_link_comment
 from .models import JobModel, StatusModel
+from .profiling import ProfilingMiddleware
+from .responses import CompressionMiddleware, choose_encoding, make_etag, match_etag
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create or migrate the database when the server starts, not when the module is imported
+    db_init()
+    yield
+    # Let pending database calls finish
+    db_executor_shutdown()
+
 
-app = FastAPI()
-db_init()
+# Cookie keeping the listing filters of a client, for 30 days
+FILTERS_COOKIE = 'filters'
+FILTERS_COOKIE_MAX_AGE = 30 * 24 * 3600
+
+# Endpoints are async, blocking database calls go through the database executor (see helper.db_run)
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 
 class FilterForm(BaseModel):
@@ -23,8 +48,22 @@ class FilterForm(BaseModel):
 
 class SearchForm(BaseModel):
     # Send this as "search" query parameter to the backend
+    # Full-text search: all terms must match, "quoted text" is a phrase and term* a prefix
     search: str = Field(json_schema_extra={
-                        'placeholder': 'Search...'})
+                        'placeholder': 'Search... (e.g. python "remote ok" eng*)'})
+
+
+class StatusUpdateRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=10000)
+    status: str
+
+    @field_validator('status')
+    @classmethod
+    def check_status(cls, status: str) -> str:
+        # Invalid statuses are validation errors (422), like invalid ids
+        if status not in JobModel.STATUS_VALUES:
+            raise ValueError('Invalid status')
+        return status
 
 
 @app.get('/api/search/status', response_model=SelectSearchResponse)
@@ -36,22 +75,86 @@ async def status_search_view(request: Request, q: str) -> SelectSearchResponse:
     return SelectSearchResponse(options=options)
 
 
-@app.get("/api/", response_model=FastUI, response_model_exclude_none=True)
-def users_table(status: str | None = None, search: str | None = None, clear_cache: str | None = None) -> List[AnyComponent]:
+def pagination_links(page: JobModel.JobPage, **filters) -> AnyComponent:
+    """ Links to the previous and next pages of a listing, with its filters """
+
+    filters = {name: value for name, value in filters.items() if value}
+
+    links = []
+    if page.prev_cursor:
+        links.append(c.Link(
+            components=[c.Text(text='« Previous')],
+            on_click=GoToEvent(url='?%s' % urlencode({**filters, 'before': page.prev_cursor})),
+        ))
+    if page.next_cursor:
+        links.append(c.Link(
+            components=[c.Text(text='Next »')],
+            on_click=GoToEvent(url='?%s' % urlencode({**filters, 'after': page.next_cursor})),
+        ))
+
+    return c.Div(components=links, class_name='d-flex gap-3')
+
+
+def user_summary_text(summary: JobModel.UserSummary | None) -> str:
+    """ Jobs of a user by status and last activity, e.g. "2 new, 1 applied (last activity 09/16/2024 11:40:43 AM)" """
+
+    if summary is None:
+        return 'No jobs'
+
+    counts = ['%d %s' % (summary.get_count(status.value), status.label.lower())
+              for status in StatusModel.get_all() if summary.get_count(status.value)] or ['No jobs']
+
+    return '%s (last activity %s)' % (', '.join(counts), format_dt(summary.last_activity_at))
+
+
+async def get_listing(**kwargs) -> tuple[JobModel.JobPage, int]:
+    """ Get a page of jobs and the total count, invalid cursors are reported as a bad request """
+
+    try:
+        return await db_run(JobModel.get_listing, **kwargs)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+
+
+async def conditional_get(request: Request, response: Response) -> None:
+    """
+    Strong ETag of the pages: they only change with the data version and the request (path, query and filters cookie).
+    Clients sending the ETag of the current version get a 304 without a body, and the page is not built.
+    Pages depend on the filters cookie of the client: shared caches must not store them.
+    """
+
+    version = await db_run(get_data_version)
+    etag = make_etag(version, request.url.path, request.url.query, request.cookies.get(FILTERS_COOKIE))
+    headers = {'Cache-Control': 'private, no-cache', 'Vary': 'Accept-Encoding'}
+
+    tag = match_etag(request.headers.get('if-none-match'), etag)
+    if tag:
+        raise HTTPException(status_code=304, headers={**headers, 'ETag': tag})
+
+    response.headers.update({**headers, 'ETag': etag})
+
+
+@app.get("/api/", response_model=FastUI, response_model_exclude_none=True, dependencies=[Depends(conditional_get)])
+async def users_table(request: Request, response: Response,
+                      status: str | None = None, search: str | None = None, clear_cache: str | None = None,
+                      after: str | None = None, before: str | None = None) -> List[AnyComponent]:
     """
     Show a table of all jobs, the frontend will fetch this
     when a user visits `/` to fetch components to render.
     """
 
-    # # Set filters to/from cache
-    if status or clear_cache:
-        set_to_cache('status', status)
-    else:
-        status = get_from_cache('status')
-    if search or clear_cache:
-        set_to_cache('search', search)
-    else:
-        search = get_from_cache('search')
+    # Filters of the request, or else the last ones of this client, kept in a cookie
+    cookie = request.cookies.get(FILTERS_COOKIE)
+    saved_filters = {} if clear_cache else decode_filters(cookie)
+    status = status or saved_filters.get('status')
+    search = search or saved_filters.get('search')
+
+    filters_cookie = encode_filters({'status': status, 'search': search})
+    if filters_cookie and filters_cookie != cookie:
+        response.set_cookie(FILTERS_COOKIE, filters_cookie, max_age=FILTERS_COOKIE_MAX_AGE,
+                            httponly=True, samesite='lax')
+    elif not filters_cookie and cookie:
+        response.delete_cookie(FILTERS_COOKIE)
 
     # Initial form values
     filter_form_initial = {
@@ -59,66 +162,72 @@ def users_table(status: str | None = None, search: str | None = None, clear_cach
         'search': search
     }
 
-    # Fetch jobs
-    jobs = JobModel.get_all(status=status, search=search)
-
-    return [
-        c.Page(  # Page provides a basic container for components
-            components=[
-                # renders `<h2>Jobs</h2>`
-                c.Heading(text='Jobs listings (%s)' %
-                          (status if status else 'all'), level=2),
-                c.ModelForm(
-                    model=FilterForm,
-                    submit_url='.',
-                    initial=filter_form_initial,
-                    method='GOTO',
-                    submit_on_change=True,
-                    display_mode='inline',
-                ),
-                c.ModelForm(
-                    model=SearchForm,
-                    submit_url='.',
-                    initial=filter_form_initial,
-                    method='GOTO',
-                    submit_on_change=True,
-                    display_mode='inline',
-                ),
-                c.Div(
-                    components=[
-                        c.Text(
-                            text='%d jobs match the criteria ' % len(jobs)),
-                        c.Link(
-                            components=[c.Text(text='(Clear filters)')],
-                            on_click=GoToEvent(url='?clear_cache=1'),
-                        ),
-                    ]
-                ),
-                c.Table(
-                    data=jobs,
-                    columns=[
-                        DisplayLookup(
-                            field='id', on_click=GoToEvent(url='/job/{id}')),
-                        DisplayLookup(field='job_text',
-                                      mode=DisplayMode.markdown),
-                        DisplayLookup(field='status'),
-                        DisplayLookup(field='inserted_at'),
-                    ],
-                ),
-            ]
-        ),
-    ]
-
-
-@app.get("/api/job/{job_id}", response_model=FastUI, response_model_exclude_none=True)
-def job_profile(job_id: int) -> list[AnyComponent]:
+    # Fetch a page of jobs, and the total count
+    page, count = await get_listing(status=status, search=search, after=after, before=before)
+
+    # FastUI components of the page (serialized by FastAPI once returned)
+    with metrics.timed('build', endpoint='users_table'):
+        return [
+            c.Page(  # Page provides a basic container for components
+                components=[
+                    # renders `<h2>Jobs</h2>`
+                    c.Heading(text='Jobs listings (%s)' %
+                              (status if status else 'all'), level=2),
+                    c.ModelForm(
+                        model=FilterForm,
+                        submit_url='.',
+                        initial=filter_form_initial,
+                        method='GOTO',
+                        submit_on_change=True,
+                        display_mode='inline',
+                    ),
+                    c.ModelForm(
+                        model=SearchForm,
+                        submit_url='.',
+                        initial=filter_form_initial,
+                        method='GOTO',
+                        submit_on_change=True,
+                        display_mode='inline',
+                    ),
+                    c.Div(
+                        components=[
+                            c.Text(
+                                text='%d jobs match the criteria ' % count),
+                            c.Link(
+                                components=[c.Text(text='(Clear filters)')],
+                                on_click=GoToEvent(url='?clear_cache=1'),
+                            ),
+                        ]
+                    ),
+                    c.Table(
+                        data=page.jobs,
+                        data_model=JobModel.Job,
+                        no_data_message='No results.',
+                        columns=[
+                            DisplayLookup(
+                                field='id', on_click=GoToEvent(url='/job/{id}')),
+                            DisplayLookup(field='job_text',
+                                          mode=DisplayMode.markdown),
+                            DisplayLookup(field='status'),
+                            DisplayLookup(field='inserted_at'),
+                        ],
+                    ),
+                    pagination_links(page, status=status, search=search),
+                ]
+            ),
+        ]
+
+
+@app.get("/api/job/{job_id}", response_model=FastUI, response_model_exclude_none=True,
+         dependencies=[Depends(conditional_get)])
+async def job_profile(job_id: int) -> list[AnyComponent]:
     """
     Job detail page, the frontend will fetch this
     when a user visits `/job/{job_id}` to fetch components to render.
     """
 
     try:
-        job = JobModel.get(job_id)
+        job = await db_run(JobModel.get, job_id)
     except StopIteration:
         raise HTTPException(status_code=404, detail="Job not found")
 
@@ -157,67 +266,128 @@ def job_profile(job_id: int) -> list[AnyComponent]:
                 job.hn_id), target='_blank'),
         )
 
-    return [
-        c.Page(
-            components=[
-                c.Heading(text="Job details", level=2),
-                c.Link(
-                    components=[c.Text(text='Back to listings')],
-                    on_click=GoToEvent(url='/')
-                ),
-                c.Details(data=job),
-            ]
-        ),
-    ]
+    with metrics.timed('build', endpoint='job_profile'):
+        return [
+            c.Page(
+                components=[
+                    c.Heading(text="Job details", level=2),
+                    c.Link(
+                        components=[c.Text(text='Back to listings')],
+                        on_click=GoToEvent(url='/')
+                    ),
+                    c.Details(data=job),
+                ]
+            ),
+        ]
 
 
 @app.get("/api/job/{job_id}/update/{status}", response_model=FastUI)
 async def update_status(job_id: int, status: str) -> list[AnyComponent]:
-    JobModel.update(job_id, status)
+    await db_run(JobModel.update, job_id, status)
 
     # Redirect
     # return RedirectResponse(url=f'/job/{job_id}')
     return [c.FireEvent(event=GoToEvent(url=f'/job/{job_id}'))]
 
 
-@app.get("/api/user/{hn_user}", response_model=FastUI, response_model_exclude_none=True)
-def user_jobs_profile(hn_user: str) -> list[AnyComponent]:
+@app.post("/api/jobs/status")
+async def update_statuses(update: StatusUpdateRequest) -> dict:
     """
-    Show a table of all jobs from a specific user.
+    Update the status of several jobs at once, in a single transaction.
+    Returns the number of updated jobs, unknown ids are ignored.
     """
 
-    # Fetch jobs
-    jobs = JobModel.get_by_user(hn_user=hn_user)
+    count = await db_run(JobModel.update_many, update.ids, update.status)
 
-    return [
-        c.Page(  # Page provides a basic container for components
-            components=[
-                # renders `<h2>Jobs</h2>`
-                c.Heading(text='Jobs listings by %s' % (hn_user), level=2),
-                c.Link(
-                    components=[c.Text(text='Back to listings')],
-                    on_click=GoToEvent(url='/')
-                ),
-                c.Div(
-                    components=[
-                        c.Text(
-                            text='%d jobs match the criteria ' % len(jobs)),
-                    ]
-                ),
-                c.Table(
-                    data=jobs,
-                    columns=[
-                        DisplayLookup(
-                            field='id', on_click=GoToEvent(url='/job/{id}')),
-                        DisplayLookup(field='job_text',
-                                      mode=DisplayMode.markdown),
-                        DisplayLookup(field='status'),
-                        DisplayLookup(field='inserted_at'),
-                    ],
-                ),
-            ]
-        ),
-    ]
+    return {'updated': count}
+
+
+@app.get("/api/export")
+async def export(request: Request, format: Literal['ndjson', 'csv'] = 'ndjson', status: str | None = None,
+                 hn_user: str | None = None, since: date | None = None, until: date | None = None) -> StreamingResponse:
+    """
+    Stream the jobs matching the filters as NDJSON or CSV, gzipped on the fly if the client accepts it.
+    Rows are read as the response is sent, in constant memory.
+    """
+
+    if status and status not in JobModel.STATUS_VALUES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+
+    # The stream is compressed with gzip only, brotli would need a streaming compressor
+    compress = choose_encoding(request.headers.get('accept-encoding'), ['gzip']) == 'gzip'
+    headers = {
+        'Content-Disposition': 'attachment; filename="jobs.%s"' % format,
+        'Vary': 'Accept-Encoding',
+    }
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+
+    chunks = export_jobs.export(format, compress, status=status, hn_user=hn_user, since=since, until=until)
+
+    return StreamingResponse(chunks, media_type=export_jobs.FORMATS[format], headers=headers)
+
+
+@app.get("/api/user/{hn_user}", response_model=FastUI, response_model_exclude_none=True,
+         dependencies=[Depends(conditional_get)])
+async def user_jobs_profile(hn_user: str, after: str | None = None, before: str | None = None) -> list[AnyComponent]:
+    """
+    Show a table of all jobs from a specific user.
+    """
+
+    # Fetch a page of jobs, the total count and the summary of the user
+    (page, count), summary = await asyncio.gather(
+        get_listing(hn_user=hn_user, after=after, before=before),
+        db_run(JobModel.get_user_summary, hn_user),
+    )
+
+    with metrics.timed('build', endpoint='user_jobs_profile'):
+        return [
+            c.Page(  # Page provides a basic container for components
+                components=[
+                    # renders `<h2>Jobs</h2>`
+                    c.Heading(text='Jobs listings by %s' % (hn_user), level=2),
+                    c.Link(
+                        components=[c.Text(text='Back to listings')],
+                        on_click=GoToEvent(url='/')
+                    ),
+                    c.Div(
+                        components=[
+                            c.Text(
+                                text='%d jobs match the criteria ' % count),
+                        ]
+                    ),
+                    c.Div(
+                        components=[
+                            c.Text(text=user_summary_text(summary)),
+                        ]
+                    ),
+                    c.Table(
+                        data=page.jobs,
+                        data_model=JobModel.Job,
+                        no_data_message='No results.',
+                        columns=[
+                            DisplayLookup(
+                                field='id', on_click=GoToEvent(url='/job/{id}')),
+                            DisplayLookup(field='job_text',
+                                          mode=DisplayMode.markdown),
+                            DisplayLookup(field='status'),
+                            DisplayLookup(field='inserted_at'),
+                        ],
+                    ),
+                    pagination_links(page),
+                ]
+            ),
+        ]
+
+
+@app.get('/metrics')
+async def metrics_view() -> PlainTextResponse:
+    """Metrics of the requests and their stages in the Prometheus text format, when enabled (HN_JOBS_METRICS=1)."""
+
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
 
 
 @app.get('/{path:path}')
@@ -227,4 +397,6 @@ async def html_landing() -> HTMLResponse:
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,6 +1,7 @@
 import sys
 
 from .models import JobModel
+from .profiling import profiled
 
 """
     This utility helps discard any post from a user who previously posted a job that was applied to, interviewed for, or discarded
@@ -20,23 +21,14 @@ def get_count():
 
 
 def discard_jobs():
-    """ Discard all jobs that have been applied to, interviewed at or discarded. """
+    """ Discard all jobs that have been applied to, interviewed at or discarded, in a single update. """
 
-    job_ids = JobModel.get_to_discard()
+    count = JobModel.discard_matched()
 
-    if not job_ids:
+    if not count:
         print("No posts to discard.")
         return 0
 
-    count = 0
-    for job_id in job_ids:
-        res = JobModel.update(job_id, 'discarded')
-        print('Discarding job:', job_id)
-        if not res:
-            print(f"Failed to discard job {job_id}")
-            return
-        count += 1
-
     print(f"Discarded {count} jobs.")
 
     return count
@@ -61,4 +53,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with profiled('auto_discard'):
+        main()
@@ -0,0 +1,91 @@
+import argparse
+import sqlite3
+import tempfile
+import time
+from unittest.mock import patch
+
+from .. import helper
+from ..models import JobModel
+
+"""
+    Benchmark the per-request latency of the JobModel read paths,
+    with a new SQLite connection per request (before) and with pooled connections (after).
+
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.db_connection --jobs 1000 --requests 500
+"""
+
+
+def seed(count):
+    """ Seed the database with `count` jobs """
+
+    conn = helper.db_connect()
+    conn.executemany("""
+    INSERT INTO jobs (hn_id, hn_user, job_text, inserted_at, status)
+    VALUES (?, ?, ?, datetime('now'), 'new')
+    """, [(i, 'user_%d' % (i % 100), '<p>Job %d | Remote | Full-time</p>' % i) for i in range(count)])
+    conn.commit()
+
+
+def unpooled_connect():
+    """ Connection factory used before pooling: a new connection per call """
+
+    conn = sqlite3.connect(helper.get_db_path())
+    conn.row_factory = sqlite3.Row
+
+    return conn
+
+
+def time_requests(func, requests):
+    """ Run `func` `requests` times and return the mean latency in milliseconds """
+
+    start = time.perf_counter()
+    for i in range(requests):
+        func(i)
+
+    return (time.perf_counter() - start) * 1000 / requests
+
+
+def run(jobs, requests):
+    """ Run the benchmark and return the results """
+
+    scenarios = {
+        'get': lambda i: JobModel.get(i % jobs + 1),
+        'get_by_user': lambda i: JobModel.get_by_user('user_%d' % (i % 100)),
+        'update': lambda i: JobModel.update(i % jobs + 1, 'new'),
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with patch.object(helper, 'get_db_path', return_value=tmp_dir + '/bench.db'):
+            helper.db_init()
+            seed(jobs)
+
+            for name, func in scenarios.items():
+                with patch.object(JobModel, 'db_connect', unpooled_connect):
+                    before = time_requests(func, requests)
+                after = time_requests(func, requests)
+                results[name] = (before, after)
+
+            helper.db_close()
+
+    return results
+
+
+def main(jobs, requests):
+    results = run(jobs, requests)
+
+    print(f'{"scenario":<14}{"before (ms)":>14}{"after (ms)":>14}{"speedup":>10}')
+    for name, (before, after) in results.items():
+        print(f'{name:<14}{before:>14.3f}{after:>14.3f}{before / after:>9.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--jobs', '-j', help='Number of jobs to seed', type=int, default=1000)
+    parser.add_argument(
+        '--requests', '-r', help='Number of requests per scenario', type=int, default=500)
+    args = parser.parse_args()
+
+    main(args.jobs, args.requests)
@@ -0,0 +1,88 @@
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from .. import export_jobs
+from .. import helper
+from ..models import JobModel
+from .load_test import seed
+
+"""
+    Benchmark the export of jobs on seeded databases of increasing sizes:
+     - get_all: NDJSON of every job materialized by JobModel.get_all(), the only way to read them all before (reference)
+     - ndjson, csv, ndjson.gz, csv.gz: streams of export_jobs.export()
+
+    Time to the first chunk, total time, output size and peak memory (tracemalloc) are reported.
+    The peak memory of the streams stays flat as the number of jobs grows.
+
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.export --jobs 10000 100000
+"""
+
+SCENARIOS = {
+    'get_all': lambda: [''.join(job.model_dump_json() + '\n' for job in JobModel.get_all()).encode()],
+    'ndjson': lambda: export_jobs.export('ndjson'),
+    'csv': lambda: export_jobs.export('csv'),
+    'ndjson.gz': lambda: export_jobs.export('ndjson', compress=True),
+    'csv.gz': lambda: export_jobs.export('csv', compress=True),
+}
+
+
+def measure(func):
+    """ Consume the stream returned by `func`, returns its timings, size and peak memory """
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    first = None
+    size = 0
+    for chunk in func():
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'first_ms': round((first or 0) * 1000, 2), 'total_ms': round(seconds * 1000, 2), 'size': size,
+            'peak_bytes': peak}
+
+
+def run(sizes, seed_value=0):
+    """ Seed a database for each number of jobs, run the benchmark and return the results """
+
+    results = {}
+    for jobs in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with patch.object(helper, 'get_db_path', return_value=tmp_dir + '/hn_jobs.db'):
+                helper.db_init()
+                seed(jobs, random.Random(seed_value))
+
+                results[jobs] = {name: measure(func) for name, func in SCENARIOS.items()}
+
+                helper.db_close()
+
+    return results
+
+
+def main(sizes):
+    results = run(sizes)
+
+    print(f'{"jobs":>8}  {"scenario":<12}{"first (ms)":>12}{"total (ms)":>12}{"size (B)":>12}{"peak (B)":>12}')
+    for jobs, scenarios in results.items():
+        for name, res in scenarios.items():
+            print(f'{jobs:>8}  {name:<12}{res["first_ms"]:>12.2f}{res["total_ms"]:>12.2f}{res["size"]:>12}'
+                  f'{res["peak_bytes"]:>12}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--jobs', '-j', help='Numbers of jobs to seed', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    main(args.jobs)
@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from bs4 import BeautifulSoup
+
+from .. import fetch_job_postings
+from .. import helper
+
+"""
+    Benchmark the ingest pipeline of fetch_job_postings on synthetic threads.
+
+    Threads are generated offline, shaped like a Hacker News "Who is hiring?" page
+    (src/test/assets/thread.html), with replies mixed in between top-level comments.
+    Each stage is timed, then run again under tracemalloc for its peak memory:
+     - soup: BeautifulSoup parsing of the page
+     - get_all_comments, is_reply, parse_from_comment: extraction from the soup
+     - parse_comments[<backend>]: extraction with each parser backend
+     - save_jobs: first write of the jobs to an empty database, then an unchanged re-ingest
+
+    Results are printed as JSON.
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.ingest --sizes 100 1000 10000 50000
+"""
+
+THREAD_ID = 41425910
+
+HEADER = '''<html lang="en" op="item"><head><meta name="referrer" content="origin"><meta name="viewport" content="width=device-width, initial-scale=1.0"><link rel="stylesheet" type="text/css" href="news.css">
+    <link rel="canonical" href="https://news.ycombinator.com/item?id=%(thread_id)d"/>            <title>Ask HN: Who is hiring? | Hacker News</title></head><body><center><table id="hnmain" border="0" cellpadding="0" cellspacing="0" width="85%%" bgcolor="#f6f6ef">
+<tr id="pagespace" title="Ask HN: Who is hiring?" style="height:10px"></tr><tr><td><table class="fatitem" border="0">
+        <tr class='athing' id='%(thread_id)d'>
+      <td class="title"><span class="titleline"><a href="item?id=%(thread_id)d">Ask HN: Who is hiring?</a></span></td></tr><tr><td class="subtext"><span class="subline">
+          <span class="score" id="score_%(thread_id)d">436 points</span> by <a href="user?id=whoishiring" class="hnuser">whoishiring</a> <span class="age" title="2024-09-02T15:00:06.000000Z"><a href="item?id=%(thread_id)d">12 days ago</a></span> | <a href="item?id=%(thread_id)d">%(comments)d&nbsp;comments</a>        </span>
+              </td></tr>
+    <tr><td style="height:2px"></td></tr><tr><td colspan="2"></td><td><div class="toptext">Please state the location and include REMOTE for remote work.<p>Please only post if you personally are part of the hiring company.</div></td></tr>  </table><br><br><table border="0" class='comment-tree'>
+'''
+
+ROW = '''            <tr class='athing comtr' id='%(hn_id)d'><td><table border='0'>  <tr>    <td class='ind' indent='%(indent)d'><img src="s.gif" height="1" width="%(width)d"></td><td valign="top" class="votelinks">
+      <center><a id='up_%(hn_id)d' href='vote?id=%(hn_id)d&amp;how=up&amp;goto=item%%3Fid%%3D%(thread_id)d'><div class='votearrow' title='upvote'></div></a></center>    </td><td class="default"><div style="margin-top:2px; margin-bottom:-10px;"><span class="comhead">
+          <a href="user?id=%(hn_user)s" class="hnuser">%(hn_user)s</a> <span class="age" title="2024-09-02T19:23:54.000000Z"><a href="item?id=%(hn_id)d">12 days ago</a></span> <span id="unv_%(hn_id)d"></span>          <span class='navs'>
+             | <a href="#%(thread_id)d" class="clicky" aria-hidden="true">next</a> <a class="togg clicky" id="%(hn_id)d" n="1" href="javascript:void(0)">[–]</a><span class="onstory"></span>          </span>
+                  </span></div><br><div class="comment">
+                  <div class="commtext c00">%(text)s</div>
+              <div class='reply'>        <p><font size="1">
+                      <u><a href="reply?id=%(hn_id)d&amp;goto=item%%3Fid%%3D%(thread_id)d%%23%(hn_id)d" rel="nofollow">reply</a></u>
+                  </font>
+      </div></div></td></tr>
+        </table></td></tr>
+'''
+
+FOOTER = '''</table>
+  <br><br>
+</td></tr>
+</table></center></body></html>
+'''
+
+COMPANIES = ['Formal', 'Acme', 'Initech', 'Globex', 'Hooli', 'Stark Industries', 'Umbrella', 'Wayne Enterprises']
+ROLES = ['Founding Software Engineer', 'Backend Engineer', 'Data Scientist', 'SRE', 'Product Designer',
+         'Staff Engineer (Rust, Go)', 'Full-Stack Developer']
+LOCATIONS = ['REMOTE', 'REMOTE (US)', 'ONSITE (NYC)', 'Berlin, Germany | Hybrid', 'San Francisco']
+
+
+def generate_job_text(rng, hn_id):
+    """ Text of a top-level comment, with the markup found in job postings """
+
+    company = rng.choice(COMPANIES)
+    domain = company.lower().replace(' ', '')
+
+    paragraphs = [
+        '%s | %s | %s | Full-Time | &gt;= $%dk' % (
+            company, rng.choice(ROLES), rng.choice(LOCATIONS), rng.randrange(80, 250, 10)),
+        'We&#x27;re rethinking %s from the ground up. <i>No recruiters</i>, please.' % rng.choice(ROLES).lower(),
+        'Apply at <a href="https:&#x2F;&#x2F;%s.com&#x2F;jobs&#x2F;%d" rel="nofollow">https:&#x2F;&#x2F;%s.com&#x2F;jobs&#x2F;%d</a>' % (
+            domain, hn_id, domain, hn_id),
+        'Contact: jobs [at] %s [dot] com' % domain,
+    ]
+    paragraphs += ['Stack: Python, PostgreSQL, Kubernetes. ' * rng.randint(1, 6)] * rng.randint(0, 3)
+
+    return '<p>'.join(paragraphs)
+
+
+def generate_reply_text(rng):
+    """ Text of a reply """
+
+    return rng.choice([
+        'Is this role open to candidates in Europe?',
+        'Thanks for posting the salary range!',
+        'Off topic, but since you are here, thanks for the great project.<p>Keep it up!',
+    ])
+
+
+def generate_thread(top_level, replies=1.0, seed=0):
+    """
+        Generate the HTML of a thread with `top_level` job postings
+        Each posting gets a random number of replies, `replies` on average, at indents 1 to 3
+        Returns the page and its number of comments
+    """
+
+    rng = random.Random(seed)
+    hn_id = THREAD_ID
+
+    rows = []
+    for i in range(top_level):
+        hn_id += 1
+        comments = [(0, generate_job_text(rng, hn_id))]
+
+        # Replies are nested under the previous comment, at most 3 levels deep
+        indent = 0
+        for _ in range(round(rng.expovariate(1 / replies)) if replies else 0):
+            indent = rng.randint(1, min(indent + 1, 3))
+            comments.append((indent, generate_reply_text(rng)))
+
+        for j, (indent, text) in enumerate(comments):
+            if j:
+                hn_id += 1
+            rows.append(ROW % {'hn_id': hn_id, 'indent': indent, 'width': indent * 40, 'thread_id': THREAD_ID,
+                               'hn_user': 'user_%d' % rng.randrange(top_level * 2), 'text': text})
+
+    return (HEADER % {'thread_id': THREAD_ID, 'comments': len(rows)} + ''.join(rows) + FOOTER, len(rows))
+
+
+def measure(func, memory=True):
+    """
+        Run `func` and return its result, duration in seconds and peak memory in bytes
+        Peak memory is measured in a second run under tracemalloc, which slows code down
+    """
+
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return (result, {'seconds': round(seconds, 6), 'peak_bytes': peak})
+
+
+def run_size(top_level, replies, memory, db_path):
+    """ Run every stage on a thread with `top_level` job postings """
+
+    (source, comments) = generate_thread(top_level, replies)
+    stages = {}
+
+    (soup, stages['soup']) = measure(lambda: BeautifulSoup(source, 'html.parser'), memory)
+    (items, stages['get_all_comments']) = measure(lambda: fetch_job_postings.get_all_comments(soup), memory)
+    (top_items, stages['is_reply']) = measure(
+        lambda: [item for item in items if not fetch_job_postings.is_reply(item)], memory)
+    (jobs, stages['parse_from_comment']) = measure(
+        lambda: [fetch_job_postings.parse_from_comment(item) for item in top_items], memory)
+
+    for name in fetch_job_postings.PARSERS:
+        (_, stages['parse_comments[%s]' % name]) = measure(
+            lambda: list(fetch_job_postings.parse_comments(source, name)), memory)
+
+    def save_jobs():
+        # Write to an empty database
+        helper.db_close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        helper.db_init()
+
+        return fetch_job_postings.save_jobs(jobs)
+
+    with patch.object(helper, 'get_db_path', return_value=db_path):
+        (_, stages['save_jobs']) = measure(save_jobs, memory)
+        (_, stages['save_jobs_unchanged']) = measure(lambda: fetch_job_postings.save_jobs(jobs), memory)
+        helper.db_close()
+
+    return {
+        'top_level': top_level,
+        'comments': comments,
+        'html_bytes': len(source.encode()),
+        'stages': stages,
+    }
+
+
+def run(sizes, replies=1.0, memory=True):
+    """ Run the benchmark for each thread size and return the results """
+
+    results = {
+        'python': platform.python_version(),
+        'replies': replies,
+        'sizes': [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for top_level in sizes:
+            results['sizes'].append(run_size(top_level, replies, memory, tmp_dir + '/bench.db'))
+
+    return results
+
+
+def main(sizes, replies, memory, output):
+    results = json.dumps(run(sizes, replies, memory), indent=2)
+
+    if output:
+        with open(output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes', '-s', help='Numbers of top-level comments of the generated threads', type=int, nargs='+',
+        default=[100, 1000, 10000, 50000])
+    parser.add_argument(
+        '--replies', '-r', help='Average number of replies per top-level comment', type=float, default=1.0)
+    parser.add_argument(
+        '--no-memory', help='Skip peak memory measurements (each stage runs once)', action='store_true')
+    parser.add_argument(
+        '--output', '-o', help='Write the JSON results to a file instead of stdout')
+    args = parser.parse_args()
+
+    main(args.sizes, args.replies, not args.no_memory, args.output)
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from unittest.mock import patch
+
+from .. import helper
+from ..app import app
+from ..models import JobModel
+from .load_test import asgi_request, seed
+
+"""
+    Benchmark the construction of Job rows for the jobs listing, per row:
+     - format_job: validated Job built from a dict copy of each row, with Python-level defaults (before)
+     - model_construct: unvalidated Job with timestamps parsed by datetime.fromisoformat (reference)
+     - format_row: row values passed straight to the Job validator (after)
+     - get_page: query and rows of a listing page
+     - users_table: the listing endpoint, driven in-process through its ASGI interface (listing cache cleared)
+
+    CPU time and allocated memory (tracemalloc peak) are reported per row of a page.
+
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.listing --jobs 10000 --repeat 200
+"""
+
+
+def construct_row(row):
+    """ Job built with model_construct(), kept as reference: it runs in Python and is slower than validation """
+
+    def parse(value):
+        return datetime.fromisoformat(value) if value else None
+
+    return JobModel.Job.model_construct(
+        id=row['id'],
+        hn_id=row['hn_id'],
+        hn_user=row['hn_user'],
+        job_text=row['job_markdown'],
+        inserted_at=parse(row['inserted_at']),
+        updated_at=parse(row['updated_at']),
+        applied_at=parse(row['applied_at']),
+        status=row['status'],
+    )
+
+
+def measure(func, rows, repeat):
+    """ Run `func` `repeat` times and return the CPU time in microseconds and peak memory in bytes, per row """
+
+    start = time.process_time()
+    for i in range(repeat):
+        func()
+    seconds = time.process_time() - start
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'cpu_us': round(seconds * 1000000 / repeat / rows, 3), 'peak_bytes': peak // rows}
+
+
+def run(jobs, repeat, seed_value=0):
+    """ Seed a database with `jobs` jobs, run the benchmark and return the results """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with patch.object(helper, 'get_db_path', return_value=tmp_dir + '/hn_jobs.db'):
+            helper.db_init()
+            seed(jobs, random.Random(seed_value))
+
+            conn = helper.db_connect()
+            rows = conn.execute('SELECT %s FROM jobs j ORDER BY j.id LIMIT ?' % JobModel.JOB_COLUMNS,
+                                (JobModel.PAGE_SIZE,)).fetchall()
+            count = len(rows)
+
+            def users_table():
+                JobModel.get_listing_cache().clear()
+                asyncio.run(asgi_request(app, '/api/?clear_cache=1'))
+
+            scenarios = {
+                'format_job': lambda: [JobModel.format_job(dict(row)) for row in rows],
+                'model_construct': lambda: [construct_row(row) for row in rows],
+                'format_row': lambda: [JobModel.format_row(row) for row in rows],
+                'get_page': lambda: JobModel.get_page(),
+                'users_table': users_table,
+            }
+
+            results = {}
+            for name, func in scenarios.items():
+                # The endpoint is much slower, run it less often
+                results[name] = measure(func, count, max(repeat // 10, 1) if name == 'users_table' else repeat)
+
+            helper.db_executor_shutdown()
+            helper.db_close()
+
+    return count, results
+
+
+def main(jobs, repeat):
+    (count, results) = run(jobs, repeat)
+
+    print(f'{count} rows per page')
+    print(f'{"scenario":<18}{"CPU per row (µs)":>18}{"peak per row (B)":>18}')
+    for name, res in results.items():
+        print(f'{name:<18}{res["cpu_us"]:>18.2f}{res["peak_bytes"]:>18}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--jobs', '-j', help='Number of jobs to seed', type=int, default=10000)
+    parser.add_argument(
+        '--repeat', '-r', help='Number of runs of each scenario', type=int, default=200)
+    args = parser.parse_args()
+
+    main(args.jobs, args.repeat)
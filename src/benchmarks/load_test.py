@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import html
+import json
+import random
+import re
+import socket
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import uvicorn
+
+from .. import helper
+from ..app import app
+from ..models import StatusModel
+from .ingest import generate_job_text
+
+"""
+    Load test the FastAPI app against a seeded database.
+
+    A database of `--jobs` synthetic jobs is created in a temporary directory, then `--concurrency` clients
+    send a weighted mix of requests for `--duration` seconds (see SCENARIOS):
+    listings (plain, filtered by status, full-text search, next page), job details, jobs by user
+    and status updates.
+    The app is driven in-process through its ASGI interface (`--mode asgi`), or served by uvicorn
+    on a local port and driven over HTTP (`--mode uvicorn`).
+    Throughput and p50/p95/p99 latencies are reported for each scenario.
+
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.load_test --jobs 10000 --concurrency 10 --duration 10
+"""
+
+SEARCHES = ['python', 'remote', '"full time"', 'eng*', 'rust go', 'berlin hybrid']
+
+
+def seed(count, rng):
+    """ Seed the database with `count` rendered jobs, spread across users and statuses """
+
+    statuses = [status.value for status in StatusModel.get_all()]
+    users = max(count // 3, 1)
+
+    rows = []
+    for i in range(count):
+        job_text = '<div class="commtext c00">%s</div>' % generate_job_text(rng, i + 1)
+        job_markdown = html.unescape(re.sub(r'<[^>]+>', '', job_text.replace('<p>', '\n\n')))
+        status = statuses[0] if rng.random() < 0.7 else rng.choice(statuses)
+        rows.append((i + 1, 'user_%d' % rng.randrange(users), job_text, job_markdown, helper.make_snippet(job_markdown),
+                     helper.RENDER_VERSION, helper.hash_text(job_text), status))
+
+    conn = helper.db_connect()
+    conn.executemany("""
+    INSERT INTO jobs (hn_id, hn_user, job_text, job_markdown, job_snippet, render_version, job_hash, inserted_at, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'), ?)
+    """, rows)
+    helper.bump_data_version(conn)
+    conn.commit()
+    conn.close()
+
+
+# Weighted scenarios: (name, weight, path for a random target)
+SCENARIOS = [
+    ('users_table', 25, lambda rng, jobs: '/api/?clear_cache=1'),
+    ('users_table?status', 15, lambda rng, jobs: '/api/?status=%s' % rng.choice(['new', 'applied', 'discarded'])),
+    ('users_table?search', 15, lambda rng, jobs: '/api/?search=%s' % rng.choice(SEARCHES).replace(' ', '+')),
+    ('users_table?after', 10, lambda rng, jobs: '/api/?clear_cache=1&after=%d' % rng.randint(1, jobs)),
+    ('job_profile', 15, lambda rng, jobs: '/api/job/%d' % rng.randint(1, jobs)),
+    ('user_jobs_profile', 10, lambda rng, jobs: '/api/user/user_%d' % rng.randrange(max(jobs // 3, 1))),
+    ('update_status', 10, lambda rng, jobs: '/api/job/%d/update/%s' % (
+        rng.randint(1, jobs), rng.choice(['new', 'applied', 'discarded']))),
+]
+
+
+async def asgi_request(app, path):
+    """ Send a GET request to an ASGI app in-process, returns the response status """
+
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.disconnect'}, {'type': 'http.request', 'body': b'', 'more_body': False}]
+    response = {}
+
+    async def receive():
+        return messages.pop() if len(messages) > 1 else messages[0]
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await app(scope, receive, send)
+
+    return response['status']
+
+
+class HTTPClient:
+    """ Minimal HTTP/1.1 client over a keep-alive connection, for servers answering with a Content-Length """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, path):
+        """ Send a GET request, returns the response status """
+
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        self.writer.write(('GET %s HTTP/1.1\r\nHost: %s:%d\r\n\r\n' % (path, self.host, self.port)).encode())
+        await self.writer.drain()
+
+        head = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        headers = dict(line.lower().split(': ', 1) for line in head[1:] if line)
+        await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection') == 'close':
+            self.close()
+
+        return int(head[0].split()[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of sorted values """
+
+    if not values:
+        return None
+
+    return values[max(int(round(p / 100 * len(values))) - 1, 0)]
+
+
+def summarize(latencies, errors, duration):
+    """ Throughput and latency percentiles of a scenario, latencies are in seconds """
+
+    latencies = sorted(latencies)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / duration, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+    }
+
+
+async def drive(make_client, jobs, concurrency, duration, seed_value):
+    """
+        Send requests from `concurrency` clients for `duration` seconds
+        `make_client()` returns (request, close): a coroutine function sending a GET request for a path
+        and returning the response status, and a function releasing the client
+        Returns the latencies and error counts by scenario, and the actual duration
+    """
+
+    names = [name for name, _, _ in SCENARIOS]
+    weights = [weight for _, weight, _ in SCENARIOS]
+    paths = {name: path for name, _, path in SCENARIOS}
+
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    async def client(number):
+        rng = random.Random(seed_value + number)
+        (request, close) = make_client()
+        try:
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                path = paths[name](rng, jobs)
+
+                start = time.perf_counter()
+                try:
+                    status = await request(path)
+                except Exception:
+                    status = None
+                latencies[name].append(time.perf_counter() - start)
+
+                if status is None or status >= 400:
+                    errors[name] += 1
+        finally:
+            close()
+
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[client(i) for i in range(concurrency)])
+
+    return latencies, errors, time.perf_counter() - start
+
+
+def get_free_port():
+    """ Get a free local TCP port """
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(app):
+    """ Serve `app` with uvicorn on a local port, in a background thread, returns the server, its thread and port """
+
+    port = get_free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        time.sleep(0.01)
+
+    return server, thread, port
+
+
+def run(jobs, concurrency, duration, mode='asgi', seed_value=0):
+    """ Seed the database, run the load test and return the report """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with patch.object(helper, 'get_db_path', return_value=tmp_dir + '/hn_jobs.db'):
+            helper.db_init()
+            seed(jobs, random.Random(seed_value))
+
+            server = None
+            if mode == 'uvicorn':
+                (server, thread, port) = serve(app)
+
+                def make_client():
+                    http_client = HTTPClient('127.0.0.1', port)
+                    return (http_client.request, http_client.close)
+            else:
+                def make_client():
+                    return (lambda path: asgi_request(app, path), lambda: None)
+
+            try:
+                latencies, errors, elapsed = asyncio.run(drive(make_client, jobs, concurrency, duration, seed_value))
+            finally:
+                if server is not None:
+                    server.should_exit = True
+                    thread.join()
+
+            helper.db_executor_shutdown()
+            helper.db_close()
+
+    report = {
+        'mode': mode,
+        'jobs': jobs,
+        'concurrency': concurrency,
+        'duration': round(elapsed, 3),
+        'scenarios': {name: summarize(latencies[name], errors[name], elapsed) for name in latencies},
+    }
+    report['total'] = summarize([latency for values in latencies.values() for latency in values],
+                                sum(errors.values()), elapsed)
+
+    return report
+
+
+def main(jobs, concurrency, duration, mode, output):
+    report = run(jobs, concurrency, duration, mode)
+
+    print(f'{"scenario":<22}{"requests":>10}{"errors":>8}{"req/s":>10}{"p50 (ms)":>10}{"p95 (ms)":>10}{"p99 (ms)":>10}')
+    for name, res in list(report['scenarios'].items()) + [('total', report['total'])]:
+        if not res['requests']:
+            print(f'{name:<22}{0:>10}')
+            continue
+        print(f'{name:<22}{res["requests"]:>10}{res["errors"]:>8}{res["throughput"]:>10.1f}'
+              f'{res["p50_ms"]:>10.2f}{res["p95_ms"]:>10.2f}{res["p99_ms"]:>10.2f}')
+
+    if output:
+        with open(output, 'w') as f:
+            f.write(json.dumps(report, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--jobs', '-j', help='Number of jobs to seed', type=int, default=10000)
+    parser.add_argument(
+        '--concurrency', '-c', help='Number of concurrent clients', type=int, default=10)
+    parser.add_argument(
+        '--duration', '-d', help='Duration of the test, in seconds', type=float, default=10)
+    parser.add_argument(
+        '--mode', '-m', help='Drive the app in-process (asgi) or over HTTP (uvicorn)',
+        choices=['asgi', 'uvicorn'], default='asgi')
+    parser.add_argument(
+        '--output', '-o', help='Also write the JSON report to a file')
+    args = parser.parse_args()
+
+    main(args.jobs, args.concurrency, args.duration, args.mode, args.output)
@@ -0,0 +1,47 @@
+import argparse
+
+from .. import helper
+from .. import markdown_converter
+from .resolve_email import load_texts, time_texts
+
+"""
+    Benchmark the conversion of comments to Markdown on the comments of the sample thread,
+    with html2text (helper.html2text_to_markdown) and with the converter for the markup of HN comments
+    (markdown_converter.convert, and helper.html_to_markdown which falls back to html2text).
+    Comments are converted as rendered at ingest, with deobfuscated emails appended.
+
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.markdown --repeat 20
+"""
+
+
+def run(repeat):
+    """ Run the benchmark and return the results """
+
+    texts = helper.resolve_emails(load_texts())
+
+    scenarios = {
+        'html2text': lambda texts: [helper.html2text_to_markdown(text) for text in texts],
+        'convert': lambda texts: [markdown_converter.convert(text) for text in texts],
+        'html_to_markdown': lambda texts: [helper.html_to_markdown(text) for text in texts],
+    }
+
+    return len(texts), {name: time_texts(func, texts, repeat) for name, func in scenarios.items()}
+
+
+def main(repeat):
+    (count, results) = run(repeat)
+
+    print(f'{count} comments')
+    print(f'{"scenario":<18}{"per text (µs)":>16}{"speedup":>10}')
+    for name, duration in results.items():
+        print(f'{name:<18}{duration:>16.2f}{results["html2text"] / duration:>9.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--repeat', '-r', help='Number of runs over the comments', type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.repeat)
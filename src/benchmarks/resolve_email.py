@@ -0,0 +1,91 @@
+import argparse
+import os
+import re
+import time
+
+from .. import fetch_job_postings
+from .. import helper
+
+"""
+    Benchmark email deobfuscation (helper.resolve_email) on the comments of the sample thread,
+    before (three uncompiled searches and chained replacements, first address only)
+    and after (single scan with a precompiled alternation, all addresses).
+
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.resolve_email --repeat 20
+"""
+
+THREAD_HTML_PATH = os.path.dirname(__file__) + '/../test/assets/thread.html'
+
+
+def resolve_email_legacy(text):
+    """ resolve_email before the single-pass version, kept as reference """
+
+    patterns = [
+        r'([a-zA-Z0-9_-]+( dot [a-zA-Z0-9_-]+)? at [a-zA-Z0-9_-]+ dot [a-zA-Z0-9_-]+)',
+        r'([a-zA-Z0-9_-]+( ?\[dot\] ?[a-zA-Z0-9_-]+)? ?\[at\] ?[a-zA-Z0-9_-]+ ?\[dot\] ?[a-zA-Z0-9_-]+)',
+        r'([a-zA-Z0-9_.-]+\s?\[at\]\s?[a-zA-Z0-9_.-]+)',
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text)
+
+        if match:
+            obfuscated_email = match.group(0)
+            email = obfuscated_email.replace(" dot ", ".").replace(" at ", "@")
+            email = email.replace(" [dot] ", ".").replace(" [at] ", "@")
+            email = email.replace("[dot]", ".").replace("[at]", "@")
+
+            return text + "\n🪄 *Deobfuscated email:* " + email
+
+    return text
+
+
+def load_texts():
+    """ Comments of the sample thread """
+
+    source = fetch_job_postings.load_file(THREAD_HTML_PATH)
+
+    return [comment for (comment, _, _, _) in fetch_job_postings.parse_comments(source)]
+
+
+def time_texts(func, texts, repeat):
+    """ Run `func` on `texts` `repeat` times and return the mean duration per text in microseconds """
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(texts)
+
+    return (time.perf_counter() - start) * 1000000 / repeat / len(texts)
+
+
+def run(repeat):
+    """ Run the benchmark and return the results """
+
+    texts = load_texts()
+
+    scenarios = {
+        'legacy': lambda texts: [resolve_email_legacy(text) for text in texts],
+        'resolve_email': lambda texts: [helper.resolve_email(text) for text in texts],
+        'resolve_emails': helper.resolve_emails,
+    }
+
+    return len(texts), {name: time_texts(func, texts, repeat) for name, func in scenarios.items()}
+
+
+def main(repeat):
+    (count, results) = run(repeat)
+
+    print(f'{count} comments')
+    print(f'{"scenario":<16}{"per text (µs)":>16}{"speedup":>10}')
+    for name, duration in results.items():
+        print(f'{name:<16}{duration:>16.2f}{results["legacy"] / duration:>9.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--repeat', '-r', help='Number of runs over the comments', type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.repeat)
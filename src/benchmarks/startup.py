@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+"""
+    Benchmark the cold start of the entry points: each one is imported `--repeat` times in a new interpreter
+    with `python -X importtime`, and the median of its cumulative import time is reported, with the number
+    of modules it loads and which of the heavy dependencies (see HEAVY_MODULES) are among them.
+
+    To run this benchmark, execute the following command:
+    python -m src.benchmarks.startup --repeat 10
+"""
+
+ENTRY_POINTS = {
+    'app': 'src.app',
+    'fetch_job_postings': 'src.fetch_job_postings',
+    'auto_discard': 'src.auto_discard',
+    'render_jobs': 'src.render_jobs',
+    'export_jobs': 'src.export_jobs',
+}
+
+# Dependencies tracked for each entry point
+HEAVY_MODULES = ['fastapi', 'fastui', 'uvicorn', 'pydantic', 'html2text', 'cacheout', 'asyncio', 'requests', 'bs4']
+
+# Root of the repository, where the entry points are imported from
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+def parse_importtime(output):
+    """ Parse the output of -X importtime, returns the cumulative time in microseconds of each module """
+
+    res = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        (_, cumulative, name) = line[len('import time:'):].split('|')
+        res[name.strip()] = int(cumulative)
+
+    return res
+
+
+def import_times(module):
+    """ Import a module in a new interpreter, returns the cumulative import times of the modules it loads """
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+
+    return parse_importtime(process.stderr)
+
+
+def run(repeat, entry_points=ENTRY_POINTS):
+    """ Run the benchmark and return the results, by entry point """
+
+    results = {}
+    for name, module in entry_points.items():
+        runs = [import_times(module) for i in range(repeat)]
+        modules = runs[-1]
+
+        results[name] = {
+            'module': module,
+            'import_ms': round(statistics.median(times[module] for times in runs) / 1000, 2),
+            'modules': len(modules),
+            'heavy': [heavy for heavy in HEAVY_MODULES if heavy in modules],
+        }
+
+    return results
+
+
+def main(repeat, output):
+    results = run(repeat)
+
+    if output:
+        with open(output, 'w') as f:
+            f.write(json.dumps(results, indent=2) + '\n')
+
+    print(f'{"entry point":<20}{"import (ms)":>12}{"modules":>9}  heavy dependencies')
+    for name, res in results.items():
+        print(f'{name:<20}{res["import_ms"]:>12.2f}{res["modules"]:>9}  {", ".join(res["heavy"])}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--repeat', '-r', help='Number of imports of each entry point', type=int, default=10)
+    parser.add_argument(
+        '--output', '-o', help='Also write the JSON results to a file, to track them over time')
+    args = parser.parse_args()
+
+    main(args.repeat, args.output)
@@ -0,0 +1,119 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date
+
+from .helper import db_init
+from .models import JobModel
+
+"""
+    This utility exports job postings as NDJSON (one JSON object per line) or CSV, optionally gzipped.
+    Jobs are streamed: rows are fetched, encoded and written batch by batch, in constant memory.
+    The same streams are served by the /api/export endpoint of the application.
+
+    To run this tool, execute the following command:
+    python -m src.export_jobs --format csv --status applied --output applied.csv
+"""
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+GZIP_LEVEL = 6
+
+
+def encode_ndjson(batches):
+    """ Encode batches of rows of JobModel.EXPORT_COLUMNS as NDJSON, one chunk per batch """
+
+    columns = JobModel.EXPORT_COLUMNS
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows).encode()
+
+
+def encode_csv(batches):
+    """ Encode batches of rows of JobModel.EXPORT_COLUMNS as CSV with a header line, one chunk per batch """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(JobModel.EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """
+        Compress a stream of chunks into a gzip stream
+        Each chunk is flushed, so that the compressed data of a batch is sent without waiting for the next ones
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield compressor.flush()
+
+
+def export(fmt='ndjson', compress=False, **filters):
+    """
+        Stream the jobs matching the filters (see JobModel.export) as chunks of bytes in the format `fmt`
+        Nothing is read from the database until the stream is consumed
+    """
+
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format: %s' % fmt)
+
+    encode = encode_csv if fmt == 'csv' else encode_ndjson
+    chunks = encode(JobModel.export(**filters))
+
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def main(fmt, compress, output, **filters):
+    res = db_init()
+    print(f'$ {res}', file=sys.stderr)
+
+    chunks = export(fmt, compress, **filters)
+
+    size = 0
+    with open(output, 'wb') if output else contextlib.nullcontext(sys.stdout.buffer) as f:
+        for chunk in chunks:
+            f.write(chunk)
+            size += len(chunk)
+
+    print(f'$ {size} bytes exported', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--format', '-f', help='Export format', choices=list(FORMATS), default='ndjson')
+    parser.add_argument(
+        '--gzip', '-z', help='Compress the export with gzip', action='store_true')
+    parser.add_argument(
+        '--output', '-o', help='Output file, defaults to the standard output')
+    parser.add_argument(
+        '--status', '-s', help='Only export jobs with this status', choices=sorted(JobModel.STATUS_VALUES))
+    parser.add_argument(
+        '--user', '-u', help='Only export jobs posted by this HN user')
+    parser.add_argument(
+        '--since', help='Only export jobs inserted on or after this day (YYYY-MM-DD)', type=date.fromisoformat)
+    parser.add_argument(
+        '--until', help='Only export jobs inserted on or before this day (YYYY-MM-DD)', type=date.fromisoformat)
+    args = parser.parse_args()
+
+    main(args.format, args.gzip, args.output, status=args.status, hn_user=args.user, since=args.since,
+         until=args.until)
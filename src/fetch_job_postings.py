@@ -1,20 +1,269 @@
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import argparse
+import json
+
+from . import metrics
+from . import parsers
+from .profiling import profiled
+from .helper import db_connect, db_init, backup_db_file, is_hacker_news_url, render_job_text, hash_text, make_snippet, RENDER_VERSION, \
+    bump_data_version
+
+# Number of ids per existing jobs lookup
+BATCH_SIZE = 500
+
+# Number of pages of a thread fetched concurrently
+WORKERS = 4
+
+# Minimum delay between two requests, in seconds (politeness)
+REQUEST_DELAY = 0.5
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+
+# Page of a thread, `source` is None when the server answered 304 Not Modified
+# `modified` is False when the page did not change since the last run
+Page = namedtuple('Page', ['url', 'source', 'etag', 'last_modified', 'page_hash', 'has_more', 'modified'])
+
+
+class RateLimiter:
+    """ Space out calls, across threads, by at least `delay` seconds """
 
-from .helper import db_connect, db_init, backup_db_file, is_hacker_news_url
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_call = 0
 
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.delay
 
-def load_url(url):
+        if wait > 0:
+            time.sleep(wait)
+
+
+def get_session(workers=WORKERS):
+    """ Get an HTTP session with keep-alive connections and retries with backoff """
+
+    retries = Retry(total=3, backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(max_retries=retries, pool_maxsize=workers)
+
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def load_url(url, session=None, rate_limiter=None):
     """ Load the content of a URL """
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-    response = requests.get(url, headers=headers)
+    if rate_limiter:
+        rate_limiter.wait()
+
+    response = (session or requests).get(url, headers=HEADERS)
     response.raise_for_status()  # Check if the request was successful
     return response.text
 
 
+def fetch_page(url, session=None, rate_limiter=None, state=None):
+    """
+    Fetch a page of a thread
+    With the `state` of the page from a previous run, the request is conditional (ETag/Last-Modified)
+    and the content hash tells if a page downloaded again has changed
+    """
+
+    headers = dict(HEADERS)
+    if state:
+        if state['etag']:
+            headers['If-None-Match'] = state['etag']
+        if state['last_modified']:
+            headers['If-Modified-Since'] = state['last_modified']
+
+    if rate_limiter:
+        rate_limiter.wait()
+
+    response = (session or requests).get(url, headers=headers)
+    if state and response.status_code == 304:
+        return Page(url, None, state['etag'], state['last_modified'], state['page_hash'],
+                    bool(state['has_more']), False)
+
+    response.raise_for_status()  # Check if the request was successful
+    source = response.text
+    page_hash = hash_text(source)
+
+    return Page(url, source, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                page_hash, has_more_pages(source), state is None or state['page_hash'] != page_hash)
+
+
+def get_page_url(url, page):
+    """ Get the URL of a page of a thread """
+
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    query['p'] = [str(page)]
+
+    return urlunsplit(parts._replace(query=urlencode(query, doseq=True)))
+
+
+def get_page_number(url):
+    """ Get the page number of a thread URL """
+
+    return int(parse_qs(urlsplit(url).query).get('p', ['1'])[0])
+
+
+def get_thread_id(url):
+    """ Get the HN id of a thread from its URL, None if the URL has no id """
+
+    thread_id = parse_qs(urlsplit(url).query).get('id')
+    if thread_id and thread_id[0].isdigit():
+        return int(thread_id[0])
+
+    return None
+
+
+def has_more_pages(source):
+    """ Check if a page of a thread links to a next page ("More" link) """
+
+    return re.search(r'class=["\']morelink["\']', source) is not None
+
+
+def count_pages(source):
+    """
+    Estimate the number of pages of a thread from one of its pages: number of comments of the thread
+    (subline of the story) divided by the number of comments of the page, None if either is missing
+    Rounded down: the count includes comments that are not shown (dead, flagged), the estimate must not
+    exceed the actual number of pages, a last page left out is found by its "More" link
+    """
+
+    match = re.search(r'(\d+)&nbsp;comments?', source)
+    rows = len(re.findall(r'class=["\']athing comtr["\']', source))
+    if match is None or not rows:
+        return None
+
+    return max(int(match.group(1)) // rows, 1)
+
+
+def fetch_pages(url, workers=WORKERS, delay=REQUEST_DELAY, states=None):
+    """
+    Fetch all the pages of a thread, starting at `url`
+    Pages are fetched concurrently over a shared session, at most one request every `delay` seconds.
+    The pages estimated from the comment count of the thread (see count_pages) are fetched concurrently,
+    the next ones one at a time, as long as the last page links to the next one ("More" link).
+    Pages past a page without "More" link are never requested.
+    `states` are the states of the pages from a previous run, by page number: when the first page
+    was not modified, no comment was added to the thread and the other pages are not fetched.
+    """
+
+    states = states or {}
+    session = get_session(workers)
+    rate_limiter = RateLimiter(delay)
+    page = get_page_number(url)
+
+    pages = [fetch_page(url, session, rate_limiter, states.get(page))]
+    if not pages[0].modified:
+        session.close()
+        return pages
+
+    # Number of the last page, once a page without "More" link is fetched
+    last_page = None
+
+    def is_past_last_page(number):
+        return last_page is not None and number > last_page
+
+    def load_page(number):
+        nonlocal last_page
+
+        # Checked again after the wait, the last page may have been fetched meanwhile
+        if is_past_last_page(number):
+            return None
+        rate_limiter.wait()
+        if is_past_last_page(number):
+            return None
+
+        res = fetch_page(get_page_url(url, number), session, None, states.get(number))
+        if not res.has_more:
+            last_page = number if last_page is None else min(last_page, number)
+
+        return res
+
+    estimate = count_pages(pages[0].source) or 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pages[-1].has_more:
+            futures = [executor.submit(load_page, number)
+                       for number in range(page + 1, max(estimate, page + 1) + 1)]
+
+            # Keep pages up to the last one, pages past it (the estimate may be too high) may be skipped or fail
+            for future in futures:
+                if pages[-1].has_more:
+                    pages.append(future.result())
+
+            page += len(futures)
+
+    session.close()
+
+    return pages
+
+
+def load_pages(url, workers=WORKERS, delay=REQUEST_DELAY):
+    """
+    Load the content of all the pages of a thread, starting at `url`
+    Pages are fetched concurrently over a shared session, at most one request every `delay` seconds
+    """
+
+    return [page.source for page in fetch_pages(url, workers=workers, delay=delay)]
+
+
+def get_page_states(thread_id):
+    """ Get the states of the pages of a thread saved by the last run, by page number """
+
+    conn = db_connect()
+    rows = conn.execute('SELECT * FROM thread_pages WHERE thread_id = ?', (thread_id,)).fetchall()
+    conn.close()
+
+    return {row['page']: row for row in rows}
+
+
+def save_page_states(thread_id, pages):
+    """ Save the validators and content hashes of the pages downloaded, only changed states are written """
+
+    rows = [(thread_id, get_page_number(page.url), page.url, page.etag, page.last_modified, page.page_hash,
+             page.has_more) for page in pages if page.source is not None]
+
+    conn = db_connect()
+    conn.executemany("""
+    INSERT INTO thread_pages (thread_id, page, url, etag, last_modified, page_hash, has_more, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+    ON CONFLICT (thread_id, page) DO UPDATE SET
+        url = excluded.url,
+        etag = excluded.etag,
+        last_modified = excluded.last_modified,
+        page_hash = excluded.page_hash,
+        has_more = excluded.has_more,
+        updated_at = excluded.updated_at
+    WHERE etag IS NOT excluded.etag
+        OR last_modified IS NOT excluded.last_modified
+        OR page_hash IS NOT excluded.page_hash
+        OR has_more IS NOT excluded.has_more
+    """, rows)
+
+    conn.commit()
+    conn.close()
+
+
 def load_file(file):
     """ Load the content of a file (for tests) """
 
@@ -71,11 +320,127 @@ def parse_from_comment(item):
     return (comment, hn_user, hn_id)
 
 
-def main(url):
+def get_indent(item):
+    """ Get the indent level of the comment (0 for top-level comments) """
+
+    res = item.find(lambda tag: tag.name == 'td' and tag.get('indent'))
+
+    if res:
+        return int(res['indent'])
+
+    return 0
+
+
+def parse_soup(source):
+    """
+    Extract the comments of a page with BeautifulSoup and html.parser
+    Yields (comment, hn_user, hn_id, indent) tuples
+    """
+
+    # Only needed by this backend
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(source, 'html.parser')
+
+    for item in get_all_comments(soup):
+        (comment, hn_user, hn_id) = parse_from_comment(item)
+        yield (comment, hn_user, hn_id, get_indent(item))
+
+
+# Parser backends, all producing the same comments
+PARSERS = {
+    'html.parser': parse_soup,
+    'lxml': parsers.parse_lxml,
+    'stream': parsers.parse_stream,
+}
+
+
+def parse_comments(source, parser='stream'):
+    """
+    Extract the comments of a page with the given parser backend
+    Yields (comment, hn_user, hn_id, indent) tuples
+    """
+
+    return PARSERS[parser](source)
+
+
+def save_jobs(jobs):
+    """
+    Insert new jobs and update the text of changed ones, in a single transaction.
+    `jobs` is a list of (comment, hn_user, hn_id) tuples, as returned by parse_from_comment.
+    Returns the counts of (new, existing, changed) jobs.
+    """
+
+    # Latest version of each job, keyed by HN id
+    # Comments without an id can't be matched on later runs and are skipped
+    batch = {int(hn_id): (comment, hn_user, hash_text(comment))
+             for (comment, hn_user, hn_id) in jobs if hn_id}
+
+    conn = db_connect()
+    cursor = conn.cursor()
+
+    # Get the content hashes of the jobs already stored
+    existing = {}
+    hn_ids = list(batch)
+    for i in range(0, len(hn_ids), BATCH_SIZE):
+        chunk = hn_ids[i:i + BATCH_SIZE]
+        cursor.execute('SELECT hn_id, job_hash FROM jobs WHERE hn_id IN (%s)' %
+                       ', '.join('?' * len(chunk)), chunk)
+        existing.update((row['hn_id'], row['job_hash']) for row in cursor)
+
+    # Only new and changed jobs are rendered and written
+    rows = []
+    for hn_id, (comment, hn_user, job_hash) in batch.items():
+        if existing.get(hn_id, '') != job_hash:
+            markdown = render_job_text(comment)
+            rows.append((hn_id, hn_user, comment, job_hash, markdown, make_snippet(markdown), RENDER_VERSION))
+
+    cursor.executemany("""
+    INSERT INTO jobs (hn_id, hn_user, job_text, job_hash, job_markdown, job_snippet, render_version, inserted_at, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'), 'new')
+    ON CONFLICT (hn_id) DO UPDATE SET
+        job_text = excluded.job_text,
+        job_hash = excluded.job_hash,
+        job_markdown = excluded.job_markdown,
+        job_snippet = excluded.job_snippet,
+        render_version = excluded.render_version
+    WHERE job_hash IS NOT excluded.job_hash
+    """, rows)
+
+    if rows:
+        bump_data_version(conn)
+
+    conn.commit()
+    conn.close()
+
+    new_count = len(batch) - len(existing)
+    changed_count = len(rows) - new_count
+
+    return (new_count, len(existing), changed_count)
+
+
+def main(url, workers=WORKERS, delay=REQUEST_DELAY, parser='stream', full=False, metrics_output=None):
     """
     Fetch job postings from a Hacker News page and store them in a SQLite database.
+    Only the pages modified since the last run are parsed, unless `full` is set.
+    With `metrics_output`, the timings of the stages and the counts of the run are written there as JSON.
     """
 
+    if metrics_output:
+        metrics.enable()
+
+    try:
+        run(url, workers=workers, delay=delay, parser=parser, full=full)
+    finally:
+        if metrics_output:
+            with open(metrics_output, 'w') as f:
+                json.dump(metrics.summary(), f, indent=2)
+            print(f'$ Metrics written to {metrics_output}')
+
+
+def run(url, workers=WORKERS, delay=REQUEST_DELAY, parser='stream', full=False):
+    """ Fetch, parse and store the job postings of a thread, see main() """
+
     # Check if the URL is a valid Hacker News URL
     if not is_hacker_news_url(url):
         print('Invalid Hacker News URL')
@@ -89,50 +454,43 @@ def main(url):
     res = db_init()
     print(f'$ {res}')
 
-    # Setup the database connection
-    conn = db_connect()
-    cursor = conn.cursor()
+    # State of the pages saved by the last run
+    thread_id = get_thread_id(url)
+    states = {}
+    if thread_id is not None and not full:
+        states = get_page_states(thread_id)
+
+    # Fetch source code of all the pages of the thread
+    with metrics.timed('fetch'):
+        pages = fetch_pages(url, workers=workers, delay=delay, states=states)
+    modified = [page for page in pages if page.modified]
+    metrics.increment('ingest_pages_total', len(pages) - len(modified), state='not_modified')
+    metrics.increment('ingest_pages_total', len(modified), state='modified')
+    print(f'$ {len(pages)} pages fetched ({len(modified)} modified)')
+
+    if not modified:
+        print('$ Thread not modified since the last run')
+        return
 
-    # Fetch source code of the page
-    source = load_url(url)
-    # source = load_file('data/hn.html')
-
-    # Parse the page content using BeautifulSoup
-    soup = BeautifulSoup(source, 'html.parser')
+    jobs = []
+    with metrics.timed('parse'):
+        for page in modified:
+            # Collect job postings, skipping replies
+            jobs += [(comment, hn_user, hn_id)
+                     for (comment, hn_user, hn_id, indent) in parse_comments(page.source, parser) if indent == 0]
 
     # Insert job postings into the database with the current timestamp
-    new_count = exist_count = 0
-    for item in get_all_comments(soup):
-        # Skip replies
-        if is_reply(item):
-            continue
-
-        (comment, hn_user, hn_id) = parse_from_comment(item)
-
-        # Check if the job already exists in the database
-        cursor.execute(
-            'SELECT id FROM jobs WHERE hn_id = ?', (hn_id,))
-        job_exists = cursor.fetchone()
-
-        if job_exists:
-            exist_count += 1
+    with metrics.timed('write'):
+        (new_count, exist_count, changed_count) = save_jobs(jobs)
 
-            # We will update the job text if it has changed
-            cursor.execute(
-                'UPDATE jobs SET job_text = ? WHERE hn_id = ?', (comment, hn_id))
-        else:
-            new_count += 1
+        if thread_id is not None:
+            save_page_states(thread_id, pages)
 
-            cursor.execute("""
-            INSERT INTO jobs (hn_id, hn_user, job_text, inserted_at, status)
-                           VALUES (?, ?, ?, datetime('now'), 'new')
-            """, (hn_id, hn_user, comment))
+    metrics.increment('ingest_jobs_total', new_count, result='new')
+    metrics.increment('ingest_jobs_total', exist_count - changed_count, result='unchanged')
+    metrics.increment('ingest_jobs_total', changed_count, result='changed')
 
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
-
-    print(f'$ {exist_count} existing jobs')
+    print(f'$ {exist_count} existing jobs ({changed_count} changed)')
     print(f'$ {new_count} new jobs added')
 
 
@@ -141,6 +499,18 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument(
         '--url', '-u', help='URL of the Hacker News page with job postings', required=True)
+    parser.add_argument(
+        '--workers', '-w', help='Number of pages fetched concurrently', type=int, default=WORKERS)
+    parser.add_argument(
+        '--delay', '-d', help='Minimum delay between two requests, in seconds', type=float, default=REQUEST_DELAY)
+    parser.add_argument(
+        '--parser', '-p', help='HTML parser backend', choices=PARSERS, default='stream')
+    parser.add_argument(
+        '--full', '-f', help='Parse every page, even if not modified since the last run', action='store_true')
+    parser.add_argument(
+        '--metrics-output', '-m', help='Write the timings of the stages and the counts of the run to a JSON file')
     args = parser.parse_args()
 
-    main(args.url)
+    with profiled('fetch_job_postings'):
+        main(args.url, workers=args.workers, delay=args.delay, parser=args.parser, full=args.full,
+             metrics_output=args.metrics_output)
@@ -1,12 +1,60 @@
+import functools
+import hashlib
 import os
 import re
+import threading
 from datetime import datetime
+from urllib.parse import parse_qs, urlencode
 
 import sqlite3
-import html2text
-from cacheout import Cache
 
-cache = Cache(maxsize=1000)
+from . import metrics
+from .migrations import MIGRATIONS
+
+# Listing filters kept per client (see encode_filters), and the maximum length of their values
+FILTER_NAMES = ('status', 'search')
+FILTER_MAX_LENGTH = 200
+
+# Maximum length of the snippets of jobs shown in listings (see make_snippet)
+SNIPPET_LENGTH = 200
+
+# Version of the job text rendering logic (resolve_email + html_to_markdown)
+# Bump it whenever the rendering changes, then run `python -m src.render_jobs` to refresh stored rows
+RENDER_VERSION = 2
+
+# Per-thread pool of SQLite connections, keyed by database path
+_local = threading.local()
+
+# Number of threads running the database work of the async endpoints (see db_run)
+# SQLite serializes writes, more threads mostly add contention
+DB_WORKERS = 4
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+# Pragmas applied to every new connection
+DB_PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -16000',  # 16 MB
+    'PRAGMA mmap_size = 268435456',  # 256 MB
+    'PRAGMA temp_store = MEMORY',
+]
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+        SQLite connection that stays open for reuse by the thread that opened it.
+        Calling close() releases it back to the pool (pending changes are rolled back, like a real close).
+    """
+
+    def close(self):
+        self.rollback()
+
+    def force_close(self):
+        """ Actually close the underlying connection """
+        sqlite3.Connection.close(self)
 
 
 def get_db_path():
@@ -32,6 +80,14 @@ def backup_db_file():
     db_exists = os.path.exists(db_path)
 
     if db_exists:
+        # Flush the write-ahead log so the copy is self-contained
+        try:
+            conn = sqlite3.connect(db_path)
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.close()
+        except sqlite3.DatabaseError:
+            pass
+
         # Copy the database file
         os.system(f'cp {db_path} {backup_path}')
 
@@ -43,46 +99,206 @@ def backup_db_file():
 def db_connect():
     """
         Connect to the SQLite database
+        Connections are pooled per thread and reused across calls, so the connection setup,
+        schema parsing and prepared statements are only paid for once per thread.
     """
 
-    conn = sqlite3.connect(get_db_path())
+    db_path = get_db_path()
+    pool = _get_pool()
+
+    conn, inode = pool.get(db_path, (None, None))
+    if conn is not None:
+        if inode == _get_inode(db_path):
+            return conn
+
+        # The file was removed or replaced since the connection was opened
+        conn.force_close()
+        del pool[db_path]
+
+    conn = sqlite3.connect(db_path, timeout=5, cached_statements=256,
+                           factory=PooledConnection)
     conn.row_factory = sqlite3.Row
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+
+    pool[db_path] = (conn, _get_inode(db_path))
 
     return conn
 
 
+def db_connect_stream():
+    """
+        Open a connection outside of the pool, for a long read consumed from several threads in turn
+        (like the generator of a streaming response, resumed by any worker thread). Close it when done.
+    """
+
+    conn = sqlite3.connect(get_db_path(), timeout=5, check_same_thread=False)
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+
+    return conn
+
+
+def db_close():
+    """
+        Close all pooled connections of the current thread
+    """
+
+    pool = _get_pool()
+    for conn, _ in pool.values():
+        conn.force_close()
+    pool.clear()
+
+
+def _get_pool():
+    """ Get the connection pool of the current thread """
+
+    if not hasattr(_local, 'pool'):
+        _local.pool = {}
+
+    return _local.pool
+
+
+def _get_inode(path):
+    """ Get the inode of a file, or None if it does not exist """
+
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def get_db_executor():
+    """
+        Get the executor running blocking database work, created on first use
+        Its threads keep their pooled connections, like any other thread
+    """
+
+    # Only needed by the application, not imported by the tools
+    from concurrent.futures import ThreadPoolExecutor
+
+    global _db_executor
+
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+
+    return _db_executor
+
+
+async def db_run(func, *args, **kwargs):
+    """
+        Run a blocking database call in the database executor and await its result
+        The event loop keeps serving other requests meanwhile, and at most DB_WORKERS calls run at once
+    """
+
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+def db_executor_shutdown():
+    """
+        Wait for the pending database calls and stop the executor threads, closing their connections
+    """
+
+    global _db_executor
+
+    with _db_executor_lock:
+        executor, _db_executor = _db_executor, None
+
+    if executor is not None:
+        # The connection pools of the threads are released when they exit
+        executor.shutdown(wait=True)
+
+
 def db_init():
     """
-        Initialize the SQLite database
+        Initialize the SQLite database and apply pending migrations
     """
 
     # Check if the database exists
     db_exists = os.path.exists(get_db_path())
 
+    # Create the database (if it doesn't exist) and bring its schema up to date
+    db_migrate()
+
     if db_exists:
         return "Database already exists"
 
-    # Connect to the SQLite database (or create it if it doesn't exist)
+    return "Database created"
+
+
+def db_migrate():
+    """
+        Apply the pending migrations, tracked with PRAGMA user_version
+        Returns the number of applied migrations
+    """
+
     conn = db_connect()
-    cursor = conn.cursor()
-
-    # Create a table to store jobs if it doesn't exist
-    if not db_exists:
-        cursor.execute('''
-        CREATE TABLE jobs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            hn_id INTEGER,
-            hn_user TEXT,
-            job_text TEXT NOT NULL,
-            inserted_at TIMESTAMP NOT NULL,
-            updated_at TIMESTAMP,
-            applied_at TIMESTAMP,
-            status TEXT
-        )
-        ''')
-        conn.commit()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    applied = 0
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Apply each migration and its version bump atomically
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it while we were waiting for the lock
+            if conn.execute('PRAGMA user_version').fetchone()[0] < number:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
+                applied += 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return applied
+
+
+@metrics.timed_function('db')
+def get_data_version():
+    """
+        Get the data version of jobs, which changes whenever jobs are written
+    """
 
-    return "Database created"
+    conn = db_connect()
+    version = conn.execute('SELECT version FROM data_version').fetchone()[0]
+    conn.close()
+
+    return version
+
+
+def bump_data_version(conn):
+    """
+        Bump the data version of jobs, in the transaction writing them (committed by the caller)
+    """
+
+    conn.execute('UPDATE data_version SET version = version + 1')
+
+
+def to_search_query(search):
+    """
+        Convert a search box input to an FTS5 query
+        Terms are all required, "quoted text" is matched as a phrase and a trailing * matches a prefix
+        Example: `python "remote ok" eng*` -> `"python" "remote ok" "eng"*`
+    """
+
+    terms = []
+    for phrase, term in re.findall(r'"([^"]*)"|(\S+)', search or ''):
+        text = phrase or term.strip('"')
+        prefix = not phrase and text.endswith('*')
+        text = text.rstrip('*')
+
+        if not text.strip():
+            continue
+
+        # Quote every term so that FTS5 operators and punctuation are matched literally
+        terms.append('"%s"%s' % (text.replace('"', '""'), '*' if prefix else ''))
+
+    return ' '.join(terms) or None
 
 
 def is_hacker_news_url(url):
@@ -90,56 +306,131 @@ def is_hacker_news_url(url):
 
 
 def html_to_markdown(html):
-    """ Convert HTML to Markdown"""
+    """
+        Convert HTML to Markdown
+        The markup of HN comments is converted with the fast converter, anything else with html2text
+    """
+
+    # Imported on first use, with html2text: tools that don't render jobs never load them
+    from . import markdown_converter
+
+    markdown = markdown_converter.convert(html)
+    if markdown is not None:
+        return markdown
 
-    markdown_converter = html2text.HTML2Text()
-    markdown_converter.ignore_links = False  # Keep the links in the markdown
-    markdown_converter.body_width = 0
-    markdown_content = markdown_converter.handle(html)
+    return html2text_to_markdown(html)
+
+
+def html2text_to_markdown(html):
+    """ Convert HTML to Markdown with html2text """
+
+    import html2text
+
+    converter = html2text.HTML2Text()
+    converter.ignore_links = False  # Keep the links in the markdown
+    converter.body_width = 0
+    markdown_content = converter.handle(html)
 
     return markdown_content
 
 
-def get_from_cache(key):
-    """ Get filters from cache """
-    return cache.get(key)
+def render_job_text(html):
+    """ Render the HTML of a job posting to the Markdown displayed in the app """
+
+    # Resolve emails
+    with metrics.timed('resolve_email'):
+        text = resolve_email(html)
+
+    # Convert HTML to Markdown
+    with metrics.timed('html_to_markdown'):
+        return html_to_markdown(text)
+
+
+def make_snippet(markdown):
+    """
+        Short extract of the Markdown of a job for listings: its first non-empty line (usually the
+        company | role | location header), cut at a word boundary to at most SNIPPET_LENGTH characters
+    """
+
+    line = next((line.strip() for line in markdown.splitlines() if line.strip()), '')
+    if len(line) <= SNIPPET_LENGTH:
+        return line
+
+    cut = line.rfind(' ', 0, SNIPPET_LENGTH)
+    if cut <= 0:
+        cut = SNIPPET_LENGTH - 1
+
+    return line[:cut].rstrip() + '…'
+
+
+def hash_text(text):
+    """ Get the content hash of a text, to detect changes """
 
+    return hashlib.sha1(text.encode()).hexdigest()
 
-def set_to_cache(key, value):
-    """ Set filters in cache """
-    cache.set(key, value)
+
+def encode_filters(filters):
+    """
+        Encode listing filters into a cookie value
+        Empty filters are left out and values are truncated, so that the state of a client stays small
+    """
+
+    return urlencode({name: filters[name][:FILTER_MAX_LENGTH] for name in FILTER_NAMES if filters.get(name)})
+
+
+def decode_filters(value):
+    """ Decode listing filters from a cookie value, anything else is ignored """
+
+    filters = parse_qs(value or '')
+
+    return {name: filters[name][0][:FILTER_MAX_LENGTH] for name in FILTER_NAMES if name in filters}
+
+
+# Obfuscated email addresses, by order of preference at a given position:
+#  - "name dot domain at domain dot com"
+#  - similar but [at] instead of " at " and [dot] instead of " dot "
+#  - same but just [at] is used
+# Names may contain dots ("first.last [at] domain [dot] com"), matches start at the beginning of a word
+EMAIL_PATTERN = re.compile(
+    r'(?<![a-zA-Z0-9_.-])(?:'
+    r'[a-zA-Z0-9_.-]+(?: dot [a-zA-Z0-9_-]+)? at [a-zA-Z0-9_-]+ dot [a-zA-Z0-9_-]+'
+    r'|[a-zA-Z0-9_.-]+(?: ?\[dot\] ?[a-zA-Z0-9_-]+)? ?\[at\] ?[a-zA-Z0-9_-]+ ?\[dot\] ?[a-zA-Z0-9_-]+'
+    r'|[a-zA-Z0-9_.-]+\s?\[at\]\s?[a-zA-Z0-9_.-]+'
+    r')'
+)
+
+# Separators of obfuscated addresses, spaces are removed only when on both sides
+EMAIL_SEPARATORS = re.compile(r' (dot|at) | \[(dot|at)\] |\[(dot|at)\]')
+EMAIL_SYMBOLS = {'dot': '.', 'at': '@'}
+
+
+def deobfuscate_email(obfuscated_email):
+    """ Replace the separators of an obfuscated email address with "." and "@" """
+
+    return EMAIL_SEPARATORS.sub(lambda match: EMAIL_SYMBOLS[match.group(match.lastindex)], obfuscated_email)
 
 
 def resolve_email(text):
     """
-        Deobfuscate an obfuscated email address
+        Deobfuscate the obfuscated email addresses of a text
+        Every address found is appended on its own line
     """
 
-    # Regular expression to match the pattern for obfuscated email addresses like "name dot domain at domain"
-    patterns = [
-        r'([a-zA-Z0-9_-]+( dot [a-zA-Z0-9_-]+)? at [a-zA-Z0-9_-]+ dot [a-zA-Z0-9_-]+)',
-        # similar but [at] instead of " at " and [dot] instead of " dot "
-        r'([a-zA-Z0-9_-]+( ?\[dot\] ?[a-zA-Z0-9_-]+)? ?\[at\] ?[a-zA-Z0-9_-]+ ?\[dot\] ?[a-zA-Z0-9_-]+)',
-        # Same but just [at] is used
-        r'([a-zA-Z0-9_.-]+\s?\[at\]\s?[a-zA-Z0-9_.-]+)',
-    ]
+    # Skip the scan when no address can match
+    if '[at]' not in text and (' at ' not in text or ' dot ' not in text):
+        return text
+
+    # Addresses in order of appearance, without duplicates
+    emails = dict.fromkeys(deobfuscate_email(match.group(0)) for match in EMAIL_PATTERN.finditer(text))
 
-    for pattern in patterns:
-        # Find the line containing the email using regex
-        match = re.search(pattern, text)
+    # Add line break and append emails
+    return text + ''.join('\n🪄 *Deobfuscated email:* ' + email for email in emails)
 
-        if match:
-            # Extract the matched text
-            obfuscated_email = match.group(0)
-            # Replace " dot " with "." and " at " with "@"
-            email = obfuscated_email.replace(" dot ", ".").replace(" at ", "@")
-            email = email.replace(" [dot] ", ".").replace(" [at] ", "@")
-            email = email.replace("[dot]", ".").replace("[at]", "@")
 
-            # Add lime break and append email
-            return text + "\n🪄 *Deobfuscated email:* " + email
+def resolve_emails(texts):
+    """ Deobfuscate the obfuscated email addresses of a list of texts """
 
-    return text
+    return [resolve_email(text) for text in texts]
 
 
 def format_dt(date):
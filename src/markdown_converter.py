@@ -0,0 +1,388 @@
+"""
+    Fast HTML to Markdown converter for the markup of Hacker News comments.
+
+    Comments only use a handful of tags (<div>, <p>, <a>, <i>, <pre><code>) and entities.
+    For that subset, convert() produces the same Markdown as html2text configured with
+    body_width=0 and ignore_links=False (see helper.html_to_markdown): it follows the same
+    state machine, but only the branches reachable with these tags, and tokenizes the HTML with
+    str.split() instead of the html.parser state machine.
+    Any other markup (other tags, comments, unterminated entities, stray "<") is not supported
+    and convert() returns None, so that the caller falls back to html2text.
+"""
+
+import functools
+import html
+import html.entities
+import re
+import string
+
+from html2text.config import UNIFIABLE
+from html2text.utils import escape_md, escape_md_section, unifiable_n
+
+# Tags of the supported subset
+TAGS = {'div', 'p', 'a', 'i', 'em', 'u', 'pre', 'code'}
+
+# Tags without attributes, by their content between "<" and ">"
+PLAIN_TAGS = {name: (name.lstrip('/'), not name.startswith('/'))
+              for tag in TAGS for name in [tag, '/' + tag] if tag != 'a' and tag != 'div'}
+PLAIN_TAGS.update({'/a': ('a', False), '/div': ('div', False)})
+
+# Content of any other tag between "<" and ">"
+TAG_PATTERN = re.compile(r'(?P<end>/)?(?P<tag>[a-zA-Z][^\t\n\r\f />\x00]*)(?P<attrs>[^<>]*)')
+
+# Name of a character or entity reference between "&" and ";"
+REFERENCE_PATTERN = re.compile(r'#(?P<charref>[0-9]+|[xX][0-9a-fA-F]+)|(?P<entityref>[a-zA-Z][a-zA-Z0-9]*)')
+
+# Attributes of a start tag, quoted values only
+ATTRIBUTE_PATTERN = re.compile(
+    r'\s+(?P<name>[a-zA-Z_:][-a-zA-Z0-9_:.]*)(?:\s*=\s*(?:"(?P<dq>[^"]*)"|\'(?P<sq>[^\']*)\'))?')
+ATTRIBUTES_END_PATTERN = re.compile(r'\s*')
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Characters escaped in link URLs and titles (see html2text.utils.escape_md)
+LINK_ESCAPED_CHARS = set('\\[]()')
+ABSOLUTE_URL_PATTERN = re.compile(r'^[a-zA-Z+]+://')
+STRESSED_FOLLOWER_PATTERN = re.compile(r'[^][(){}\s.!?]')
+
+# Kept as is until the end, like html2text does, so that it is not collapsed with other whitespace
+NBSP_PLACEHOLDER = '&nbsp_place_holder;'
+
+EMPHASIS_MARK = '_'
+
+
+class UnsupportedMarkup(Exception):
+    """ The HTML uses markup outside of the supported subset """
+
+
+def parse_attributes(attrs):
+    """ Parse the attributes of a start tag, the way html.parser does (names lowercased, values unescaped) """
+
+    res = {}
+    position = 0
+    for match in ATTRIBUTE_PATTERN.finditer(attrs):
+        if match.start() != position:
+            raise UnsupportedMarkup(attrs)
+        position = match.end()
+
+        value = match.group('dq')
+        if value is None:
+            value = match.group('sq')
+        res[match.group('name').lower()] = html.unescape(value) if value else value
+
+    if ATTRIBUTES_END_PATTERN.fullmatch(attrs, position) is None:
+        raise UnsupportedMarkup(attrs)
+
+    return res
+
+
+def charref(name):
+    """ Text of a character reference, like html2text """
+
+    code = int(name[1:], 16) if name[0] in 'xX' else int(name)
+    if code in unifiable_n:
+        return unifiable_n[code]
+
+    try:
+        return chr(code)
+    except ValueError:
+        return ''
+
+
+def entityref(name):
+    """ Text of an entity reference, like html2text """
+
+    if name == 'nbsp':
+        return NBSP_PLACEHOLDER
+    if name in UNIFIABLE:
+        return UNIFIABLE[name]
+
+    return html.entities.html5.get(name + ';', '&' + name + ';')
+
+
+def needs_escaping(data):
+    """
+        Check if some text may need Markdown escaping, with string methods only (most text does not)
+        See html2text.utils.escape_md_section: backslashes, and list markers at the start of lines
+    """
+
+    if '\\' in data:
+        return True
+
+    # "^\s*" of the patterns also skips line breaks, which is the same as checking each line
+    for line in data.split('\n'):
+        line = line.lstrip()
+        first = line[:1]
+        if first == '-':
+            follower = line[1:2]
+            if not follower or follower.isspace() or follower == '-':
+                return True
+        elif first == '+':
+            follower = line[1:2]
+            if not follower or follower.isspace():
+                return True
+        elif first.isdecimal():
+            # Numbered list marker, like "1. "
+            (number, dot, follower) = line.partition('.')
+            if dot and number.isdecimal() and (not follower or follower[0].isspace()):
+                return True
+
+    return False
+
+
+def escape_link(text):
+    """ Escape a link URL or title, like html2text.utils.escape_md """
+
+    if LINK_ESCAPED_CHARS.isdisjoint(text):
+        return text
+
+    return escape_md(text)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_tag(content):
+    """
+        Parse the content of a tag between "<" and ">", returns its name, attributes and if it is a start tag
+        Raises UnsupportedMarkup for tags outside of the subset
+    """
+
+    match = TAG_PATTERN.fullmatch(content)
+    if match is None:
+        raise UnsupportedMarkup(content)
+
+    tag = match.group('tag').lower()
+    if tag not in TAGS:
+        raise UnsupportedMarkup(content)
+
+    if match.group('end'):
+        if match.group('attrs').strip():
+            raise UnsupportedMarkup(content)
+        return (tag, {}, False)
+
+    return (tag, parse_attributes(match.group('attrs')), True)
+
+
+def convert(source):
+    """
+        Convert the HTML of a comment to Markdown, None if it uses unsupported markup
+        The state of html2text.HTML2Text is kept in local variables, and its methods o() and handle_data()
+        are closures, the tag handlers are inlined in the tokenizer loop
+    """
+
+    parts = []
+    append = parts.append
+
+    p_p = 0
+    start = True
+    space = False
+    last_was_nl = False
+    astack = []
+    maybe_automatic_link = None
+    empty_link = False
+    pre = False
+    startpre = False
+    code = False
+    stressed = False
+    preceding_stressed = False
+    preceding_data = ''
+    current_tag = ''
+
+    def o(data, puredata=False, force=False):
+        """ Output data, with pending line breaks and spaces """
+
+        nonlocal p_p, start, space, last_was_nl, startpre
+
+        if puredata and not pre:
+            if not data.isprintable() or '  ' in data:
+                data = WHITESPACE_PATTERN.sub(' ', data)
+            if data and data[0] == ' ':
+                space = True
+                data = data[1:]
+        if not data and not force:
+            return
+
+        if startpre:
+            if not data.startswith('\n') and not data.startswith('\r\n'):
+                data = '\n' + data
+            startpre = False
+
+        indent = ''
+        if pre:
+            indent = '    '
+            data = data.replace('\n', '\n' + indent)
+
+        if start:
+            space = False
+            p_p = 0
+            start = False
+
+        if force == 'end':
+            p_p = 0
+            append('\n')
+            last_was_nl = True
+            space = False
+
+        if p_p:
+            append(('\n' + indent) * p_p)
+            last_was_nl = not indent
+            space = False
+
+        if space:
+            if not last_was_nl:
+                append(' ')
+                last_was_nl = False
+            space = False
+
+        p_p = 0
+        if data:
+            append(data)
+            last_was_nl = data[-1] == '\n'
+
+    def handle_data(data, entity_char=False):
+        nonlocal stressed, preceding_stressed, maybe_automatic_link, empty_link, preceding_data
+
+        if stressed:
+            data = data.strip()
+            stressed = False
+            preceding_stressed = True
+        elif preceding_stressed:
+            if STRESSED_FOLLOWER_PATTERN.match(data[0]) and current_tag not in ('a', 'code', 'pre'):
+                data = ' ' + data
+            preceding_stressed = False
+
+        if maybe_automatic_link is not None:
+            href = maybe_automatic_link
+            if href == data and ABSOLUTE_URL_PATTERN.match(href):
+                o('<' + data + '>')
+                empty_link = False
+                return
+            o('[')
+            maybe_automatic_link = None
+            empty_link = False
+
+        if not code and not pre and not entity_char and needs_escaping(data):
+            data = escape_md_section(data)
+        preceding_data = data
+        o(data, puredata=True)
+
+    def handle_text(text):
+        """ Handle text and the character or entity references it contains """
+
+        if '&' not in text:
+            if text:
+                handle_data(text)
+            return
+
+        chunks = text.split('&')
+        if chunks[0]:
+            handle_data(chunks[0])
+
+        for chunk in chunks[1:]:
+            end = chunk.find(';')
+            match = REFERENCE_PATTERN.fullmatch(chunk, 0, end) if end > 0 else None
+            if match is None:
+                raise UnsupportedMarkup(chunk)
+
+            if match.lastgroup == 'charref':
+                ref = charref(match.group('charref'))
+            else:
+                ref = entityref(match.group('entityref'))
+            if ref:
+                handle_data(ref, entity_char=True)
+
+            if end + 1 < len(chunk):
+                handle_data(chunk[end + 1:])
+
+    # Each chunk but the first starts with a tag
+    chunks = source.split('<')
+    try:
+        handle_text(chunks[0])
+
+        for chunk in chunks[1:]:
+            end = chunk.find('>')
+            if end < 0:
+                # Stray "<"
+                return None
+
+            content = chunk[:end]
+            if content in PLAIN_TAGS:
+                (tag, tag_start) = PLAIN_TAGS[content]
+                attrs = None
+            else:
+                (tag, attrs, tag_start) = parse_tag(content)
+
+            current_tag = tag
+
+            if tag == 'p' or tag == 'div':
+                if not astack:
+                    p_p = 2
+
+            else:
+                # First thing inside the link is a tag producing some output
+                if tag_start and maybe_automatic_link is not None:
+                    o('[')
+                    maybe_automatic_link = None
+                    empty_link = False
+
+                if tag == 'i' or tag == 'em' or tag == 'u':
+                    # Separate with a space if the emphasis immediately follows an alphanumeric character
+                    if tag_start and preceding_data and preceding_data[-1] not in string.whitespace \
+                            and preceding_data[-1] not in string.punctuation:
+                        emphasis = ' ' + EMPHASIS_MARK
+                        preceding_data += ' '
+                    else:
+                        emphasis = EMPHASIS_MARK
+
+                    o(emphasis)
+                    if tag_start:
+                        stressed = True
+
+                elif tag == 'code':
+                    if not pre:
+                        o('`')
+                        code = not code
+
+                elif tag == 'a':
+                    if tag_start:
+                        href = attrs.get('href')
+                        if href is not None and not href.startswith('#'):
+                            astack.append(attrs)
+                            maybe_automatic_link = href
+                            empty_link = True
+                        else:
+                            astack.append(None)
+                    elif astack:
+                        a = astack.pop()
+                        if maybe_automatic_link and not empty_link:
+                            maybe_automatic_link = None
+                        elif a:
+                            if empty_link:
+                                o('[')
+                                empty_link = False
+                                maybe_automatic_link = None
+                            p_p = 0
+                            title = escape_link(a.get('title') or '')
+                            title = ' "{}"'.format(title) if title.strip() else ''
+                            o(']({}{})'.format(escape_link(a['href']), title))
+
+                elif tag == 'pre':
+                    if tag_start:
+                        startpre = True
+                        pre = True
+                    else:
+                        pre = False
+                    p_p = 2
+
+            text = chunk[end + 1:]
+            if '&' in text:
+                handle_text(text)
+            elif text:
+                handle_data(text)
+    except UnsupportedMarkup:
+        return None
+
+    if p_p == 0:
+        p_p = 1
+    o('', force='end')
+
+    return ''.join(parts).replace(NBSP_PLACEHOLDER, ' ')
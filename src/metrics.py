@@ -0,0 +1,215 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+"""
+    Instrumentation of the stages of requests and ingest runs, with histograms and counters.
+
+    Metrics are off unless the HN_JOBS_METRICS environment variable is set to 1 (or enable() is called):
+    timed() then returns a shared no-op context manager and the other functions return immediately,
+    so that instrumented code runs at full speed.
+
+    They are exposed in the Prometheus text format by the /metrics endpoint of the application (see render()),
+    and as JSON by `python -m src.fetch_job_postings --metrics-output ingest.json` (see summary()).
+"""
+
+# Prefix of the names of the exposed metrics
+PREFIX = 'hn_jobs_'
+
+# Metrics by name: type and help text
+METRICS = {
+    'stage_seconds': ('histogram', 'Duration of the stages of requests and ingest runs, in seconds'),
+    'request_seconds': ('histogram', 'Duration of HTTP requests, in seconds'),
+    'listing_cache_total': ('counter', 'Lookups of the listing cache, by result'),
+    'ingest_pages_total': ('counter', 'Pages of threads fetched by the ingest, by state'),
+    'ingest_jobs_total': ('counter', 'Jobs seen by the ingest, by result'),
+}
+
+# Upper bounds of the buckets of histograms, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+ENABLED = os.environ.get('HN_JOBS_METRICS', '') == '1'
+
+# Values by metric name, then by labels (sorted tuple of pairs)
+# Histograms: [counts per bucket (and +Inf), sum, count], counters: [value]
+_values = {name: {} for name in METRICS}
+_lock = threading.Lock()
+
+_NOOP = contextlib.nullcontext()
+
+
+def enable(enabled=True):
+    """ Turn the collection of metrics on or off """
+
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset():
+    """ Forget all the collected values """
+
+    with _lock:
+        for values in _values.values():
+            values.clear()
+
+
+def observe(name, seconds, **labels):
+    """ Record a duration in the histogram `name` """
+
+    if not ENABLED:
+        return
+
+    key = tuple(sorted(labels.items()))
+    index = bisect.bisect_left(BUCKETS, seconds)
+
+    with _lock:
+        value = _values[name].get(key)
+        if value is None:
+            value = _values[name][key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        value[0][index] += 1
+        value[1] += seconds
+        value[2] += 1
+
+
+def increment(name, amount=1, **labels):
+    """ Increment the counter `name` """
+
+    if not ENABLED:
+        return
+
+    key = tuple(sorted(labels.items()))
+
+    with _lock:
+        value = _values[name].setdefault(key, [0])
+        value[0] += amount
+
+
+class Timer:
+    """ Context manager recording its duration in the stages histogram """
+
+    __slots__ = ('labels', 'start')
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe('stage_seconds', time.perf_counter() - self.start, **self.labels)
+
+
+def timed(stage, **labels):
+    """ Context manager timing a stage, as `with timed('parse'):` """
+
+    if not ENABLED:
+        return _NOOP
+
+    return Timer({'stage': stage, **labels})
+
+
+def timed_function(stage):
+    """ Decorator timing the calls of a function as a stage, labeled with the name of the function """
+
+    def decorator(func):
+        labels = {'stage': stage, 'operation': func.__name__}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+
+            with Timer(labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ ASGI middleware recording the duration of HTTP requests, by method, route and status """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # Route templates, not paths, so that the number of series stays bounded
+            route = scope.get('route')
+            observe('request_seconds', time.perf_counter() - start, method=scope['method'],
+                    route=route.path if route is not None else 'unmatched', status=str(status))
+
+
+def format_labels(labels):
+    """ Format labels in the Prometheus text format """
+
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                          .replace('\n', '\\n')) for name, value in labels)
+
+
+def render():
+    """ Render all the metrics in the Prometheus text format """
+
+    lines = []
+    with _lock:
+        for name, (kind, help_text) in METRICS.items():
+            full_name = PREFIX + name
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+
+            for key, value in sorted(_values[name].items()):
+                if kind == 'counter':
+                    lines.append(f'{full_name}{format_labels(key)} {value[0]}')
+                    continue
+
+                (counts, total, count) = value
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{full_name}_bucket{format_labels(key + (("le", bound),))} {cumulative}')
+                lines.append(f'{full_name}_sum{format_labels(key)} {total!r}')
+                lines.append(f'{full_name}_count{format_labels(key)} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def summary():
+    """ Get all the collected values as a JSON-serializable dict """
+
+    res = {}
+    with _lock:
+        for name, (kind, _) in METRICS.items():
+            series = []
+            for key, value in sorted(_values[name].items()):
+                if kind == 'counter':
+                    series.append({'labels': dict(key), 'value': value[0]})
+                else:
+                    series.append({'labels': dict(key), 'count': value[2], 'sum_seconds': round(value[1], 6),
+                                   'buckets': dict(zip([str(bound) for bound in BUCKETS] + ['+Inf'], value[0]))})
+            if series:
+                res[name] = series
+
+    return res
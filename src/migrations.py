@@ -0,0 +1,290 @@
+"""
+    Numbered schema migrations of the SQLite database
+
+    Each migration is a function applied in order, inside a transaction, by helper.db_migrate().
+    The number of applied migrations is tracked in PRAGMA user_version.
+    Migrations must be idempotent: databases created before versioning have a user_version of 0
+    but may already contain part of the schema.
+    To change the schema, append a new migration, never edit an existing one.
+"""
+
+
+def create_jobs(conn):
+    """ Create the jobs table """
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hn_id INTEGER,
+        hn_user TEXT,
+        job_text TEXT NOT NULL,
+        inserted_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP,
+        applied_at TIMESTAMP,
+        status TEXT
+    )
+    ''')
+
+
+def add_job_markdown(conn):
+    """ Store the rendered Markdown of jobs and the version of the renderer """
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+    for name, definition in [('job_markdown', 'TEXT'), ('render_version', 'INTEGER')]:
+        if name not in columns:
+            conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {definition}')
+
+
+def create_search_index(conn):
+    """
+        Create the full-text search index of jobs and the triggers keeping it in sync
+        The index holds the rendered Markdown (or the raw text of jobs that were never rendered)
+    """
+
+    index_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs_fts'").fetchone()
+
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+        body,
+        content='',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN
+        INSERT INTO jobs_fts (rowid, body)
+        VALUES (new.id, coalesce(new.job_markdown, new.job_text));
+    END
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN
+        INSERT INTO jobs_fts (jobs_fts, rowid, body)
+        VALUES ('delete', old.id, coalesce(old.job_markdown, old.job_text));
+    END
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE OF job_text, job_markdown ON jobs BEGIN
+        INSERT INTO jobs_fts (jobs_fts, rowid, body)
+        VALUES ('delete', old.id, coalesce(old.job_markdown, old.job_text));
+        INSERT INTO jobs_fts (rowid, body)
+        VALUES (new.id, coalesce(new.job_markdown, new.job_text));
+    END
+    ''')
+
+    # Index the jobs stored before the index existed
+    if not index_exists:
+        conn.execute('''
+        INSERT INTO jobs_fts (rowid, body)
+        SELECT id, coalesce(job_markdown, job_text) FROM jobs
+        ''')
+
+
+def create_indexes(conn):
+    """
+        Index the job lookups:
+         - hn_id: existing job check on ingest (unique, one row per HN comment)
+         - hn_user, status: jobs by user and users with jobs in a given status (auto discard)
+         - status: listing filter
+    """
+
+    # Remove duplicated HN comments, keeping the row the user worked on: a status other than new first,
+    # then the latest updated, then the first stored
+    conn.execute('''
+    DELETE FROM jobs
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY hn_id
+                ORDER BY coalesce(status, 'new') = 'new', coalesce(updated_at, applied_at, inserted_at) DESC, id
+            ) AS rank
+            FROM jobs
+            WHERE hn_id IS NOT NULL
+        )
+        WHERE rank > 1
+    )
+    ''')
+
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS jobs_hn_id ON jobs (hn_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS jobs_hn_user_status ON jobs (hn_user, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+
+
+def add_job_hash(conn):
+    """ Store the content hash of jobs, to skip unchanged jobs on ingest """
+
+    from .helper import hash_text
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+    if 'job_hash' not in columns:
+        conn.execute('ALTER TABLE jobs ADD COLUMN job_hash TEXT')
+
+    conn.create_function('hash_text', 1, hash_text, deterministic=True)
+    conn.execute('UPDATE jobs SET job_hash = hash_text(job_text) WHERE job_hash IS NULL')
+
+
+def create_thread_pages(conn):
+    """
+        Create the fetch state of thread pages, for incremental ingest:
+        HTTP validators (ETag/Last-Modified) and content hash of each page fetched
+    """
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS thread_pages (
+        thread_id INTEGER NOT NULL,
+        page INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        page_hash TEXT,
+        has_more INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (thread_id, page)
+    )
+    ''')
+
+
+def create_data_version(conn):
+    """
+        Create the data version of jobs, a counter bumped by every write to jobs (see helper.bump_data_version)
+        Cached results are keyed on it, so that any change invalidates them, even from another process
+    """
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+
+
+def create_user_summary(conn):
+    """
+        Create the summary of the jobs of each user (number of jobs by status, last activity)
+        and the triggers keeping it in sync with jobs
+    """
+
+    summary_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_summary'").fetchone()
+
+    # Counter column of each status
+    columns = {
+        'new': 'new_jobs',
+        'applied': 'applied_jobs',
+        'discarded': 'discarded_jobs',
+        'interviewed': 'interviewed_jobs',
+        'rejected-pre': 'rejected_pre_jobs',
+        'rejected-post': 'rejected_post_jobs',
+    }
+
+    names = ', '.join(columns.values())
+
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS user_summary (
+        hn_user TEXT PRIMARY KEY,
+        jobs INTEGER NOT NULL,
+        {', '.join(f'{column} INTEGER NOT NULL' for column in columns.values())},
+        last_activity_at TIMESTAMP
+    ) WITHOUT ROWID
+    ''')
+
+    def add_job(row):
+        # Count a job (`new` or `old` row of a trigger) in the summary of its user
+        counts = ', '.join(f"{row}.status IS '{status}'" for status in columns)
+        increments = ', '.join(f'{column} = {column} + excluded.{column}' for column in columns.values())
+
+        return f'''
+        INSERT INTO user_summary (hn_user, jobs, {names}, last_activity_at)
+        SELECT {row}.hn_user, 1, {counts}, coalesce({row}.updated_at, {row}.inserted_at)
+        WHERE {row}.hn_user IS NOT NULL
+        ON CONFLICT (hn_user) DO UPDATE SET
+            jobs = jobs + 1, {increments},
+            last_activity_at = max(coalesce(last_activity_at, ''), excluded.last_activity_at);
+        '''
+
+    def remove_job(row):
+        # Uncount a job from the summary of its user
+        decrements = ', '.join(f"{column} = {column} - ({row}.status IS '{status}')" for status, column in columns.items())
+
+        return f'''
+        UPDATE user_summary
+        SET jobs = jobs - 1, {decrements}
+        WHERE hn_user = {row}.hn_user;
+        '''
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS user_summary_insert AFTER INSERT ON jobs BEGIN
+        {add_job('new')}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS user_summary_delete AFTER DELETE ON jobs BEGIN
+        {remove_job('old')}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS user_summary_update AFTER UPDATE OF hn_user, status ON jobs BEGIN
+        {remove_job('old')}
+        {add_job('new')}
+    END
+    ''')
+
+    # Summarize the jobs stored before the summary existed
+    if not summary_exists:
+        conn.execute(f'''
+        INSERT INTO user_summary (hn_user, jobs, {names}, last_activity_at)
+        SELECT hn_user, COUNT(*), {', '.join(f"SUM(status IS '{status}')" for status in columns)},
+            max(coalesce(updated_at, inserted_at))
+        FROM jobs
+        WHERE hn_user IS NOT NULL
+        GROUP BY hn_user
+        ''')
+
+
+def add_job_snippet(conn):
+    """ Store the snippet of the rendered Markdown of jobs, shown in listings instead of the full text """
+
+    from .helper import make_snippet
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+    if 'job_snippet' not in columns:
+        conn.execute('ALTER TABLE jobs ADD COLUMN job_snippet TEXT')
+
+    # Jobs that were never rendered get their snippet when they are (see render_jobs)
+    conn.create_function('make_snippet', 1, make_snippet, deterministic=True)
+    conn.execute('''
+    UPDATE jobs SET job_snippet = make_snippet(job_markdown)
+    WHERE job_snippet IS NULL AND job_markdown IS NOT NULL
+    ''')
+
+
+def render_legacy_jobs(conn):
+    """
+        Render the jobs stored before they were rendered at ingest: their Markdown, snippet and render version
+        were never set, and their raw HTML was indexed for search (re-indexed by the update trigger)
+    """
+
+    from .render_jobs import render_stale
+
+    render_stale(conn)
+
+
+# Migration N is MIGRATIONS[N - 1]
+MIGRATIONS = [
+    create_jobs,
+    add_job_markdown,
+    create_search_index,
+    create_indexes,
+    add_job_hash,
+    create_thread_pages,
+    create_data_version,
+    create_user_summary,
+    add_job_snippet,
+    render_legacy_jobs,
+]
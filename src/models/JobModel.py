@@ -1,9 +1,11 @@
 
+import json
 from datetime import datetime
 
 from pydantic import BaseModel
-from typing import Optional
-from ..helper import db_connect, resolve_email, html_to_markdown
+from typing import List, Optional
+from .. import metrics
+from ..helper import bump_data_version, db_connect, db_connect_stream, get_data_version, make_snippet, render_job_text, to_search_query
 from . import StatusModel
 
 
@@ -18,6 +20,51 @@ class Job(BaseModel):
     status: str
 
 
+class UserSummary(BaseModel):
+    hn_user: str
+    jobs: int
+    new_jobs: int
+    applied_jobs: int
+    discarded_jobs: int
+    interviewed_jobs: int
+    rejected_pre_jobs: int
+    rejected_post_jobs: int
+    last_activity_at: Optional[datetime]
+
+    def get_count(self, status):
+        """ Number of jobs of the user in a status """
+        return getattr(self, status.replace('-', '_') + '_jobs', 0)
+
+
+class JobPage(BaseModel):
+    jobs: List[Job]
+    prev_cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+
+
+# Number of jobs per page in listings
+PAGE_SIZE = 50
+
+# Values of the accepted statuses
+STATUS_VALUES = frozenset(status.value for status in StatusModel.get_all())
+
+# Listings (page and count) by filters, page cursor and data version, see get_listing_cache()
+# Entries of older data versions are never hit again, they expire or get evicted
+listing_cache = None
+
+JOB_COLUMNS = 'j.id, j.hn_id, j.hn_user, j.job_text, j.job_markdown, j.inserted_at, j.updated_at, j.applied_at, j.status'
+
+# Columns of exports, and number of rows fetched at once
+EXPORT_COLUMNS = ('id', 'hn_id', 'hn_user', 'status', 'inserted_at', 'updated_at', 'applied_at', 'job_text',
+                  'job_markdown')
+EXPORT_BATCH_SIZE = 500
+
+# Columns of listings: the snippet instead of the full text, which is only read for jobs without a snippet
+LIST_COLUMNS = '''j.id, j.hn_id, j.hn_user, CASE WHEN j.job_snippet IS NULL THEN j.job_text END AS job_text,
+    j.job_snippet, j.inserted_at, j.updated_at, j.applied_at, j.status'''
+
+
+@metrics.timed_function('db')
 def get(job_id):
     """
         Get a job by ID
@@ -26,46 +73,65 @@ def get(job_id):
     cursor = conn.cursor()
 
     cursor.execute('''
-    SELECT j.id, j.hn_id, j.hn_user, j.job_text, j.inserted_at, j.updated_at, j.applied_at, j.status
+    SELECT j.id, j.hn_id, j.hn_user, j.job_text, j.job_markdown, j.inserted_at, j.updated_at, j.applied_at, j.status
     FROM jobs j
     WHERE id = ?
     ''', (job_id,))
 
     row = cursor.fetchone()
     conn.close()
-    return format_job(dict(row) or {})
+    return format_row(row)
 
 
 def update(job_id, status):
     """
         Update the status of a job
     """
-    conn = db_connect()
-    cursor = conn.cursor()
+    try:
+        update_many([job_id], status)
+    except ValueError:
+        return False
+
+    return True
+
+
+@metrics.timed_function('db')
+def update_many(job_ids, status):
+    """
+        Update the status of jobs, with a single statement
+        Returns the number of updated jobs, raises ValueError on invalid statuses
+    """
 
     # Check for valid statuses
-    valid_statuses = [status.value for status in StatusModel.get_all()]
-    if status not in valid_statuses:
-        # raise ValueError('Invalid status')
-        return False
+    if status not in STATUS_VALUES:
+        raise ValueError('Invalid status')
+
+    conn = db_connect()
+    cursor = conn.cursor()
 
     # If the status is 'applied', update the 'applied_at' field
     query_part = ''
     if status == 'applied':
         query_part = ", applied_at = datetime('now')"
 
+    # Ids are bound as a single JSON array, whatever their number
     cursor.execute(f'''
     UPDATE jobs
     SET status = ?, updated_at = datetime('now') {query_part}
-    WHERE id = ?
-    ''', (status, job_id))
+    WHERE id IN (SELECT value FROM json_each(?))
+    ''', (status, json.dumps([int(job_id) for job_id in job_ids])))
+
+    res = cursor.rowcount
+    if res:
+        bump_data_version(conn)
 
     conn.commit()
     conn.close()
 
-    return True
+    return res
 
 
+@metrics.timed_function('db')
 def get_all(status=None, search=None):
     """
         Get jobs from SQLITE
@@ -74,21 +140,17 @@ def get_all(status=None, search=None):
     conn = db_connect()
     cursor = conn.cursor()
 
-    query_part = ''
-    query_params = []
-    if status:
-        query_part += 'AND status = ?'
-        query_params.append(status)
-
-    if search:
-        query_part += 'AND job_text LIKE ?'
-        query_params.append(f'%{search}%')
+    query_join, query_part, query_params, ranked = get_filters(
+        status=status, search=search)
+    query_order = 'bm25(jobs_fts), j.id' if ranked else 'j.id'
 
     query = f"""
-    SELECT id, hn_id, hn_user, job_text, inserted_at, updated_at, applied_at, status
-    FROM jobs
+    SELECT {JOB_COLUMNS}
+    FROM jobs j
+    {query_join}
     WHERE 1=1
     {query_part}
+    ORDER BY {query_order}
     """
     cursor.execute(query, query_params)
 
@@ -100,17 +162,224 @@ def get_all(status=None, search=None):
         return [
             format_job({
                 'id': 0,
-                'job_text': 'No results.',
+                'job_markdown': 'No results.\n',
             })
         ]
 
     jobs = []
     for row in rows:
-        jobs.append(format_job(dict(row)))
+        jobs.append(format_row(row))
 
     return jobs
 
 
+def export(status=None, hn_user=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+        Iterate over the jobs matching the filters, by batches of at most `batch_size` rows of EXPORT_COLUMNS
+        `since`/`until` are the first and last days of insertion (dates or ISO strings), both included
+        Rows are fetched as they are consumed, from a single read transaction on a connection of their own
+    """
+
+    query_join, query_part, query_params, _ = get_filters(status=status, hn_user=hn_user)
+
+    if since:
+        query_part += 'AND j.inserted_at >= date(?) '
+        query_params.append(str(since))
+
+    if until:
+        query_part += "AND j.inserted_at < date(?, '+1 day') "
+        query_params.append(str(until))
+
+    conn = db_connect_stream()
+    try:
+        cursor = conn.execute(f"""
+        SELECT {', '.join('j.' + column for column in EXPORT_COLUMNS)}
+        FROM jobs j
+        {query_join}
+        WHERE 1=1
+        {query_part}
+        ORDER BY j.id
+        """, query_params)
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+@metrics.timed_function('db')
+def get_page(status=None, search=None, hn_user=None, after=None, before=None, page_size=PAGE_SIZE):
+    """
+        Get a page of jobs, using keyset pagination, with the snippets of jobs as text (see format_list_row)
+        `after`/`before` are cursors returned in a previous page, to fetch the next/previous page
+        Raises ValueError on invalid cursors
+    """
+    conn = db_connect()
+    cursor = conn.cursor()
+
+    query_join, query_part, query_params, ranked = get_filters(
+        status=status, search=search, hn_user=hn_user)
+
+    # Jobs are sorted by rank (when searching) then by id
+    key_columns = ['bm25(jobs_fts)', 'j.id'] if ranked else ['j.id']
+
+    page_cursor = before or after
+    if page_cursor:
+        values = decode_cursor(page_cursor)
+        if len(values) != len(key_columns):
+            raise ValueError('Invalid cursor')
+
+        query_part += 'AND (%s) %s (%s) ' % (
+            ', '.join(key_columns), '<' if before else '>', ', '.join('?' * len(values)))
+        query_params += values
+
+    # Walk backwards to fetch the previous page
+    direction = 'DESC' if before else 'ASC'
+
+    query = f"""
+    SELECT {LIST_COLUMNS}, {key_columns[0] if ranked else 'NULL'} AS rank
+    FROM jobs j
+    {query_join}
+    WHERE 1=1
+    {query_part}
+    ORDER BY {', '.join(f'{column} {direction}' for column in key_columns)}
+    LIMIT ?
+    """
+    # Fetch one more row to know if there is another page
+    cursor.execute(query, query_params + [page_size + 1])
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+
+    # No jobs match, or the cursor is past the last page: the listing shows its own message
+    if not rows:
+        return JobPage(jobs=[])
+
+    has_prev, has_next = (has_more, True) if before else (bool(after), has_more)
+
+    return JobPage(
+        jobs=[format_list_row(row) for row in rows],
+        prev_cursor=encode_cursor(rows[0]) if has_prev else None,
+        next_cursor=encode_cursor(rows[-1]) if has_next else None,
+    )
+
+
+def get_listing_cache():
+    """
+        Get the listing cache, created on first use
+        cacheout (which imports asyncio) is only loaded by the application, not by the tools using this module
+    """
+
+    global listing_cache
+
+    if listing_cache is None:
+        from cacheout import Cache
+
+        listing_cache = Cache(maxsize=256, ttl=3600)
+
+    return listing_cache
+
+
+def get_listing(status=None, search=None, hn_user=None, after=None, before=None):
+    """
+        Get a page of jobs and the count of jobs matching the filters, see get_page() and count()
+        Results are cached until jobs are written, the cache is checked against the data version
+    """
+
+    key = (status, to_search_query(search), hn_user, after, before, get_data_version())
+
+    cache = get_listing_cache()
+    res = cache.get(key)
+    metrics.increment('listing_cache_total', result='miss' if res is None else 'hit')
+    if res is None:
+        res = (get_page(status=status, search=search, hn_user=hn_user, after=after, before=before),
+               count(status=status, search=search, hn_user=hn_user))
+        cache.set(key, res)
+
+    return res
+
+
+@metrics.timed_function('db')
+def count(status=None, search=None, hn_user=None):
+    """
+        Count jobs matching the filters
+    """
+    conn = db_connect()
+    cursor = conn.cursor()
+
+    query_join, query_part, query_params, _ = get_filters(
+        status=status, search=search, hn_user=hn_user)
+
+    cursor.execute(f"""
+    SELECT COUNT(*)
+    FROM jobs j
+    {query_join}
+    WHERE 1=1
+    {query_part}
+    """, query_params)
+
+    res = cursor.fetchone()[0]
+    conn.close()
+
+    return res
+
+
+def get_filters(status=None, search=None, hn_user=None):
+    """
+        Build the join, conditions and parameters of a query on jobs matching the filters
+        Returns (query_join, query_part, query_params, ranked), where ranked is True for full-text searches
+    """
+
+    query_join = ''
+    query_part = ''
+    query_params = []
+
+    search_query = to_search_query(search)
+    if search_query:
+        # Full-text search, results can be ranked with bm25(jobs_fts)
+        query_join = 'JOIN jobs_fts ON jobs_fts.rowid = j.id'
+        query_part += 'AND jobs_fts MATCH ? '
+        query_params.append(search_query)
+
+    if status:
+        query_part += 'AND j.status = ? '
+        query_params.append(status)
+
+    if hn_user:
+        query_part += 'AND j.hn_user = ? '
+        query_params.append(hn_user)
+
+    return query_join, query_part, query_params, bool(search_query)
+
+
+def encode_cursor(row):
+    """ Encode the sort key of a row into a page cursor """
+
+    if row['rank'] is None:
+        return str(row['id'])
+
+    return '%r:%d' % (row['rank'], row['id'])
+
+
+def decode_cursor(page_cursor):
+    """ Decode a page cursor into the values of its sort key """
+
+    *rank, job_id = page_cursor.split(':')
+    if len(rank) > 1:
+        raise ValueError('Invalid cursor')
+
+    return [float(value) for value in rank] + [int(job_id)]
+
+
+@metrics.timed_function('db')
 def get_by_user(hn_user):
     """
         Get jobs by HN user
@@ -119,7 +388,7 @@ def get_by_user(hn_user):
     cursor = conn.cursor()
 
     query = '''
-    SELECT j.id, j.hn_id, j.hn_user, j.job_text, j.inserted_at, j.updated_at, j.applied_at, j.status
+    SELECT j.id, j.hn_id, j.hn_user, j.job_text, j.job_markdown, j.inserted_at, j.updated_at, j.applied_at, j.status
     FROM jobs j
     WHERE hn_user = ?
     '''
@@ -134,17 +403,47 @@ def get_by_user(hn_user):
         return [
             format_job({
                 'id': 0,
-                'job_text': 'No results.',
+                'job_markdown': 'No results.\n',
             })
         ]
 
     jobs = []
     for row in rows:
-        jobs.append(format_job(dict(row)))
+        jobs.append(format_row(row))
 
     return jobs
 
 
+# New jobs of users matched with another job (applied to, discarded...), from the summary of users
+TO_DISCARD_QUERY = '''
+    SELECT j.id
+    FROM user_summary u
+    JOIN jobs j ON j.hn_user = u.hn_user AND j.status = 'new'
+    WHERE u.new_jobs > 0
+        AND u.applied_jobs + u.discarded_jobs + u.interviewed_jobs + u.rejected_pre_jobs + u.rejected_post_jobs > 0
+'''
+
+
+@metrics.timed_function('db')
+def get_user_summary(hn_user):
+    """
+        Get the summary of the jobs of a user (number of jobs by status, last activity), None for unknown users
+    """
+    conn = db_connect()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT * FROM user_summary WHERE hn_user = ?', (hn_user,))
+
+    row = cursor.fetchone()
+    conn.close()
+
+    if row is None:
+        return None
+
+    return UserSummary(**dict(row))
+
+
+@metrics.timed_function('db')
 def get_to_discard():
     """
         Get jobs that can be discarded because the user is matched with another job.
@@ -152,20 +451,7 @@ def get_to_discard():
     conn = db_connect()
     cursor = conn.cursor()
 
-    query = '''
-    SELECT j.id
-    FROM jobs j
-    WHERE status = 'new'
-        AND EXISTS (
-            SELECT 1
-            FROM jobs
-            WHERE hn_user = j.hn_user
-                AND id != j.id
-                AND status IN ('applied', 'discarded', 'interviewed', 'rejected-pre', 'rejected-post')
-            );
-    '''
-
-    cursor.execute(query)
+    cursor.execute(TO_DISCARD_QUERY)
 
     rows = cursor.fetchall()
     conn.close()
@@ -173,25 +459,87 @@ def get_to_discard():
     return [row['id'] for row in rows]
 
 
-def format_job(job):
+@metrics.timed_function('db')
+def discard_matched():
     """
-        Format a job
+        Discard the jobs returned by get_to_discard(), with a single statement
+        Returns the number of discarded jobs
     """
+    conn = db_connect()
+    cursor = conn.cursor()
+
+    cursor.execute(f'''
+    UPDATE jobs
+    SET status = 'discarded', updated_at = datetime('now')
+    WHERE id IN ({TO_DISCARD_QUERY})
+    ''')
+
+    res = cursor.rowcount
+    if res:
+        bump_data_version(conn)
+
+    conn.commit()
+    conn.close()
+
+    return res
 
-    # Resolve emails
-    job_text = resolve_email(job.get('job_text', ''))
 
-    # Convert HTML to Markdown
-    job_text = html_to_markdown(job_text)
+def make_job(row, job_text):
+    """
+        Make a job from a row (or a dict with every column) and the text shown for it
+        Row values are passed straight to the validator of Job, which parses the timestamps natively:
+        no intermediate dict, as rows always have every column
+    """
 
     return Job(
-        id=job.get('id', 0),
-        hn_id=job.get('hn_id'),
-        hn_user=job.get('hn_user'),
+        id=row['id'],
+        hn_id=row['hn_id'],
+        hn_user=row['hn_user'],
         job_text=job_text,
-        inserted_at=job.get(
-            'inserted_at', datetime.now().replace(microsecond=0)),
-        updated_at=job.get('updated_at'),
-        applied_at=job.get('applied_at'),
-        status=job.get('status', 'n/a'),
+        inserted_at=row['inserted_at'],
+        updated_at=row['updated_at'],
+        applied_at=row['applied_at'],
+        status=row['status'],
     )
+
+
+def format_row(row):
+    """
+        Format a job from a row of JOB_COLUMNS, with the rendered Markdown of the job as text
+    """
+
+    # Markdown is rendered at ingest, only render rows that were never rendered
+    job_text = row['job_markdown']
+    if job_text is None:
+        job_text = render_job_text(row['job_text'])
+
+    return make_job(row, job_text)
+
+
+def format_list_row(row):
+    """
+        Format a job from a row of LIST_COLUMNS, with the snippet of the job as text
+        Snippets are stored at ingest, only compute them for rows that were never rendered
+    """
+
+    job_text = row['job_snippet']
+    if job_text is None:
+        job_text = make_snippet(render_job_text(row['job_text']))
+
+    return make_job(row, job_text)
+
+
+def format_job(job):
+    """
+        Format a job from a dict, missing columns get a default value
+    """
+
+    # Markdown is rendered at ingest, only render rows that were never rendered
+    job_text = job.get('job_markdown')
+    if job_text is None:
+        job_text = render_job_text(job.get('job_text', ''))
+
+    defaults = dict.fromkeys(Job.model_fields, None)
+    defaults.update(id=0, inserted_at=datetime.now().replace(microsecond=0), status='n/a')
+
+    return make_job({**defaults, **job}, job_text)
@@ -0,0 +1,302 @@
+"""
+    Parser backends extracting the comments of a Hacker News thread.
+
+    Every backend yields (comment_html, hn_user, hn_id, indent) tuples, in page order,
+    and produces the same output as the BeautifulSoup 'html.parser' backend of fetch_job_postings:
+    comment_html is the commtext div serialized the way BeautifulSoup does.
+
+     - lxml: parses the page with lxml (C), much faster than BeautifulSoup
+     - stream: tree-free extractor built on the standard library HTMLParser,
+       only the comment being parsed is kept in memory
+"""
+
+import re
+from html.parser import HTMLParser
+from itertools import islice
+
+# Elements without content, serialized as <br/>
+VOID_ELEMENTS = {'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr',
+                 'image', 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid',
+                 'param', 'source', 'spacer', 'track', 'wbr'}
+
+# Start of comment rows and bodies in the source
+ROW_PATTERN = re.compile(r'''<tr\s[^>]*class=(["'])\s*athing\s+comtr\s*\1''')
+COMMTEXT_PATTERN = re.compile(r'''<div\s[^>]*class=(["'])[^"']*\bcommtext\b''')
+
+# Attributes holding a list of space-separated values
+LIST_ATTRIBUTES = {'class', 'accesskey', 'dropzone', 'rel', 'rev', 'headers', 'accept-charset',
+                   'archive', 'sizes', 'sandbox', 'for'}
+
+
+def escape_text(text):
+    """ Escape text content """
+
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def format_attribute(name, value):
+    """ Serialize an attribute """
+
+    value = escape_text(value or '')
+    if name in LIST_ATTRIBUTES:
+        value = ' '.join(value.split())
+
+    # Quote with double quotes, unless the value contains some
+    quote = '"'
+    if '"' in value:
+        if "'" in value:
+            value = value.replace('"', '&quot;')
+        else:
+            quote = "'"
+
+    return f' {name}={quote}{value}{quote}'
+
+
+def format_start_tag(tag, attrs, closed=True):
+    """ Serialize a start tag, closed void elements are serialized as <br/> """
+
+    # Duplicate attributes: the last value wins, attributes are sorted by name
+    attrs = sorted(dict(attrs).items())
+
+    return '<%s%s%s>' % (tag, ''.join(format_attribute(name, value) for name, value in attrs),
+                         '/' if closed and tag in VOID_ELEMENTS else '')
+
+
+def is_comment_row(tag, attrs):
+    """ Check if a tag is a comment row: a tr whose class is exactly "athing comtr" (not hidden or collapsed) """
+
+    return tag == 'tr' and ' '.join((dict(attrs).get('class') or '').split()) == 'athing comtr'
+
+
+def has_class(attrs, name):
+    """ Check if the class attribute of a tag contains `name` """
+
+    for key, value in attrs:
+        if key == 'class' and value and name in value.split():
+            return True
+
+    return False
+
+
+def get_hn_id(href):
+    """ Get the comment id from the link of its age """
+
+    if href is None:
+        return None
+
+    return href.split('=')[-1]
+
+
+class CommentStreamParser(HTMLParser):
+    """
+        Tree-free comment extractor
+        Only the stack of open tag names and the current comment are kept, completed comments
+        are collected in `comments` until the caller consumes them.
+        Tags are opened and closed the way BeautifulSoup does with html.parser:
+        end tags close the most recent open tag with the same name (and every tag opened after it),
+        end tags without a matching open tag are ignored, and void elements (<br>) are closed right away,
+        unless they are self-closed (<br/>) after another one was (then they stay open, like in BeautifulSoup).
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.comments = []
+        self.row = None
+
+        # Void elements closed without an end tag, their end tags are ignored
+        self.already_closed = []
+
+    def handle_starttag(self, tag, attrs, close_void=True):
+        row = self.row
+        closed = tag in VOID_ELEMENTS and close_void
+
+        if is_comment_row(tag, attrs):
+            self.row = row = self.new_row(len(self.stack))
+
+        elif row is not None:
+            capture = row['capture']
+            if capture is not None:
+                # Inside the comment, serialize the tag
+                if capture['name'] == 'html':
+                    capture['parts'].append(format_start_tag(tag, attrs, closed))
+                    if tag in VOID_ELEMENTS and not closed:
+                        capture['voids'][len(self.stack)] = len(capture['parts'])
+            elif tag == 'div' and row['html'] is None and has_class(attrs, 'commtext'):
+                row['capture'] = {'name': 'html', 'depth': len(self.stack), 'voids': {},
+                                  'parts': [format_start_tag(tag, attrs)]}
+            elif tag == 'a' and row['user'] is None and has_class(attrs, 'hnuser'):
+                row['capture'] = {'name': 'user', 'depth': len(self.stack), 'parts': []}
+            elif tag == 'span' and 'age' not in row and has_class(attrs, 'age'):
+                row['age'] = len(self.stack)
+            elif tag == 'a' and row.get('age') is not None and row['hn_id'] is None:
+                row['hn_id'] = get_hn_id(dict(attrs).get('href'))
+            elif tag == 'td' and row['indent'] is None:
+                indent = dict(attrs).get('indent')
+                if indent:
+                    row['indent'] = int(indent)
+
+        if closed:
+            self.already_closed.append(tag)
+        else:
+            self.stack.append(tag)
+
+    def new_row(self, depth):
+        """ Start a comment row, `depth` is the position of its tr in the stack """
+
+        return {'depth': depth, 'html': None, 'user': None, 'hn_id': None, 'indent': None, 'capture': None}
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, close_void=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.already_closed:
+            self.already_closed.remove(tag)
+            return
+
+        if tag not in self.stack:
+            return
+
+        index = len(self.stack) - 1 - self.stack[::-1].index(tag)
+        while len(self.stack) > index:
+            self.close_tag(self.stack.pop())
+
+    def handle_data(self, data):
+        capture = self.row and self.row['capture']
+        if capture is not None:
+            capture['parts'].append(escape_text(data) if capture['name'] == 'html' else data)
+
+    def close_tag(self, tag):
+        """ Close the last open tag """
+
+        row = self.row
+        if row is None:
+            return
+
+        depth = len(self.stack)
+        capture = row['capture']
+        if capture is not None:
+            if capture['name'] == 'html':
+                parts = capture['parts']
+                if capture['voids'].pop(depth, None) == len(parts):
+                    # Void element left open but without content
+                    parts[-1] = parts[-1][:-1] + '/>'
+                else:
+                    parts.append(f'</{tag}>')
+
+            if depth == capture['depth']:
+                row[capture['name']] = ''.join(capture['parts'])
+                row['capture'] = None
+
+        if row.get('age') == depth:
+            row['age'] = None
+
+        if depth == row['depth']:
+            self.end_row()
+
+    def end_row(self):
+        """ Collect the current comment """
+
+        row = self.row
+        self.comments.append((row['html'] or 'None', row['user'], row['hn_id'], row['indent'] or 0))
+        self.row = None
+
+    def close(self):
+        super().close()
+
+        # Close the tags left open at the end of the document
+        while self.stack:
+            self.close_tag(self.stack.pop())
+
+
+def parse_stream(source):
+    """
+        Extract comments from a page with the streaming parser
+        `source` is the page content, or an iterable of chunks of it
+    """
+
+    chunks = [source] if isinstance(source, str) else source
+
+    parser = CommentStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+
+        yield from parser.comments
+        parser.comments.clear()
+
+    parser.close()
+    yield from parser.comments
+
+
+def xpath_class(tag, name):
+    """ XPath selecting descendant `tag` elements whose class contains `name` """
+
+    return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+
+
+def serialize_comment(source, row, comment):
+    """
+        Serialize the commtext div of a comment from its source, the way BeautifulSoup does
+        `source` starts at the div and `row`/`comment` are the lxml elements of the comment row and div.
+        The lxml tree can't be serialized directly: unlike html.parser, lxml closes unclosed <p> and <i> tags
+        at the next paragraph.
+    """
+
+    parser = CommentStreamParser()
+
+    # Resume parsing with the tags opened before the div
+    parser.stack = [element.tag for element in reversed(list(comment.iterancestors()))]
+    parser.row = parser.new_row(len(list(row.iterancestors())))
+
+    parser.feed(source)
+    parser.close()
+
+    return parser.comments[0][0]
+
+
+def parse_lxml(source):
+    """
+        Extract comments from a page with lxml
+        Users, ids and indents are read from the lxml tree, comment bodies are serialized from the source
+    """
+
+    # Optional dependency, only needed for this backend
+    from lxml import html as lxml_html
+
+    tree = lxml_html.document_fromstring(source)
+    rows = [row for row in tree.iter('tr') if is_comment_row(row.tag, row.items())]
+
+    # Offsets of the comment rows in the source
+    offsets = [match.start() for match in ROW_PATTERN.finditer(source)] + [len(source)]
+    if len(offsets) - 1 != len(rows):
+        # Unexpected markup, the rows can't be matched with the source
+        yield from parse_stream(source)
+        return
+
+    for i, row in enumerate(rows):
+        comment = row.xpath(xpath_class('div', 'commtext'))
+        user = row.xpath(xpath_class('a', 'hnuser'))
+        age = row.xpath(xpath_class('span', 'age'))
+        link = age[0].find('.//a') if age else None
+        indent = row.xpath('.//td[@indent]')
+
+        comment_html = 'None'
+        if comment:
+            match = COMMTEXT_PATTERN.search(source, offsets[i], offsets[i + 1])
+            fragment = source[match.start():offsets[i + 1]] if match else None
+
+            if fragment is None or '/>' in fragment:
+                # Self-closed tags depend on the void elements seen before in the page
+                # (or the div can't be found in the source), let the stream parser handle the rest of the page
+                yield from islice(parse_stream(source), i, None)
+                return
+
+            comment_html = serialize_comment(fragment, row, comment[0])
+
+        yield (
+            comment_html,
+            user[0].text_content() if user else None,
+            get_hn_id(link.get('href')) if link is not None else None,
+            int(indent[0].get('indent')) if indent and indent[0].get('indent') else 0,
+        )
@@ -0,0 +1,134 @@
+import contextlib
+import cProfile
+import hmac
+import os
+import re
+import threading
+from datetime import datetime
+from urllib.parse import parse_qs
+
+"""
+    Opt-in profiling of single requests of the application and of runs of the CLI tools, with cProfile.
+
+    - HN_JOBS_PROFILE=1 profiles every request, and every run of fetch_job_postings and auto_discard
+    - HN_JOBS_PROFILE_TOKEN=<token> profiles the requests of trusted clients sending the token,
+      in the X-Profile-Token header or the `profile` query parameter
+
+    Profiles are saved in the pstats format to HN_JOBS_PROFILE_DIR (src/data/profiles by default),
+    which keeps the HN_JOBS_PROFILE_KEEP (50) latest ones. Read them with `python -m pstats <file>`,
+    or render them as a flame graph with tools reading pstats files (snakeviz, flameprof...).
+"""
+
+ENABLED = os.environ.get('HN_JOBS_PROFILE', '') == '1'
+TOKEN = os.environ.get('HN_JOBS_PROFILE_TOKEN') or None
+
+PROFILE_DIR = os.environ.get('HN_JOBS_PROFILE_DIR') or os.path.dirname(os.path.realpath(__file__)) + '/data/profiles'
+PROFILE_KEEP = int(os.environ.get('HN_JOBS_PROFILE_KEEP') or 50)
+
+TOKEN_HEADER = 'x-profile-token'
+TOKEN_PARAMETER = 'profile'
+
+# Characters kept in the names of profiles
+NAME_PATTERN = re.compile(r'[^a-zA-Z0-9_.-]+')
+
+# cProfile hooks the interpreter of the thread: a single request is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def save_profile(profiler, name):
+    """ Save the stats of a profiler to the profiles directory, removing the oldest profiles, returns the file name """
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    # File names sort by date
+    file_name = '%s-%s.prof' % (datetime.now().strftime('%Y%m%d-%H%M%S-%f'), NAME_PATTERN.sub('_', name).strip('_'))
+    profiler.dump_stats(os.path.join(PROFILE_DIR, file_name))
+
+    profiles = sorted(entry for entry in os.listdir(PROFILE_DIR) if entry.endswith('.prof'))
+    for old in profiles[:max(len(profiles) - PROFILE_KEEP, 0)]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(PROFILE_DIR, old))
+
+    return file_name
+
+
+@contextlib.contextmanager
+def profiled(name):
+    """ Profile the block when profiling is enabled (HN_JOBS_PROFILE=1), as `with profiled('auto_discard'):` """
+
+    if not ENABLED:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        print(f'$ Profile saved to {os.path.join(PROFILE_DIR, save_profile(profiler, name))}')
+
+
+def is_requested(scope):
+    """ Check if a request asks to be profiled: always when enabled, else if it carries the token """
+
+    if ENABLED:
+        return True
+
+    if TOKEN is None:
+        return False
+
+    token = None
+    for key, value in scope['headers']:
+        if key == TOKEN_HEADER.encode():
+            token = value.decode('latin-1')
+            break
+    else:
+        values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(TOKEN_PARAMETER)
+        token = values[0] if values else None
+
+    return token is not None and hmac.compare_digest(token.encode(), TOKEN.encode())
+
+
+class ProfilingMiddleware:
+    """
+        ASGI middleware profiling the requests asking for it (see is_requested)
+        The profile covers the event loop thread while the request is handled: blocking database calls run
+        in the database executor (see helper.db_run) and show up as waits. Concurrent requests may show up too.
+        The name of the saved profile is sent in the X-Profile header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not is_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # Another request is being profiled
+        if not _profile_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = cProfile.Profile()
+        name = '%s %s' % (scope['method'], scope['path'])
+        file_name = None
+
+        async def send_profile(message):
+            nonlocal file_name
+            if message['type'] == 'http.response.start':
+                # The profile ends when the response starts, it would not be complete afterwards
+                profiler.disable()
+                file_name = save_profile(profiler, name)
+                message = {**message, 'headers': list(message['headers']) + [(b'x-profile', file_name.encode())]}
+            await send(message)
+
+        try:
+            profiler.enable()
+            await self.app(scope, receive, send_profile)
+        finally:
+            profiler.disable()
+            if file_name is None:
+                save_profile(profiler, name)
+            _profile_lock.release()
@@ -0,0 +1,86 @@
+import argparse
+
+from .helper import bump_data_version, db_connect, db_init, make_snippet, render_job_text, RENDER_VERSION
+
+"""
+    This utility re-renders the stored Markdown of job postings.
+    Run it after bumping helper.RENDER_VERSION so that rows rendered by an older version are refreshed.
+
+    To run this tool, execute the following command:
+    python -m src.render_jobs
+"""
+
+BATCH_SIZE = 500
+
+
+def render_stale(conn, force=False):
+    """
+        Re-render the Markdown of stale jobs (or all jobs if `force`) on a connection, and return the count
+        The caller commits: database migrations render the jobs stored before rendering at ingest
+    """
+
+    cursor = conn.cursor()
+
+    query_part = ''
+    if not force:
+        query_part = 'AND (render_version IS NULL OR render_version != %d)' % RENDER_VERSION
+
+    count = last_id = 0
+    while True:
+        # Walk the table in batches of ids
+        cursor.execute(f'''
+        SELECT id, job_text
+        FROM jobs
+        WHERE id > ? {query_part}
+        ORDER BY id
+        LIMIT ?
+        ''', (last_id, BATCH_SIZE))
+        rows = cursor.fetchall()
+
+        if not rows:
+            break
+
+        updates = []
+        for (job_id, job_text) in rows:
+            markdown = render_job_text(job_text)
+            updates.append((markdown, make_snippet(markdown), RENDER_VERSION, job_id))
+
+        cursor.executemany(
+            'UPDATE jobs SET job_markdown = ?, job_snippet = ?, render_version = ? WHERE id = ?', updates)
+
+        count += len(rows)
+        last_id = rows[-1][0]
+
+    if count:
+        bump_data_version(conn)
+
+    return count
+
+
+def rerender(force=False):
+    """ Re-render the Markdown of stale jobs (or all jobs if `force`) and return the count """
+
+    conn = db_connect()
+    count = render_stale(conn, force)
+
+    conn.commit()
+    conn.close()
+
+    return count
+
+
+def main(force=False):
+    res = db_init()
+    print(f'$ {res}')
+
+    count = rerender(force=force)
+    print(f'$ {count} jobs re-rendered')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--all', '-a', help='Re-render all jobs, not only the stale ones', action='store_true')
+    args = parser.parse_args()
+
+    main(args.all)
@@ -0,0 +1,204 @@
+import gzip
+import hashlib
+import os
+
+import fastui
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    # Optional dependency, responses are compressed with gzip only without it
+    import brotli
+except ImportError:
+    brotli = None
+
+"""
+    HTTP response helpers of the application:
+     - CompressionMiddleware, compressing responses with brotli or gzip, as accepted by the client
+     - make_etag() and match_etag(), strong validators for conditional GETs
+"""
+
+# Responses smaller than this are sent as is, compression would not save a round trip
+MINIMUM_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Supported content codings, by order of preference
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+# Sources of the application, the content of responses depends on them
+SOURCE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Directories of SOURCE_DIR that are not part of the application
+SOURCE_EXCLUDED = {'__pycache__', 'benchmarks', 'data', 'test'}
+
+
+def hash_sources(directory=SOURCE_DIR):
+    """ Hash of the Python sources of the application, identifying its release """
+
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        # Walked in a stable order
+        dirs[:] = sorted(name for name in dirs if name not in SOURCE_EXCLUDED)
+
+        for name in sorted(files):
+            if name.endswith('.py'):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, directory).encode() + b'\0')
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def make_etag_seed(*parts):
+    """ Seed of the ETags, from what the content of responses depends on besides the data """
+
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+# Seed of the ETags: the same in every worker and across restarts, changed by any release changing the sources
+# or the UI components, so that tags of the previous release are never matched
+ETAG_SEED = make_etag_seed(hash_sources(), fastui.__version__)
+
+
+def parse_accept_encoding(value):
+    """ Get the content codings accepted by a client, by their quality value """
+
+    res = {}
+    for item in (value or '').split(','):
+        (coding, *params) = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        for param in params:
+            (name, _, number) = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        res[coding] = quality
+
+    return res
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """
+        Choose the content coding of a response from the Accept-Encoding header, among `encodings`
+        (ENCODINGS by default, by order of preference), None to send it as is
+    """
+
+    accepted = parse_accept_encoding(accept_encoding)
+    default = accepted.get('*', 0.0)
+
+    best = None
+    best_quality = 0.0
+    for coding in encodings or ENCODINGS:
+        quality = accepted.get(coding, default)
+        if quality > best_quality:
+            best = coding
+            best_quality = quality
+
+    return best
+
+
+def compress(body, coding):
+    """ Compress a response body with a content coding of ENCODINGS """
+
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def make_etag(*parts):
+    """ Strong ETag of a response identified by `parts` (data version, path, filters...) """
+
+    return '"%s"' % hashlib.sha1(repr((ETAG_SEED,) + parts).encode()).hexdigest()
+
+
+def match_etag(if_none_match, etag):
+    """
+        Find the entity tag of an If-None-Match header matching an ETag, with the weak comparison of conditional
+        GETs, None if there is none. The content coding suffixes added by CompressionMiddleware are ignored,
+        the tag is returned as sent: it identifies the representation cached by the client.
+    """
+
+    if not if_none_match:
+        return None
+
+    if if_none_match.strip() == '*':
+        return etag
+
+    opaque = etag.strip('"')
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        value = tag.removeprefix('W/').strip('"')
+        for coding in ENCODINGS:
+            value = value.removesuffix('-' + coding)
+        if value == opaque:
+            return tag
+
+    return None
+
+
+class CompressionMiddleware:
+    """
+        ASGI middleware compressing responses of at least `minimum_size` bytes with brotli or gzip
+        Streaming responses (sent in several parts) and responses already encoded are sent as is.
+        The ETag of a compressed response gets the content coding as suffix, as it is another representation.
+    """
+
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        coding = choose_encoding(Headers(scope=scope).get('accept-encoding'))
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+
+            if message['type'] == 'http.response.start':
+                # Held until the body is known
+                start = message
+                return
+
+            if start is None:
+                await send(message)
+                return
+
+            (start_message, start) = (start, None)
+            headers = MutableHeaders(raw=list(start_message['headers']))
+            body = message.get('body', b'')
+
+            if not message.get('more_body', False) and 'content-encoding' not in headers \
+                    and len(body) >= self.minimum_size:
+                headers.add_vary_header('Accept-Encoding')
+
+                if coding is not None:
+                    body = compress(body, coding)
+                    headers['Content-Encoding'] = coding
+                    headers['Content-Length'] = str(len(body))
+
+                    etag = headers.get('etag')
+                    if etag and etag.endswith('"'):
+                        headers['ETag'] = etag[:-1] + '-' + coding + '"'
+
+                    message = {**message, 'body': body}
+
+                start_message = {**start_message, 'headers': headers.raw}
+
+            await send(start_message)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -21,6 +21,12 @@ class Test(unittest.TestCase):
         self.create_jobs()
 
     def tearDown(self) -> None:
+        # Close pooled connections
+        helper.db_close()
+
+        # The next test creates another database with the same data version
+        JobModel.get_listing_cache().clear()
+
         # Delete the mock database
         if os.path.exists(self.tmp_db_path):
             os.remove(self.tmp_db_path)
@@ -101,6 +107,26 @@ class Test(unittest.TestCase):
         res = JobModel.update(1, 'invalid')
         self.assertFalse(res)
 
+    @patch.object(helper, "get_db_path")
+    def test_update_many(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        # Unknown ids are ignored
+        res = JobModel.update_many([1, 2, 999], 'applied')
+        self.assertEqual(res, 2)
+        for job_id in [1, 2]:
+            job = JobModel.get(job_id)
+            self.assertEqual(job.status, 'applied')
+            self.assertIsInstance(job.applied_at, datetime)
+
+        res = JobModel.update_many([], 'new')
+        self.assertEqual(res, 0)
+
+        with self.assertRaises(ValueError):
+            JobModel.update_many([1], 'invalid')
+        self.assertEqual(JobModel.get(1).status, 'applied')
+
     @patch.object(helper, "get_db_path")
     def test_get_all(self, mock_get_db_path):
         # Mock get_db_path
@@ -117,11 +143,148 @@ class Test(unittest.TestCase):
         jobs = JobModel.get_all(search='other')
         self.assertEqual(len(jobs), 1)
 
+        # Test with a prefix search, best match first
+        jobs = JobModel.get_all(search='tes*')
+        self.assertEqual([job.id for job in jobs], [1, 2])
+
+        # Test with a phrase search
+        jobs = JobModel.get_all(search='"other test"')
+        self.assertEqual(len(jobs), 1)
+        jobs = JobModel.get_all(search='"test other"')
+        self.assertEqual(jobs[0].id, 0)
+
+        # Test with search and status
+        jobs = JobModel.get_all(status='new', search='test')
+        self.assertEqual([job.id for job in jobs], [1])
+
         # Test no result -> should return a default job
         jobs = JobModel.get_all(search='nothing')
         self.assertEqual(len(jobs), 1)
         self.assertEqual(jobs[0].job_text, 'No results.\n')
 
+    @patch.object(helper, "get_db_path")
+    def test_export(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        db_connect().execute("UPDATE jobs SET inserted_at = '2024-09-18 08:00:00' WHERE id = 2")
+        db_connect().commit()
+
+        # Rows are fetched by batches, ordered by id
+        batches = list(JobModel.export(batch_size=1))
+        self.assertEqual([[row[0] for row in rows] for rows in batches], [[1], [2]])
+        self.assertEqual(batches[0][0][:4], (1, 123, 'test_user', 'new'))
+        self.assertEqual(len(batches[0][0]), len(JobModel.EXPORT_COLUMNS))
+
+        def export_ids(**filters):
+            return [row[0] for rows in JobModel.export(**filters) for row in rows]
+
+        # Filters, days are included
+        self.assertEqual(export_ids(status='applied'), [2])
+        self.assertEqual(export_ids(hn_user='unknown_user'), [])
+        self.assertEqual(export_ids(since='2024-09-17'), [2])
+        self.assertEqual(export_ids(until='2024-09-16'), [1])
+        self.assertEqual(export_ids(since='2024-09-16', until='2024-09-18'), [1, 2])
+
+        # Nothing is read until the rows are consumed
+        batches = JobModel.export(status='new')
+        db_connect().execute("UPDATE jobs SET status = 'new' WHERE id = 2")
+        db_connect().commit()
+        self.assertEqual([row[0] for rows in batches for row in rows], [1, 2])
+
+    @patch.object(helper, "get_db_path")
+    def test_get_page(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        # Single page
+        page = JobModel.get_page()
+        self.assertEqual([job.id for job in page.jobs], [1, 2])
+        self.assertEqual([job.job_text for job in page.jobs], ['test', 'other test'])
+        self.assertIsNone(page.prev_cursor)
+        self.assertIsNone(page.next_cursor)
+
+        # Walk forward one job at a time
+        page = JobModel.get_page(page_size=1)
+        self.assertEqual([job.id for job in page.jobs], [1])
+        self.assertIsNone(page.prev_cursor)
+        self.assertEqual(page.next_cursor, '1')
+
+        page = JobModel.get_page(after=page.next_cursor, page_size=1)
+        self.assertEqual([job.id for job in page.jobs], [2])
+        self.assertEqual(page.prev_cursor, '2')
+        self.assertIsNone(page.next_cursor)
+
+        # And back
+        page = JobModel.get_page(before=page.prev_cursor, page_size=1)
+        self.assertEqual([job.id for job in page.jobs], [1])
+        self.assertIsNone(page.prev_cursor)
+        self.assertEqual(page.next_cursor, '1')
+
+        # Filters
+        page = JobModel.get_page(status='applied')
+        self.assertEqual([job.id for job in page.jobs], [2])
+        page = JobModel.get_page(hn_user='unknown_user')
+        self.assertEqual(page, JobModel.JobPage(jobs=[]))
+
+        # Search results are ranked, cursors carry the rank
+        page = JobModel.get_page(search='test', page_size=1)
+        self.assertEqual([job.id for job in page.jobs], [1])
+        self.assertTrue(page.next_cursor.endswith(':1'))
+
+        page = JobModel.get_page(search='test', after=page.next_cursor, page_size=1)
+        self.assertEqual([job.id for job in page.jobs], [2])
+        self.assertIsNone(page.next_cursor)
+
+        # Invalid cursors
+        with self.assertRaises(ValueError):
+            JobModel.get_page(after='invalid')
+        with self.assertRaises(ValueError):
+            JobModel.get_page(after='-1.5:1')
+        with self.assertRaises(ValueError):
+            JobModel.get_page(search='test', after='1')
+
+    @patch.object(helper, "get_db_path")
+    def test_get_listing(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        (page, count) = JobModel.get_listing(status='new')
+        self.assertEqual([job.hn_id for job in page.jobs], [123])
+        self.assertEqual(count, 1)
+
+        # Cached until jobs are written, equivalent searches share the same entry
+        self.assertIs(JobModel.get_listing(status='new')[0], page)
+        self.assertIsNot(JobModel.get_listing(status='applied')[0], page)
+        (page, _) = JobModel.get_listing(search='other')
+        self.assertIs(JobModel.get_listing(search=' "other" ')[0], page)
+
+        version = helper.get_data_version()
+        JobModel.update(2, 'new')
+        self.assertEqual(helper.get_data_version(), version + 1)
+
+        (page, count) = JobModel.get_listing(status='new')
+        self.assertEqual([job.hn_id for job in page.jobs], [123, 124])
+        self.assertEqual(count, 2)
+
+        # Invalid statuses are not written
+        JobModel.update(2, 'invalid')
+        self.assertEqual(helper.get_data_version(), version + 1)
+
+        with self.assertRaises(ValueError):
+            JobModel.get_listing(after='invalid')
+
+    @patch.object(helper, "get_db_path")
+    def test_count(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        self.assertEqual(JobModel.count(), 2)
+        self.assertEqual(JobModel.count(status='applied'), 1)
+        self.assertEqual(JobModel.count(search='other'), 1)
+        self.assertEqual(JobModel.count(hn_user='test_user'), 2)
+        self.assertEqual(JobModel.count(hn_user='unknown_user'), 0)
+
     @patch.object(helper, "get_db_path")
     def test_get_by_user(self, mock_get_db_path):
         # Mock get_db_path
@@ -144,6 +307,41 @@ class Test(unittest.TestCase):
         for job_id in jobs_ids:
             self.assertIsInstance(job_id, int)
 
+    @patch.object(helper, "get_db_path")
+    def test_get_user_summary(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        summary = JobModel.get_user_summary('test_user')
+        self.assertEqual((summary.jobs, summary.new_jobs, summary.applied_jobs), (2, 1, 1))
+        self.assertEqual(summary.get_count('new'), 1)
+        self.assertEqual(summary.get_count('rejected-pre'), 0)
+        self.assertEqual(summary.last_activity_at, datetime(2024, 9, 16, 11, 40, 43))
+
+        JobModel.update(1, 'rejected-pre')
+        summary = JobModel.get_user_summary('test_user')
+        self.assertEqual((summary.new_jobs, summary.get_count('rejected-pre')), (0, 1))
+        self.assertGreater(summary.last_activity_at, datetime(2024, 9, 16, 11, 40, 43))
+
+        self.assertIsNone(JobModel.get_user_summary('unknown_user'))
+
+    @patch.object(helper, "get_db_path")
+    def test_discard_matched(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        version = helper.get_data_version()
+        res = JobModel.discard_matched()
+        self.assertEqual(res, 1)
+        self.assertEqual(JobModel.get(1).status, 'discarded')
+        self.assertEqual(JobModel.get(2).status, 'applied')
+        self.assertEqual(helper.get_data_version(), version + 1)
+
+        # Nothing left to discard
+        self.assertEqual(JobModel.discard_matched(), 0)
+        self.assertEqual(JobModel.get_to_discard(), [])
+        self.assertEqual(helper.get_data_version(), version + 1)
+
     def test_format_job(self):
         job = {
             'id': 1,
@@ -155,3 +353,43 @@ class Test(unittest.TestCase):
         self.assertEqual(res.id, 1)
         self.assertEqual(res.hn_id, 123)
         self.assertEqual(res.hn_user, 'test')
+
+        # Stored markdown is used as is
+        job['job_text'] = '<p>raw</p>'
+        job['job_markdown'] = 'rendered\n'
+        res = JobModel.format_job(job)
+        self.assertEqual(res.job_text, 'rendered\n')
+
+    @patch.object(helper, "get_db_path")
+    def test_format_row(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        JobModel.update(2, 'applied')
+        conn = db_connect()
+        conn.execute("UPDATE jobs SET job_markdown = 'rendered\n' WHERE id = 1")
+        rows = conn.execute('SELECT %s FROM jobs j ORDER BY j.id' % JobModel.JOB_COLUMNS).fetchall()
+
+        # Same jobs as format_job, timestamps are parsed
+        for row in rows:
+            res = JobModel.format_row(row)
+            self.assertEqual(res, JobModel.format_job(dict(row)))
+            self.assertIsInstance(res.inserted_at, datetime)
+
+        self.assertEqual(JobModel.format_row(rows[0]).job_text, 'rendered\n')
+        self.assertEqual(JobModel.format_row(rows[1]).job_text, 'other test\n')
+        self.assertIsInstance(JobModel.format_row(rows[1]).applied_at, datetime)
+
+    @patch.object(helper, "get_db_path")
+    def test_format_list_row(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        conn = db_connect()
+        conn.execute("UPDATE jobs SET job_snippet = 'Acme | Engineer' WHERE id = 1")
+        rows = conn.execute('SELECT %s FROM jobs j ORDER BY j.id' % JobModel.LIST_COLUMNS).fetchall()
+
+        # The full text is only read for jobs without a snippet
+        self.assertIsNone(rows[0]['job_text'])
+        self.assertEqual(JobModel.format_list_row(rows[0]).job_text, 'Acme | Engineer')
+        self.assertEqual(JobModel.format_list_row(rows[1]).job_text, 'other test')
@@ -0,0 +1,178 @@
+import csv
+import io
+import json
+import os
+from urllib.parse import parse_qs
+
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from .. import app
+from .. import helper
+from ..models import JobModel
+
+
+class Test(unittest.TestCase):
+
+    tmp_db_path = '/tmp/mock.db'
+
+    def setUp(self) -> None:
+        # Mock get_db_path
+        patcher = patch.object(helper, 'get_db_path', return_value=self.tmp_db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # The database is initialized when the application starts
+        self.client = TestClient(app.app)
+        self.client.__enter__()
+
+        self.create_jobs()
+
+    def tearDown(self) -> None:
+        self.client.__exit__(None, None, None)
+
+        # Close pooled connections
+        helper.db_close()
+
+        JobModel.get_listing_cache().clear()
+
+        # Delete the mock database
+        if os.path.exists(self.tmp_db_path):
+            os.remove(self.tmp_db_path)
+
+    def create_jobs(self):
+        conn = helper.db_connect()
+        for hn_id, status in [(1, 'new'), (2, 'new'), (3, 'applied')]:
+            conn.execute("""
+            INSERT INTO jobs (hn_id, hn_user, job_text, job_markdown, job_snippet, render_version, inserted_at, status)
+            VALUES (?, 'test_user', '<p>Python developer</p>', 'Python developer\n', 'Python developer', ?,
+                '2024-09-16T11:40:43', ?)
+            """, (hn_id, helper.RENDER_VERSION, status))
+        conn.commit()
+        conn.close()
+
+    def get_heading(self, response):
+        """ Heading of a listing page, e.g. "Jobs listings (new)" """
+
+        self.assertEqual(response.status_code, 200)
+        return response.json()[0]['components'][0]['text']
+
+    def get_filters(self):
+        """ Filters saved in the cookie of the client (quoted by Starlette as it contains '=') """
+
+        return parse_qs((self.client.cookies.get(app.FILTERS_COOKIE) or '').strip('"'))
+
+    def test_users_table_filters_cookie(self):
+        # No filters, no cookie
+        self.assertEqual(self.get_heading(self.client.get('/api/')), 'Jobs listings (all)')
+        self.assertEqual(self.get_filters(), {})
+
+        # Filters of the request are saved
+        response = self.client.get('/api/', params={'status': 'applied', 'search': 'python'})
+        self.assertEqual(self.get_heading(response), 'Jobs listings (applied)')
+        self.assertIn('httponly', response.headers['set-cookie'].lower())
+        self.assertEqual(self.get_filters(), {'status': ['applied'], 'search': ['python']})
+
+        # and used by the next requests without filters
+        self.assertEqual(self.get_heading(self.client.get('/api/')), 'Jobs listings (applied)')
+
+        # Query parameters override the cookie
+        response = self.client.get('/api/', params={'status': 'new'})
+        self.assertEqual(self.get_heading(response), 'Jobs listings (new)')
+        self.assertEqual(self.get_filters(), {'status': ['new'], 'search': ['python']})
+
+        # Clearing the filters deletes the cookie
+        response = self.client.get('/api/', params={'clear_cache': '1'})
+        self.assertEqual(self.get_heading(response), 'Jobs listings (all)')
+        self.assertIsNone(self.client.cookies.get(app.FILTERS_COOKIE))
+
+    def test_users_table_no_results(self):
+        response = self.client.get('/api/', params={'search': 'rust'})
+        self.assertEqual(self.get_heading(response), 'Jobs listings (all)')
+
+        table = next(component for component in response.json()[0]['components'] if component['type'] == 'Table')
+        self.assertEqual(table['data'], [])
+        self.assertEqual(table['noDataMessage'], 'No results.')
+
+    def test_users_table_filters_cookie_truncated(self):
+        self.client.get('/api/', params={'search': 'python ' * 100})
+        self.assertEqual(self.get_filters()['search'], [('python ' * 100)[:helper.FILTER_MAX_LENGTH]])
+
+        # Unknown or oversized values of a forged cookie are ignored or truncated
+        self.client.cookies.set(app.FILTERS_COOKIE, 'status=new&other=1&search=' + 'a' * 1000, domain='testserver.local')
+        response = self.client.get('/api/')
+        self.assertEqual(self.get_heading(response), 'Jobs listings (new)')
+        self.assertEqual(self.get_filters(), {'status': ['new'], 'search': ['a' * helper.FILTER_MAX_LENGTH]})
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/', headers={'Accept-Encoding': 'identity'})
+        etag = response.headers['etag']
+        self.assertEqual(response.headers['cache-control'], 'private, no-cache')
+
+        # Unchanged page: 304 without a body
+        response = self.client.get('/api/', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['etag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # Other request, other page
+        response = self.client.get('/api/?status=new', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['etag'], etag)
+        self.client.get('/api/?clear_cache=1')
+
+        # Compressed page, revalidated with the tag of the compressed representation
+        response = self.client.get('/api/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        gzip_etag = response.headers['etag']
+        self.assertEqual(gzip_etag, etag[:-1] + '-gzip"')
+
+        response = self.client.get('/api/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzip_etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['etag'], gzip_etag)
+
+        # Jobs written: the page is built again
+        self.client.post('/api/jobs/status', json={'ids': [1], 'status': 'applied'})
+        response = self.client.get('/api/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzip_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['etag'], gzip_etag)
+
+    def test_update_statuses(self):
+        response = self.client.post('/api/jobs/status', json={'ids': [1, 2, 404], 'status': 'discarded'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual([job.status for job in JobModel.get_all()], ['discarded', 'discarded', 'applied'])
+
+        # 1 to 10000 ids
+        self.assertEqual(self.client.post('/api/jobs/status', json={'ids': [3] * 10000, 'status': 'new'}).json(),
+                         {'updated': 1})
+        for ids in [[], [1] * 10001]:
+            response = self.client.post('/api/jobs/status', json={'ids': ids, 'status': 'new'})
+            self.assertEqual(response.status_code, 422)
+
+        # Invalid status or ids
+        for body in [{'ids': [1], 'status': 'unknown'}, {'ids': ['a'], 'status': 'new'}, {'ids': [1]}]:
+            response = self.client.post('/api/jobs/status', json=body)
+            self.assertEqual(response.status_code, 422)
+
+        self.assertEqual([job.status for job in JobModel.get_all()], ['discarded', 'discarded', 'new'])
+
+    def test_export(self):
+        for accept_encoding, encoding in [('gzip', 'gzip'), ('*', 'gzip'), ('gzip;q=0', None), ('br', None),
+                                          ('identity', None)]:
+            response = self.client.get('/api/export', params={'status': 'new'},
+                                       headers={'Accept-Encoding': accept_encoding})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers.get('content-encoding'), encoding)
+            self.assertEqual(response.headers['vary'], 'Accept-Encoding')
+
+            # Decoded by the client
+            lines = response.text.splitlines()
+            self.assertEqual([json.loads(line)['hn_id'] for line in lines], [1, 2])
+
+        response = self.client.get('/api/export', params={'format': 'csv'}, headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(response.headers['content-type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len(list(csv.reader(io.StringIO(response.text)))), 4)
+
+        self.assertEqual(self.client.get('/api/export', params={'status': 'unknown'}).status_code, 400)
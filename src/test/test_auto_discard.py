@@ -20,6 +20,9 @@ class Test(unittest.TestCase):
         self.create_jobs()
 
     def tearDown(self) -> None:
+        # Close pooled connections
+        helper.db_close()
+
         # Delete the mock database
         if os.path.exists(self.tmp_db_path):
             os.remove(self.tmp_db_path)
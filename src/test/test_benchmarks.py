@@ -0,0 +1,96 @@
+import unittest
+
+from .. import fetch_job_postings
+from .. import helper
+from ..benchmarks import export, ingest, listing, load_test, resolve_email, startup
+
+
+class Test(unittest.TestCase):
+
+    def test_generate_thread(self):
+        (source, comments) = ingest.generate_thread(50, replies=2.0)
+        self.assertEqual(ingest.generate_thread(50, replies=2.0), (source, comments))
+
+        # Comments are found by every parser backend, replies are mixed in
+        expected = list(fetch_job_postings.parse_comments(source, 'html.parser'))
+        self.assertEqual(len(expected), comments)
+        self.assertEqual(len([comment for comment in expected if comment[3] == 0]), 50)
+        self.assertGreater(comments, 50)
+
+        for parser in ['lxml', 'stream']:
+            self.assertEqual(list(fetch_job_postings.parse_comments(source, parser)), expected)
+
+        # Without replies
+        (source, comments) = ingest.generate_thread(10, replies=0)
+        self.assertEqual(comments, 10)
+
+    def test_run(self):
+        res = ingest.run([5], memory=False)
+
+        self.assertEqual(len(res['sizes']), 1)
+        stages = res['sizes'][0]['stages']
+        self.assertEqual(list(stages)[:4], ['soup', 'get_all_comments', 'is_reply', 'parse_from_comment'])
+        self.assertIn('save_jobs', stages)
+        self.assertIsNone(stages['save_jobs']['peak_bytes'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(load_test.percentile(values, 50), 50)
+        self.assertEqual(load_test.percentile(values, 99), 99)
+        self.assertEqual(load_test.percentile([7], 95), 7)
+        self.assertIsNone(load_test.percentile([], 50))
+
+    def test_load_test(self):
+        report = load_test.run(jobs=50, concurrency=2, duration=0.5)
+
+        self.assertEqual(set(report['scenarios']), {name for name, _, _ in load_test.SCENARIOS})
+        self.assertGreater(report['total']['requests'], 0)
+        self.assertEqual(report['total']['errors'], 0)
+
+    def test_listing(self):
+        (count, results) = listing.run(jobs=60, repeat=2)
+
+        self.assertEqual(count, 50)
+        self.assertEqual(list(results), ['format_job', 'model_construct', 'format_row', 'get_page', 'users_table'])
+        for res in results.values():
+            self.assertGreater(res['cpu_us'], 0)
+            self.assertGreater(res['peak_bytes'], 0)
+
+    def test_export(self):
+        results = export.run([20, 40])
+
+        self.assertEqual(list(results), [20, 40])
+        for scenarios in results.values():
+            self.assertEqual(list(scenarios), list(export.SCENARIOS))
+            self.assertGreater(scenarios['ndjson']['size'], scenarios['ndjson.gz']['size'])
+            for res in scenarios.values():
+                self.assertGreater(res['peak_bytes'], 0)
+
+    def test_parse_importtime(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   _json\n'
+            'import time:      1500 |       1620 | json\n'
+            'Traceback (most recent call last):\n'
+        )
+        self.assertEqual(startup.parse_importtime(output), {'_json': 120, 'json': 1620})
+
+    def test_startup(self):
+        results = startup.run(1, {name: startup.ENTRY_POINTS[name] for name in ['app', 'auto_discard']})
+
+        self.assertGreater(results['app']['import_ms'], 0)
+        self.assertGreater(results['app']['modules'], results['auto_discard']['modules'])
+
+        # Entry points only load what they use
+        self.assertNotIn('uvicorn', results['app']['heavy'])
+        for heavy in ['fastapi', 'html2text', 'cacheout', 'asyncio']:
+            self.assertNotIn(heavy, results['auto_discard']['heavy'])
+
+    def test_resolve_email_legacy(self):
+        # Same results as before on the sample thread, except for names with dots (fixed)
+        for text in resolve_email.load_texts():
+            res = helper.resolve_email(text)
+            if 'julia.pitts' in text:
+                self.assertTrue(res.endswith('julia.pitts@vestwell.com'))
+                continue
+            self.assertEqual(res, resolve_email.resolve_email_legacy(text))
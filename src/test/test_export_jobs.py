@@ -0,0 +1,151 @@
+import csv
+import gzip
+import io
+import json
+import os
+import threading
+import zlib
+
+import unittest
+from unittest.mock import patch
+
+from .. import export_jobs
+from .. import helper
+from ..helper import db_connect, db_init
+from ..models import JobModel
+
+
+class Test(unittest.TestCase):
+
+    tmp_db_path = '/tmp/mock.db'
+
+    def setUp(self) -> None:
+        # Initialize the database
+        self.initialize_db()
+
+        # Create jobs
+        self.create_jobs()
+
+    def tearDown(self) -> None:
+        # Close pooled connections
+        helper.db_close()
+
+        # Delete the mock database
+        if os.path.exists(self.tmp_db_path):
+            os.remove(self.tmp_db_path)
+
+    @patch.object(helper, "get_db_path")
+    def initialize_db(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        # Initialize the database
+        db_init()
+
+    @patch.object(helper, "get_db_path")
+    def create_jobs(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        conn = db_connect()
+        cursor = conn.cursor()
+
+        jobs = [
+            (123, 'test_user', '<p>Acme, "quoted"</p>', 'Acme, "quoted"\n', 'new'),
+            (124, 'test_user', '<p>Ünïcode</p>', 'Ünïcode\n', 'applied'),
+            (125, 'other_user', '<p>Line<p>break</p>', 'Line\n\nbreak\n', 'new'),
+        ]
+
+        for job in jobs:
+            cursor.execute("""
+            INSERT INTO jobs (hn_id, hn_user, job_text, job_markdown, inserted_at, status)
+            VALUES (?, ?, ?, ?, '2024-09-16 11:40:43', ?)
+            """, job)
+
+        conn.commit()
+        conn.close()
+
+    def read(self, chunks):
+        return b''.join(chunks).decode()
+
+    @patch.object(helper, "get_db_path")
+    def test_export_ndjson(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        lines = self.read(export_jobs.export('ndjson')).splitlines()
+        jobs = [json.loads(line) for line in lines]
+        self.assertEqual([job['hn_id'] for job in jobs], [123, 124, 125])
+        self.assertEqual(list(jobs[0]), list(JobModel.EXPORT_COLUMNS))
+        self.assertEqual(jobs[1]['job_markdown'], 'Ünïcode\n')
+        self.assertEqual(jobs[2]['job_text'], '<p>Line<p>break</p>')
+
+        # Filters
+        lines = self.read(export_jobs.export('ndjson', hn_user='other_user')).splitlines()
+        self.assertEqual([json.loads(line)['hn_id'] for line in lines], [125])
+        self.assertEqual(self.read(export_jobs.export('ndjson', status='discarded')), '')
+
+    @patch.object(helper, "get_db_path")
+    def test_export_csv(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        # One chunk per batch
+        chunks = list(export_jobs.export('csv', batch_size=2))
+        self.assertEqual(len(chunks), 2)
+
+        rows = list(csv.reader(io.StringIO(self.read(chunks))))
+        self.assertEqual(rows[0], list(JobModel.EXPORT_COLUMNS))
+        self.assertEqual([row[1] for row in rows[1:]], ['123', '124', '125'])
+        self.assertEqual(rows[1][8], 'Acme, "quoted"\n')
+
+        # Header only
+        res = self.read(export_jobs.export('csv', status='discarded'))
+        self.assertEqual(res, ','.join(JobModel.EXPORT_COLUMNS) + '\r\n')
+
+    @patch.object(helper, "get_db_path")
+    def test_export_gzip(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        chunks = list(export_jobs.export('ndjson', compress=True))
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b''.join(export_jobs.export('ndjson')))
+
+        # Batches are flushed as they come
+        self.assertEqual(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(chunks[0]).count(b'\n'), 3)
+
+        with self.assertRaises(ValueError):
+            export_jobs.export('xml')
+
+    @patch.object(helper, "get_db_path")
+    def test_export_threads(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        # A streaming response resumes the export from any worker thread
+        chunks = export_jobs.export('ndjson', batch_size=1)
+        res = [next(chunks)]
+
+        def resume():
+            res.extend(chunks)
+
+        thread = threading.Thread(target=resume)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(len(res), 3)
+
+    @patch.object(helper, "get_db_path")
+    def test_main(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        output = '/tmp/mock_export.csv.gz'
+        try:
+            export_jobs.main('csv', True, output, status='new')
+            with gzip.open(output, 'rt', newline='') as f:
+                rows = list(csv.reader(f))
+        finally:
+            os.remove(output)
+
+        self.assertEqual([row[1] for row in rows[1:]], ['123', '125'])
@@ -1,28 +1,332 @@
+import json
 import os
+import threading
+import time
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
 
 import unittest
+from unittest.mock import patch
 from bs4 import BeautifulSoup
 
 from .. import fetch_job_postings
+from .. import helper
+from .. import metrics
+
+
+def split_thread(source, pages):
+    """ Split a thread into `pages` pages linked with "More" links, like Hacker News does """
+
+    start = source.index("<tr class='athing comtr'")
+    end = source.index('</table>\n  <br><br>', source.rindex("<tr class='athing comtr'"))
+    prefix, rows, suffix = source[:start], source[start:end], source[end:]
+
+    # Split the comment rows in chunks
+    rows = ["<tr class='athing comtr'" + row for row in rows.split("<tr class='athing comtr'")[1:]]
+    size = -(-len(rows) // pages)
+
+    res = []
+    for page in range(pages):
+        more = ''
+        if page < pages - 1:
+            more = '<a href="item?id=41425910&amp;p=%d" class="morelink" rel="next">More</a>' % (page + 2)
+        res.append(prefix + ''.join(rows[page * size:(page + 1) * size]) + suffix.replace('<br><br>', more, 1))
+
+    return res
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Serve the pages of a thread, pages past the last one are 404s """
+
+    pages = []
+    requests = []
+    failures = {}
+
+    def do_GET(self):
+        page = int(parse_qs(urlsplit(self.path).query).get('p', ['1'])[0])
+        self.requests.append(page)
+
+        # Fail the first requests of some pages
+        if self.failures.get(page):
+            self.failures[page] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if page > len(self.pages):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        # Conditional requests
+        body = self.pages[page - 1].encode()
+        etag = '"%s"' % helper.hash_text(self.pages[page - 1])
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_thread(pages):
+    """ Start a stub server serving `pages`, returns the server, its thread and the URL of the thread """
+
+    StubHandler.pages = pages
+    StubHandler.requests = []
+    StubHandler.failures = {}
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    return (server, thread, 'http://127.0.0.1:%d/item?id=41425910' % server.server_port)
+
+
+def stop_server(server, thread):
+    server.shutdown()
+    server.server_close()
+    thread.join()
 
 
 class Test(unittest.TestCase):
 
     thread_html_path = os.path.dirname(__file__) + '/assets/thread.html'
     comment_html_path = os.path.dirname(__file__) + '/assets/comment.html'
+    tmp_db_path = '/tmp/mock.db'
+
+    def tearDown(self) -> None:
+        # Close pooled connections
+        helper.db_close()
+
+        # Delete the mock database
+        if os.path.exists(self.tmp_db_path):
+            os.remove(self.tmp_db_path)
 
     def test_load_url(self):
         res = fetch_job_postings.load_url('http://perdu.com')
         self.assertTrue(res.startswith('<html><head>'))
 
+    def test_load_pages(self):
+        source = fetch_job_postings.load_file(self.thread_html_path)
+        (server, thread, url) = serve_thread(split_thread(source, 3))
+        StubHandler.failures = {2: 1}
+
+        try:
+            res = fetch_job_postings.load_pages(url, workers=3, delay=0)
+        finally:
+            stop_server(server, thread)
+
+        # All pages are loaded, in order, the page past the last one (404) is ignored
+        self.assertEqual(res, StubHandler.pages)
+
+        # Page 2 was retried, no page past the last one was requested
+        self.assertEqual(sorted(StubHandler.requests), [1, 2, 2, 3])
+
+        # All comments are found across pages
+        count = 0
+        for page in res:
+            soup = BeautifulSoup(page, 'html.parser')
+            count += len(fetch_job_postings.get_all_comments(soup))
+        self.assertEqual(count, 474)
+
+    def test_load_pages_requests(self):
+        source = fetch_job_postings.load_file(self.thread_html_path)
+
+        # Comment count of the thread missing, too high or too low: "More" links are followed,
+        # pages past the last one are not requested
+        for count, delay in [('', 0), ('5000&nbsp;comments', 0.1), ('10&nbsp;comments', 0)]:
+            pages = [page.replace('484&nbsp;comments', count) for page in split_thread(source, 3)]
+            (server, thread, url) = serve_thread(pages)
+
+            try:
+                res = fetch_job_postings.load_pages(url, delay=delay)
+            finally:
+                stop_server(server, thread)
+
+            self.assertEqual(res, pages)
+            self.assertEqual(sorted(StubHandler.requests), [1, 2, 3])
+
+        # Default settings on a 2-page thread
+        (server, thread, url) = serve_thread(split_thread(source, 2))
+
+        try:
+            start = time.monotonic()
+            res = fetch_job_postings.load_pages(url)
+            elapsed = time.monotonic() - start
+        finally:
+            stop_server(server, thread)
+
+        self.assertEqual(len(res), 2)
+        self.assertEqual(StubHandler.requests, [1, 2])
+        self.assertLess(elapsed, 2 * fetch_job_postings.REQUEST_DELAY)
+
+    @patch.object(helper, "get_db_path")
+    def test_fetch_pages_incremental(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+        helper.db_init()
+
+        source = fetch_job_postings.load_file(self.thread_html_path)
+        (server, thread, url) = serve_thread(split_thread(source, 3))
+
+        try:
+            # First run: every page is downloaded
+            pages = fetch_job_postings.fetch_pages(url, workers=3, delay=0)
+            self.assertEqual([page.source for page in pages], StubHandler.pages)
+            self.assertTrue(all(page.modified for page in pages))
+
+            fetch_job_postings.save_page_states(41425910, pages)
+            states = fetch_job_postings.get_page_states(41425910)
+            self.assertEqual(sorted(states), [1, 2, 3])
+            self.assertEqual(states[3]['etag'], pages[2].etag)
+            self.assertFalse(states[3]['has_more'])
+
+            # Unchanged thread: a single conditional request
+            StubHandler.requests = []
+            pages = fetch_job_postings.fetch_pages(url, workers=3, delay=0, states=states)
+            self.assertEqual(StubHandler.requests, [1])
+            self.assertEqual(len(pages), 1)
+            self.assertIsNone(pages[0].source)
+            self.assertFalse(pages[0].modified)
+
+            # Unchanged states are not written again
+            conn = helper.db_connect()
+            changes = conn.total_changes
+            fetch_job_postings.save_page_states(41425910, pages)
+            self.assertEqual(conn.total_changes, changes)
+
+            # A comment added to the first page: only the first page is downloaded again
+            StubHandler.pages[0] = StubHandler.pages[0].replace('</table>', '<tr><td>New</td></tr></table>', 1)
+            pages = fetch_job_postings.fetch_pages(url, workers=3, delay=0, states=states)
+            self.assertEqual([page.modified for page in pages], [True, False, False])
+            self.assertEqual([page.source is None for page in pages], [False, True, True])
+            self.assertEqual(pages[0].source, StubHandler.pages[0])
+        finally:
+            stop_server(server, thread)
+
+    @patch.object(fetch_job_postings, "is_hacker_news_url", return_value=True)
+    @patch.object(fetch_job_postings, "backup_db_file", return_value='Backup skipped')
+    @patch.object(helper, "get_db_path")
+    def test_main_incremental(self, mock_get_db_path, mock_backup_db_file, mock_is_hacker_news_url):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        source = fetch_job_postings.load_file(self.thread_html_path)
+        (server, thread, url) = serve_thread(split_thread(source, 2))
+
+        try:
+            with patch('builtins.print'):
+                fetch_job_postings.main(url, workers=2, delay=0)
+                conn = helper.db_connect()
+                count = conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+                changes = conn.total_changes
+
+                # Unchanged thread: one request, no writes
+                StubHandler.requests = []
+                fetch_job_postings.main(url, workers=2, delay=0)
+                self.assertEqual(StubHandler.requests, [1])
+                self.assertEqual(conn.total_changes, changes)
+
+                # Full run: every page is parsed again
+                StubHandler.requests = []
+                fetch_job_postings.main(url, workers=2, delay=0, full=True)
+                self.assertIn(2, StubHandler.requests)
+        finally:
+            stop_server(server, thread)
+
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0], count)
+        self.assertGreater(count, 0)
+
+    @patch.object(fetch_job_postings, "is_hacker_news_url", return_value=True)
+    @patch.object(fetch_job_postings, "backup_db_file", return_value="No database to backup")
+    @patch.object(helper, "get_db_path")
+    def test_main_metrics(self, mock_get_db_path, mock_backup_db_file, mock_is_hacker_news_url):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        source = fetch_job_postings.load_file(self.thread_html_path)
+        (server, thread, url) = serve_thread(split_thread(source, 2))
+
+        output = '/tmp/mock_metrics.json'
+        try:
+            with patch('builtins.print'):
+                fetch_job_postings.main(url, workers=2, delay=0, metrics_output=output)
+            with open(output) as f:
+                res = json.load(f)
+        finally:
+            stop_server(server, thread)
+            metrics.enable(False)
+            metrics.reset()
+            if os.path.exists(output):
+                os.remove(output)
+
+        stages = {series['labels']['stage']: series for series in res['stage_seconds']}
+        for stage in ['fetch', 'parse', 'write', 'resolve_email', 'html_to_markdown']:
+            self.assertGreater(stages[stage]['count'], 0)
+        self.assertEqual(stages['fetch']['count'], 1)
+
+        jobs = {series['labels']['result']: series['value'] for series in res['ingest_jobs_total']}
+        self.assertEqual(jobs['new'], stages['html_to_markdown']['count'])
+        self.assertEqual(jobs['changed'], 0)
+        pages = {series['labels']['state']: series['value'] for series in res['ingest_pages_total']}
+        self.assertEqual(pages['modified'], 2)
+
+    def test_get_page_number(self):
+        self.assertEqual(fetch_job_postings.get_page_number('https://news.ycombinator.com/item?id=1'), 1)
+        self.assertEqual(fetch_job_postings.get_page_number('https://news.ycombinator.com/item?id=1&p=3'), 3)
+
+    def test_get_thread_id(self):
+        self.assertEqual(fetch_job_postings.get_thread_id('https://news.ycombinator.com/item?id=41425910&p=2'), 41425910)
+        self.assertIsNone(fetch_job_postings.get_thread_id('https://news.ycombinator.com/jobs'))
+
+    def test_get_page_url(self):
+        res = fetch_job_postings.get_page_url('https://news.ycombinator.com/item?id=1', 2)
+        self.assertEqual(res, 'https://news.ycombinator.com/item?id=1&p=2')
+
+        res = fetch_job_postings.get_page_url('https://news.ycombinator.com/item?id=1&p=2', 3)
+        self.assertEqual(res, 'https://news.ycombinator.com/item?id=1&p=3')
+
+    def test_has_more_pages(self):
+        source = fetch_job_postings.load_file(self.thread_html_path)
+        self.assertFalse(fetch_job_postings.has_more_pages(source))
+
+        pages = split_thread(source, 2)
+        self.assertTrue(fetch_job_postings.has_more_pages(pages[0]))
+        self.assertFalse(fetch_job_postings.has_more_pages(pages[1]))
+
+    def test_count_pages(self):
+        pages = split_thread(fetch_job_postings.load_file(self.thread_html_path), 3)
+        self.assertEqual(fetch_job_postings.count_pages(pages[0]), 3)
+        self.assertEqual(fetch_job_postings.count_pages(pages[0].replace('484&nbsp;comments', '1&nbsp;comment')), 1)
+        self.assertIsNone(fetch_job_postings.count_pages(pages[0].replace('484&nbsp;comments', '')))
+        self.assertIsNone(fetch_job_postings.count_pages('<html></html>'))
+
+    def test_rate_limiter(self):
+        rate_limiter = fetch_job_postings.RateLimiter(0.05)
+
+        start = time.monotonic()
+        for _ in range(3):
+            rate_limiter.wait()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
     def test_load_file(self):
         res = fetch_job_postings.load_file(self.thread_html_path)
         self.assertTrue(res.startswith('<html lang="en" op="item">'))
 
     def test_get_all_comments(self):
         source = fetch_job_postings.load_file(self.thread_html_path)
-        soup = fetch_job_postings.BeautifulSoup(source, 'html.parser')
+        soup = BeautifulSoup(source, 'html.parser')
         res = fetch_job_postings.get_all_comments(soup)
         self.assertEqual(len(res), 474)
 
@@ -41,6 +345,26 @@ class Test(unittest.TestCase):
         res = fetch_job_postings.is_reply(soup)
         self.assertTrue(res)
 
+    def test_get_indent(self):
+        raw = fetch_job_postings.load_file(self.comment_html_path)
+
+        soup = BeautifulSoup(raw, 'html.parser')
+        self.assertEqual(fetch_job_postings.get_indent(soup), 0)
+
+        soup = BeautifulSoup(raw.replace('indent="0"', 'indent="3"'), 'html.parser')
+        self.assertEqual(fetch_job_postings.get_indent(soup), 3)
+
+    def test_parse_comments(self):
+        source = fetch_job_postings.load_file(self.thread_html_path)
+
+        expected = list(fetch_job_postings.parse_comments(source, 'html.parser'))
+        self.assertEqual(len(expected), 474)
+
+        # Backends produce the same comments
+        for parser in ['lxml', 'stream']:
+            res = list(fetch_job_postings.parse_comments(source, parser))
+            self.assertEqual(res, expected)
+
     def test_parse_from_comment(self):
         raw = fetch_job_postings.load_file(self.comment_html_path)
 
@@ -53,3 +377,54 @@ class Test(unittest.TestCase):
             comment, '<div class="commtext c00">Sealth | Designer &amp; Back end Course Designer| Full-Time </div>')
         self.assertEqual(hn_user, 'OnjaMadagascar')
         self.assertEqual(hn_id, '41555035')
+
+    @patch.object(helper, "get_db_path")
+    def test_save_jobs(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+        helper.db_init()
+
+        source = fetch_job_postings.load_file(self.thread_html_path)
+        soup = BeautifulSoup(source, 'html.parser')
+        jobs = [fetch_job_postings.parse_from_comment(item)
+                for item in fetch_job_postings.get_all_comments(soup)
+                if not fetch_job_postings.is_reply(item)]
+
+        # All jobs are new
+        (new_count, exist_count, changed_count) = fetch_job_postings.save_jobs(jobs)
+        self.assertEqual((new_count, exist_count, changed_count), (len(jobs), 0, 0))
+
+        conn = helper.db_connect()
+        row = conn.execute('SELECT * FROM jobs WHERE hn_id = ?', (jobs[0][2],)).fetchone()
+        self.assertEqual(row['job_text'], jobs[0][0])
+        self.assertEqual(row['hn_user'], jobs[0][1])
+        self.assertEqual(row['job_hash'], helper.hash_text(jobs[0][0]))
+        self.assertEqual(row['render_version'], helper.RENDER_VERSION)
+        self.assertEqual(row['job_snippet'], helper.make_snippet(row['job_markdown']))
+        self.assertEqual(row['status'], 'new')
+
+        # Unchanged jobs are not written again, the data version is kept
+        changes = conn.total_changes
+        version = helper.get_data_version()
+        (new_count, exist_count, changed_count) = fetch_job_postings.save_jobs(jobs)
+        self.assertEqual((new_count, exist_count, changed_count), (0, len(jobs), 0))
+        self.assertEqual(conn.total_changes, changes)
+        self.assertEqual(helper.get_data_version(), version)
+
+        # Changed jobs are updated, status is kept
+        conn.execute("UPDATE jobs SET status = 'applied' WHERE hn_id = ?", (jobs[0][2],))
+        conn.commit()
+        jobs[0] = ('<div class="commtext c00">Edited</div>', jobs[0][1], jobs[0][2])
+        (new_count, exist_count, changed_count) = fetch_job_postings.save_jobs(jobs)
+        self.assertEqual((new_count, exist_count, changed_count), (0, len(jobs), 1))
+        self.assertEqual(helper.get_data_version(), version + 1)
+
+        row = conn.execute('SELECT * FROM jobs WHERE hn_id = ?', (jobs[0][2],)).fetchone()
+        self.assertEqual(row['job_markdown'], 'Edited\n')
+        self.assertEqual(row['job_snippet'], 'Edited')
+        self.assertEqual(row['status'], 'applied')
+
+        # Comments without an id are skipped
+        (new_count, exist_count, changed_count) = fetch_job_postings.save_jobs(
+            [('<div>Deleted</div>', None, None)])
+        self.assertEqual((new_count, exist_count, changed_count), (0, 0, 0))
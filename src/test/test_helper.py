@@ -1,11 +1,14 @@
+import asyncio
 import os
 from datetime import datetime
 
 import unittest
 from unittest.mock import patch
 import sqlite3
+import threading
 
 from .. import helper
+from .. import migrations
 
 
 class Test(unittest.TestCase):
@@ -13,6 +16,9 @@ class Test(unittest.TestCase):
     tmp_db_path = '/tmp/mock.db'
 
     def tearDown(self) -> None:
+        # Close pooled connections
+        helper.db_close()
+
         # Delete the mock database
         if os.path.exists(self.tmp_db_path):
             os.remove(self.tmp_db_path)
@@ -36,10 +42,95 @@ class Test(unittest.TestCase):
         res = helper.backup_db_file()
         self.assertTrue(res.startswith('Database backup created at'))
 
-    def test_db_connect(self):
+    @patch.object(helper, "get_db_path")
+    def test_db_connect(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
         res = helper.db_connect()
         self.assertIsInstance(res, sqlite3.Connection)
 
+        # Connection is reused by the same thread, even after close()
+        res.close()
+        self.assertIs(helper.db_connect(), res)
+
+        # Pragmas are applied
+        self.assertEqual(res.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(res.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+
+    @patch.object(helper, "get_db_path")
+    def test_db_connect_other_thread(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        conns = []
+        thread = threading.Thread(target=lambda: conns.append(helper.db_connect()))
+        thread.start()
+        thread.join()
+
+        # Each thread gets its own connection
+        self.assertIsNot(helper.db_connect(), conns[0])
+
+    @patch.object(helper, "get_db_path")
+    def test_db_connect_replaced_file(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        conn = helper.db_connect()
+
+        # Remove the database file, a new connection should be opened
+        os.remove(self.tmp_db_path)
+        self.assertIsNot(helper.db_connect(), conn)
+
+    @patch.object(helper, "get_db_path")
+    def test_db_close(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        conn = helper.db_connect()
+        helper.db_close()
+
+        self.assertIsNot(helper.db_connect(), conn)
+
+    @patch.object(helper, "get_db_path")
+    def test_db_run(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def query(value):
+            with lock:
+                running.append(value)
+                peak.append(len(running))
+            try:
+                conn = helper.db_connect()
+                return conn.execute('SELECT ?, ?', (value, threading.current_thread().name)).fetchone()
+            finally:
+                with lock:
+                    running.remove(value)
+
+        async def main():
+            return await asyncio.gather(*[helper.db_run(query, i) for i in range(20)])
+
+        res = asyncio.run(main())
+
+        # Calls run in the database threads, at most DB_WORKERS at once
+        self.assertEqual([row[0] for row in res], list(range(20)))
+        self.assertTrue(all(row[1].startswith('db') for row in res))
+        self.assertLessEqual(max(peak), helper.DB_WORKERS)
+
+        # Exceptions are raised in the caller
+        with self.assertRaises(ValueError):
+            asyncio.run(helper.db_run(int, 'invalid'))
+
+        # The executor is created again after a shutdown
+        helper.db_executor_shutdown()
+        self.assertEqual(asyncio.run(helper.db_run(lambda: 1)), 1)
+        helper.db_executor_shutdown()
+
     @patch.object(helper, "get_db_path")
     def test_db_init(self, mock_get_db_path):
         # Mock get_db_path
@@ -52,6 +143,51 @@ class Test(unittest.TestCase):
         res = helper.db_init()
         self.assertEqual(res, "Database already exists")
 
+    @patch.object(helper, "get_db_path")
+    def test_db_migrate(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        res = helper.db_migrate()
+        self.assertEqual(res, len(migrations.MIGRATIONS))
+
+        conn = helper.db_connect()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        self.assertEqual(version, len(migrations.MIGRATIONS))
+
+        # Nothing left to apply
+        res = helper.db_migrate()
+        self.assertEqual(res, 0)
+
+    @patch.object(helper, "get_db_path")
+    def test_db_migrate_failure(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        def broken(conn):
+            conn.execute('CREATE TABLE partial (id INTEGER)')
+            raise RuntimeError('broken migration')
+
+        with patch.object(helper, 'MIGRATIONS', migrations.MIGRATIONS + [broken]):
+            with self.assertRaises(RuntimeError):
+                helper.db_migrate()
+
+        # Previous migrations are applied, the broken one is rolled back
+        conn = helper.db_connect()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        self.assertEqual(version, len(migrations.MIGRATIONS))
+        self.assertIsNone(conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'partial'").fetchone())
+
+    def test_to_search_query(self):
+        self.assertEqual(helper.to_search_query('python'), '"python"')
+        self.assertEqual(helper.to_search_query('python remote'), '"python" "remote"')
+        self.assertEqual(helper.to_search_query('"remote ok" eng*'), '"remote ok" "eng"*')
+        self.assertEqual(helper.to_search_query('c++ AND "a"b'), '"c++" "AND" "a" "b"')
+        self.assertEqual(helper.to_search_query('say"hi'), '"say""hi"')
+        self.assertIsNone(helper.to_search_query('  * "" '))
+        self.assertIsNone(helper.to_search_query(None))
+
     def test_is_hacker_news_url(self):
         res = helper.is_hacker_news_url('https://news.ycombinator.com')
         self.assertTrue(res)
@@ -68,18 +204,47 @@ class Test(unittest.TestCase):
         res = helper.html_to_markdown(html)
         self.assertEqual(res, '[Hello, world!](https://example.com)\n')
 
-    def test_get_from_cache(self):
-        res = helper.get_from_cache('test')
-        self.assertIsNone(res)
+    def test_render_job_text(self):
+        html = '<p>Email: hello [at] example [dot] com</p>'
+        res = helper.render_job_text(html)
+        self.assertEqual(
+            res, 'Email: hello [at] example [dot] com\n\n🪄 *Deobfuscated email:* hello@example.com\n')
+
+    def test_make_snippet(self):
+        res = helper.make_snippet('\n\nAcme | Engineer | Remote\n\nWe are hiring.\n')
+        self.assertEqual(res, 'Acme | Engineer | Remote')
+        self.assertEqual(helper.make_snippet(''), '')
 
-        helper.set_to_cache('test', 'value')
-        res = helper.get_from_cache('test')
-        self.assertEqual(res, 'value')
+        # Long lines are cut at a word boundary
+        res = helper.make_snippet('word ' * 100)
+        self.assertTrue(res.endswith('word…'))
+        self.assertLessEqual(len(res), helper.SNIPPET_LENGTH)
+        res = helper.make_snippet('a' * 1000)
+        self.assertEqual(res, 'a' * (helper.SNIPPET_LENGTH - 1) + '…')
 
-    def test_set_to_cache(self):
-        helper.set_to_cache('test', 'value')
-        res = helper.get_from_cache('test')
-        self.assertEqual(res, 'value')
+    def test_hash_text(self):
+        res = helper.hash_text('test')
+        self.assertEqual(res, helper.hash_text('test'))
+        self.assertNotEqual(res, helper.hash_text('test2'))
+
+    def test_encode_filters(self):
+        res = helper.encode_filters({'status': 'applied', 'search': 'python "remote ok"'})
+        self.assertEqual(res, 'status=applied&search=python+%22remote+ok%22')
+
+        # Empty and unknown filters are left out, values are truncated
+        res = helper.encode_filters({'status': None, 'search': 'a' * 1000, 'other': 'value'})
+        self.assertEqual(res, 'search=' + 'a' * helper.FILTER_MAX_LENGTH)
+        self.assertEqual(helper.encode_filters({}), '')
+
+    def test_decode_filters(self):
+        filters = {'status': 'applied', 'search': 'python "remote ok"'}
+        res = helper.decode_filters(helper.encode_filters(filters))
+        self.assertEqual(res, filters)
+
+        res = helper.decode_filters('search=' + 'a' * 1000 + '&other=value&status=')
+        self.assertEqual(res, {'search': 'a' * helper.FILTER_MAX_LENGTH})
+        self.assertEqual(helper.decode_filters(None), {})
+        self.assertEqual(helper.decode_filters('%%invalid'), {})
 
     def test_resolve_email(self):
         text = 'Send an email to hello dot world at example dot com now'
@@ -102,6 +267,18 @@ class Test(unittest.TestCase):
         res = helper.resolve_email(text)
         self.assertEqual(res, text)
 
+        # All addresses are resolved, once each
+        text = 'Email jobs [at] example [dot] com or first.last [at] example [dot] com (jobs [at] example [dot] com)'
+        res = helper.resolve_email(text)
+        self.assertEqual(res, text + '\n🪄 *Deobfuscated email:* jobs@example.com'
+                                     '\n🪄 *Deobfuscated email:* first.last@example.com')
+
+    def test_resolve_emails(self):
+        texts = ['Contact me at hello[at]example[dot]com', 'This is my posting']
+        res = helper.resolve_emails(texts)
+        self.assertEqual(res, [helper.resolve_email(text) for text in texts])
+        self.assertEqual(helper.resolve_emails([]), [])
+
     def test_format_dt(self):
         dt = datetime(2021, 8, 1, 12, 0, 0)
         res = helper.format_dt(dt)
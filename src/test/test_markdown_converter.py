@@ -0,0 +1,85 @@
+import os
+
+import unittest
+
+from .. import fetch_job_postings
+from .. import helper
+from .. import markdown_converter
+
+
+class Test(unittest.TestCase):
+
+    thread_html_path = os.path.dirname(__file__) + '/assets/thread.html'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        source = fetch_job_postings.load_file(cls.thread_html_path)
+        cls.comments = [comment for (comment, _, _, _) in fetch_job_postings.parse_comments(source)]
+
+    def assertSameAsHtml2text(self, html):
+        res = markdown_converter.convert(html)
+        self.assertIsNotNone(res, html)
+        self.assertEqual(res, helper.html2text_to_markdown(html), html)
+
+    def test_convert_comments(self):
+        # Differential test against html2text on the sample thread
+        self.assertEqual(len(self.comments), 474)
+        for comment in self.comments:
+            self.assertSameAsHtml2text(comment)
+
+    def test_convert_rendered_comments(self):
+        # Comments as rendered at ingest, with deobfuscated emails appended
+        for comment in helper.resolve_emails(self.comments):
+            self.assertSameAsHtml2text(comment)
+
+    def test_convert(self):
+        for html in [
+            '',
+            'Hello, world!',
+            '<div class="commtext c00">Acme | Engineer<p>Remote</div>',
+            '<p>Apply at <a href="https:&#x2F;&#x2F;example.com&#x2F;jobs" rel="nofollow">https:&#x2F;&#x2F;example.com&#x2F;jobs</a></p>',
+            '<p>Apply <a href="https://example.com/jobs">here</a>, or <a href="#top">there</a></p>',
+            '<p><a href="https://example.com/(jobs)" title="Our [jobs]">jobs</a></p>',
+            '<p><a href="https://example.com"><i>jobs</i></a></p>',
+            '<p><a href="https://example.com"></a> and <a name="anchor">anchor</a></p>',
+            '<p>We<i>really</i>care, <i> a lot </i>.<i>Really</i>!</p>',
+            '<p><em>Em</em> and <u>underlined</u> text</p>',
+            '<p>Use <code>pip install -e .</code> first</p>',
+            '<pre><code>def main():\n    return 1\n</code></pre><p>After</p>',
+            '<p>- dash<p>+ plus<p>1. first<p>2023 was great<p>10+ years<p>a\\b<p>-- section</p>',
+            'Line one\n- item\n\n  2. item\n',
+            '<p>Salary &gt;= $100k &amp; equity&nbsp;&nbsp;&mdash; &#8217;quoted&#8217; &#x27;too&#x27;</p>',
+            '<P>Upper case <A HREF="https://example.com">tags</A></P>',
+            "<p><a href='https://example.com' rel=\"nofollow\">single quotes</a></p>",
+            '<p>Spaces   and\ttabs\n\nand lines</p>',
+        ]:
+            self.assertSameAsHtml2text(html)
+
+    def test_convert_unsupported(self):
+        # Markup outside of the subset is left to html2text
+        for html in [
+            '<p><b>Bold</b></p>',
+            '<p>Line<br>break</p>',
+            '<p>Line<br/>break</p>',
+            '<!-- comment --><p>Text</p>',
+            '<p>1 < 2</p>',
+            '<p>Tom & Jerry</p>',
+            '<p>&unterminated</p>',
+            '<p><a href=unquoted>link</a></p>',
+            '<p>Unclosed <a href="https://example.com"',
+        ]:
+            self.assertIsNone(markdown_converter.convert(html), html)
+
+    def test_html_to_markdown_fallback(self):
+        html = '<p><b>Bold</b> and <a href="https://example.com">link</a></p>'
+        res = helper.html_to_markdown(html)
+        self.assertEqual(res, helper.html2text_to_markdown(html))
+        self.assertEqual(res, '**Bold** and [link](https://example.com)\n')
+
+    def test_needs_escaping(self):
+        self.assertFalse(markdown_converter.needs_escaping('Senior engineer, 10+ years'))
+        self.assertFalse(markdown_converter.needs_escaping('2023 was great'))
+        self.assertTrue(markdown_converter.needs_escaping('1. first'))
+        self.assertTrue(markdown_converter.needs_escaping('  - item'))
+        self.assertTrue(markdown_converter.needs_escaping('text\n+ item'))
+        self.assertTrue(markdown_converter.needs_escaping('back\\slash'))
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import unittest
+
+from .. import metrics
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self) -> None:
+        metrics.enable()
+
+    def tearDown(self) -> None:
+        metrics.enable(False)
+        metrics.reset()
+
+    def test_disabled(self):
+        metrics.enable(False)
+
+        # Shared no-op context manager, nothing is recorded
+        self.assertIs(metrics.timed('parse'), metrics.timed('write'))
+        with metrics.timed('parse'):
+            pass
+        metrics.observe('request_seconds', 1.0, route='/')
+        metrics.increment('listing_cache_total', result='hit')
+        self.assertEqual(metrics.summary(), {})
+
+    def test_timed(self):
+        with metrics.timed('parse'):
+            time.sleep(0.001)
+        with metrics.timed('parse'):
+            pass
+        with metrics.timed('build', endpoint='users_table'):
+            pass
+
+        res = metrics.summary()['stage_seconds']
+        self.assertEqual([series['labels'] for series in res],
+                         [{'endpoint': 'users_table', 'stage': 'build'}, {'stage': 'parse'}])
+        self.assertEqual(res[1]['count'], 2)
+        self.assertGreaterEqual(res[1]['sum_seconds'], 0.001)
+        self.assertEqual(sum(res[1]['buckets'].values()), 2)
+
+    def test_timed_function(self):
+        @metrics.timed_function('db')
+        def get(value):
+            return value
+
+        self.assertEqual(get(1), 1)
+        self.assertEqual(get.__name__, 'get')
+
+        metrics.enable(False)
+        self.assertEqual(get(2), 2)
+
+        res = metrics.summary()['stage_seconds']
+        self.assertEqual(res[0]['labels'], {'operation': 'get', 'stage': 'db'})
+        self.assertEqual(res[0]['count'], 1)
+
+    def test_render(self):
+        metrics.observe('request_seconds', 0.003, method='GET', route='/api/', status='200')
+        metrics.observe('request_seconds', 100, method='GET', route='/api/', status='200')
+        metrics.increment('listing_cache_total', result='hit')
+        metrics.increment('listing_cache_total', 2, result='hit')
+        metrics.increment('ingest_jobs_total', result='say "hi"\n')
+
+        res = metrics.render()
+        self.assertIn('# TYPE hn_jobs_request_seconds histogram\n', res)
+        self.assertIn('hn_jobs_request_seconds_bucket{method="GET",route="/api/",status="200",le="0.0025"} 0\n', res)
+        self.assertIn('hn_jobs_request_seconds_bucket{method="GET",route="/api/",status="200",le="0.005"} 1\n', res)
+        self.assertIn('hn_jobs_request_seconds_bucket{method="GET",route="/api/",status="200",le="+Inf"} 2\n', res)
+        self.assertIn('hn_jobs_request_seconds_count{method="GET",route="/api/",status="200"} 2\n', res)
+        self.assertIn('hn_jobs_request_seconds_sum{method="GET",route="/api/",status="200"} 100.003\n', res)
+        self.assertIn('# TYPE hn_jobs_listing_cache_total counter\n', res)
+        self.assertIn('hn_jobs_listing_cache_total{result="hit"} 3\n', res)
+        self.assertIn('hn_jobs_ingest_jobs_total{result="say \\"hi\\"\\n"} 1\n', res)
+
+    def test_metrics_middleware(self):
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def send(message):
+            pass
+
+        middleware = metrics.MetricsMiddleware(app)
+        asyncio.run(middleware({'type': 'http', 'method': 'GET', 'path': '/unknown'}, None, send))
+
+        # Routes are reported by their template
+        route = type('Route', (), {'path': '/api/job/{job_id}'})()
+        asyncio.run(middleware({'type': 'http', 'method': 'GET', 'path': '/api/job/1', 'route': route}, None, send))
+
+        res = metrics.summary()['request_seconds']
+        self.assertEqual([series['labels'] for series in res], [
+            {'method': 'GET', 'route': '/api/job/{job_id}', 'status': '404'},
+            {'method': 'GET', 'route': 'unmatched', 'status': '404'},
+        ])
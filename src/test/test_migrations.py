@@ -0,0 +1,313 @@
+import os
+
+import unittest
+from unittest.mock import patch
+import sqlite3
+
+from .. import helper
+from .. import migrations
+
+
+class Test(unittest.TestCase):
+
+    tmp_db_path = '/tmp/mock.db'
+
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(self.tmp_db_path)
+
+    def tearDown(self) -> None:
+        self.conn.close()
+
+        # Close pooled connections
+        helper.db_close()
+
+        # Delete the mock database
+        if os.path.exists(self.tmp_db_path):
+            os.remove(self.tmp_db_path)
+
+    def get_columns(self):
+        return [row[1] for row in self.conn.execute('PRAGMA table_info(jobs)')]
+
+    def get_indexes(self):
+        return [row[1] for row in self.conn.execute('PRAGMA index_list(jobs)')]
+
+    def search(self, query):
+        return [row[0] for row in self.conn.execute(
+            'SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH ? ORDER BY rowid', (query,))]
+
+    def test_create_jobs(self):
+        migrations.create_jobs(self.conn)
+        self.assertIn('job_text', self.get_columns())
+
+        # Idempotent
+        migrations.create_jobs(self.conn)
+
+    def test_add_job_markdown(self):
+        migrations.create_jobs(self.conn)
+        migrations.add_job_markdown(self.conn)
+
+        columns = self.get_columns()
+        self.assertIn('job_markdown', columns)
+        self.assertIn('render_version', columns)
+
+        # Idempotent
+        migrations.add_job_markdown(self.conn)
+
+    def test_create_search_index(self):
+        migrations.create_jobs(self.conn)
+        migrations.add_job_markdown(self.conn)
+
+        # Existing jobs are indexed when the index is created
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, job_text, inserted_at, status)
+        VALUES (1, '<p>Rust engineer</p>', datetime('now'), 'new')
+        """)
+        migrations.create_search_index(self.conn)
+        self.assertEqual(self.search('"rust"'), [1])
+
+        # Idempotent
+        migrations.create_search_index(self.conn)
+        self.assertEqual(self.search('"rust"'), [1])
+
+        # Index is kept in sync on insert
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, job_text, job_markdown, inserted_at, status)
+        VALUES (2, '<p>Python developer</p>', 'Python developer', datetime('now'), 'new')
+        """)
+        self.assertEqual(self.search('"python"'), [2])
+        # Markup is not indexed for rendered jobs
+        self.assertEqual(self.search('"p"'), [1])
+
+        # On update
+        self.conn.execute("UPDATE jobs SET job_markdown = 'Rust engineer' WHERE id = 1")
+        self.assertEqual(self.search('"p"'), [])
+        self.conn.execute("UPDATE jobs SET job_markdown = 'Go developer' WHERE id = 2")
+        self.assertEqual(self.search('"python"'), [])
+        self.assertEqual(self.search('"developer"'), [2])
+
+        # On delete
+        self.conn.execute("DELETE FROM jobs WHERE id = 2")
+        self.assertEqual(self.search('"developer"'), [])
+
+    def test_create_indexes(self):
+        migrations.create_jobs(self.conn)
+
+        # Duplicated HN comments are removed, the first one is kept
+        for hn_id, job_text in [(1, 'first'), (1, 'duplicate'), (None, 'a'), (None, 'b')]:
+            self.conn.execute("""
+            INSERT INTO jobs (hn_id, job_text, inserted_at, status)
+            VALUES (?, ?, datetime('now'), 'new')
+            """, (hn_id, job_text))
+
+        migrations.create_indexes(self.conn)
+
+        rows = self.conn.execute('SELECT job_text FROM jobs ORDER BY id').fetchall()
+        self.assertEqual([row[0] for row in rows], ['first', 'a', 'b'])
+
+        self.assertEqual(sorted(self.get_indexes()), [
+                         'jobs_hn_id', 'jobs_hn_user_status', 'jobs_status'])
+
+        # hn_id is unique
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute("""
+            INSERT INTO jobs (hn_id, job_text, inserted_at, status)
+            VALUES (1, 'again', datetime('now'), 'new')
+            """)
+
+        # Idempotent
+        migrations.create_indexes(self.conn)
+
+    def test_create_indexes_keeps_status(self):
+        migrations.create_jobs(self.conn)
+
+        # The duplicate with a status set by the user is kept, whatever its position
+        for hn_id, status, updated_at in [(1, 'new', None), (1, 'applied', '2024-01-02'), (1, 'new', None),
+                                          (2, 'discarded', '2024-01-01'), (2, 'interviewed', '2024-01-03'),
+                                          (2, 'new', None)]:
+            self.conn.execute("""
+            INSERT INTO jobs (hn_id, hn_user, job_text, inserted_at, updated_at, status)
+            VALUES (?, 'user', 'text', '2024-01-01', ?, ?)
+            """, (hn_id, updated_at, status))
+
+        migrations.create_indexes(self.conn)
+
+        rows = self.conn.execute('SELECT id, hn_id, status FROM jobs ORDER BY hn_id').fetchall()
+        self.assertEqual([tuple(row) for row in rows], [(2, 1, 'applied'), (5, 2, 'interviewed')])
+
+    def test_add_job_hash(self):
+        migrations.create_jobs(self.conn)
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, job_text, inserted_at, status)
+        VALUES (1, 'text', datetime('now'), 'new')
+        """)
+
+        migrations.add_job_hash(self.conn)
+
+        # Existing jobs are hashed
+        self.assertEqual(self.conn.execute('SELECT job_hash FROM jobs').fetchone()[0],
+                         helper.hash_text('text'))
+
+        # Idempotent
+        migrations.add_job_hash(self.conn)
+
+    def test_create_thread_pages(self):
+        migrations.create_thread_pages(self.conn)
+        self.conn.execute("""
+        INSERT INTO thread_pages (thread_id, page, url, etag, has_more, updated_at)
+        VALUES (1, 1, 'https://news.ycombinator.com/item?id=1', '"abc"', 1, datetime('now'))
+        """)
+
+        # One state per page of a thread
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute("""
+            INSERT INTO thread_pages (thread_id, page, url, has_more, updated_at)
+            VALUES (1, 1, 'https://news.ycombinator.com/item?id=1', 0, datetime('now'))
+            """)
+
+        # Idempotent
+        migrations.create_thread_pages(self.conn)
+
+    def test_create_data_version(self):
+        migrations.create_data_version(self.conn)
+        self.conn.execute('UPDATE data_version SET version = version + 1')
+
+        # Single row, kept by later runs
+        migrations.create_data_version(self.conn)
+        self.assertEqual(self.conn.execute('SELECT * FROM data_version').fetchall(), [(1, 1)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute('INSERT INTO data_version (id, version) VALUES (2, 0)')
+
+    def test_create_user_summary(self):
+        migrations.create_jobs(self.conn)
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, hn_user, job_text, inserted_at, status)
+        VALUES (1, 'user', 'a', '2024-09-16 11:40:43', 'applied'), (2, 'user', 'b', '2024-09-17 11:40:43', 'new'),
+            (3, NULL, 'c', '2024-09-17 11:40:43', 'new')
+        """)
+
+        def get_summary():
+            return self.conn.execute(
+                'SELECT hn_user, jobs, new_jobs, applied_jobs, discarded_jobs, last_activity_at FROM user_summary').fetchall()
+
+        # Existing jobs are summarized, once
+        migrations.create_user_summary(self.conn)
+        migrations.create_user_summary(self.conn)
+        self.assertEqual(get_summary(), [('user', 2, 1, 1, 0, '2024-09-17 11:40:43')])
+
+        # Kept in sync with inserts, status updates, user changes and deletes
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, hn_user, job_text, inserted_at, status)
+        VALUES (4, 'other', 'd', '2024-09-18 11:40:43', 'new')
+        """)
+        self.conn.execute("UPDATE jobs SET status = 'discarded', updated_at = '2024-09-19 11:40:43' WHERE id = 2")
+        self.conn.execute("UPDATE jobs SET hn_user = 'other' WHERE id = 1")
+        self.conn.execute("UPDATE jobs SET job_text = 'edited' WHERE id = 4")
+        self.conn.execute('DELETE FROM jobs WHERE id = 3')
+        self.assertEqual(get_summary(), [
+            ('other', 2, 1, 1, 0, '2024-09-18 11:40:43'),
+            ('user', 1, 0, 0, 1, '2024-09-19 11:40:43'),
+        ])
+
+    def test_add_job_snippet(self):
+        migrations.create_jobs(self.conn)
+        migrations.add_job_markdown(self.conn)
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, job_text, job_markdown, inserted_at, status)
+        VALUES (1, 'a', 'Acme | Engineer\n\nText\n', datetime('now'), 'new'), (2, 'b', NULL, datetime('now'), 'new')
+        """)
+
+        migrations.add_job_snippet(self.conn)
+
+        # Rendered jobs get a snippet
+        self.assertEqual(self.conn.execute('SELECT job_snippet FROM jobs ORDER BY id').fetchall(),
+                         [('Acme | Engineer',), (None,)])
+
+        # Idempotent
+        migrations.add_job_snippet(self.conn)
+
+    def test_render_legacy_jobs(self):
+        for migration in migrations.MIGRATIONS[:-1]:
+            migration(self.conn)
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, job_text, job_markdown, render_version, inserted_at, status)
+        VALUES (1, '<p>Acme | Engineer</p>', NULL, NULL, datetime('now'), 'new'),
+            (2, 'b', 'Current
+', ?, datetime('now'), 'new')
+        """, (helper.RENDER_VERSION,))
+
+        migrations.render_legacy_jobs(self.conn)
+
+        rows = self.conn.execute('SELECT job_markdown, job_snippet, render_version FROM jobs ORDER BY id').fetchall()
+        self.assertEqual(rows, [('Acme | Engineer\n', 'Acme | Engineer', helper.RENDER_VERSION),
+                                ('Current\n', None, helper.RENDER_VERSION)])
+        self.assertEqual(self.conn.execute('SELECT version FROM data_version').fetchone()[0], 1)
+
+        # Idempotent
+        migrations.render_legacy_jobs(self.conn)
+        self.assertEqual(self.conn.execute('SELECT version FROM data_version').fetchone()[0], 1)
+
+    @patch.object(helper, "get_db_path")
+    def test_upgrade_baseline_database(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        # Database created before versioning, with jobs stored as raw HTML
+        migrations.create_jobs(self.conn)
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, hn_user, job_text, inserted_at, status)
+        VALUES (1, 'user', '<p>Acme | Rust engineer | <a href="https://acme.com" rel="nofollow">acme.com</a></p>',
+            '2024-09-16 11:40:43', 'new')
+        """)
+        self.conn.commit()
+
+        helper.db_init()
+
+        # Rendered once by the migrations, read paths never render it
+        conn = helper.db_connect()
+        row = conn.execute('SELECT job_markdown, job_snippet, render_version FROM jobs').fetchone()
+        self.assertEqual(row['job_markdown'], helper.render_job_text(
+            '<p>Acme | Rust engineer | <a href="https://acme.com" rel="nofollow">acme.com</a></p>'))
+        self.assertEqual(row['job_snippet'], helper.make_snippet(row['job_markdown']))
+        self.assertEqual(row['render_version'], helper.RENDER_VERSION)
+
+        # Re-indexed: the markup of the stored HTML is not matched, the rendered text is
+        self.assertEqual(self.search('"rust"'), [1])
+        for term in ['"p"', '"href"', '"nofollow"']:
+            self.assertEqual(self.search(term), [])
+
+    def test_lookups_use_indexes(self):
+        for migration in migrations.MIGRATIONS:
+            migration(self.conn)
+
+        queries = [
+            ('SELECT id FROM jobs WHERE hn_id = ?', (1,), 'jobs_hn_id'),
+            ('SELECT id FROM jobs WHERE hn_user = ?', ('user',), 'jobs_hn_user_status'),
+            ('SELECT id FROM jobs j WHERE j.status = ? ORDER BY j.id', ('new',), 'jobs_status'),
+            ('SELECT * FROM user_summary WHERE hn_user = ?', ('user',), 'PRIMARY KEY'),
+        ]
+        for query, params, index in queries:
+            plan = ' '.join(row[3] for row in self.conn.execute(
+                'EXPLAIN QUERY PLAN ' + query, params))
+            self.assertIn(index, plan)
+
+    def test_legacy_database(self):
+        # Database created before migrations were versioned, with existing jobs
+        migrations.create_jobs(self.conn)
+        self.conn.execute("""
+        INSERT INTO jobs (hn_id, hn_user, job_text, inserted_at, status)
+        VALUES (1, 'user', '<p>Legacy job</p>', datetime('now'), 'applied')
+        """)
+        self.conn.commit()
+
+        with patch.object(helper, "get_db_path", return_value=self.tmp_db_path):
+            res = helper.db_init()
+            self.assertEqual(res, "Database already exists")
+
+            # Running it again is a no-op
+            self.assertEqual(helper.db_migrate(), 0)
+
+        self.assertEqual(self.conn.execute(
+            'PRAGMA user_version').fetchone()[0], len(migrations.MIGRATIONS))
+        self.assertEqual(self.search('"legacy"'), [1])
+        self.assertEqual(self.conn.execute(
+            'SELECT status FROM jobs').fetchone()[0], 'applied')
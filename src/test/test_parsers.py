@@ -0,0 +1,96 @@
+import os
+
+import unittest
+
+from .. import fetch_job_postings
+from .. import parsers
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+
+class Test(unittest.TestCase):
+
+    thread_html_path = os.path.dirname(__file__) + '/assets/thread.html'
+    comment_html_path = os.path.dirname(__file__) + '/assets/comment.html'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.thread = fetch_job_postings.load_file(cls.thread_html_path)
+        cls.comment = '<table>' + fetch_job_postings.load_file(cls.comment_html_path) + '</table>'
+
+        # Reference output, from BeautifulSoup
+        cls.expected = list(fetch_job_postings.parse_soup(cls.thread))
+
+    def test_parse_stream(self):
+        res = list(parsers.parse_stream(self.thread))
+        self.assertEqual(len(res), 474)
+        self.assertEqual(res, self.expected)
+
+    def test_parse_stream_chunks(self):
+        # Chunks split tags and comments anywhere
+        chunks = (self.thread[i:i + 1000] for i in range(0, len(self.thread), 1000))
+        res = list(parsers.parse_stream(chunks))
+        self.assertEqual(res, self.expected)
+
+    @unittest.skipUnless(lxml, 'lxml is not installed')
+    def test_parse_lxml(self):
+        res = list(parsers.parse_lxml(self.thread))
+        self.assertEqual(len(res), 474)
+        self.assertEqual(res, self.expected)
+
+    def test_parse_comment(self):
+        expected = [('<div class="commtext c00">Sealth | Designer &amp; Back end Course Designer| Full-Time </div>',
+                     'OnjaMadagascar', '41555035', 0)]
+
+        self.assertEqual(list(fetch_job_postings.parse_soup(self.comment)), expected)
+        self.assertEqual(list(parsers.parse_stream(self.comment)), expected)
+        if lxml:
+            self.assertEqual(list(parsers.parse_lxml(self.comment)), expected)
+
+        # Reply
+        reply = self.comment.replace('indent="0"', 'indent="2"')
+        self.assertEqual(list(parsers.parse_stream(reply))[0][3], 2)
+
+    def test_markup_edge_cases(self):
+        # Unclosed and stray tags, entities, void elements and attributes quoting
+        bodies = [
+            'Intro<p>a &amp; <i>b<p>c</i> d<p>e &#x27;q&#x27; &lt;tag&gt; &nbsp;x',
+            '<a href="x?a=1&amp;b=2" rel="nofollow  me" title=\'say "hi"\'>link</a><br>after<br/>end',
+            '<pre><code>  x &lt; y\n    z\n</code></pre>stray</p></span>end',
+            '<img src="a.png" alt="it\'s &quot;q&quot;">text<div/>after',
+        ]
+        for body in bodies:
+            source = '''<html><body><table>
+            <tr class="athing comtr" id="1"><td><table><tr>
+              <td class="ind" indent="0"></td>
+              <td><span class="comhead"><a class="hnuser" href="user?id=u">u<b>1</b></a>
+                <span class="age"><a href="item?id=1">now</a></span></span>
+              <div class="comment"><div class="commtext c00">%s</div><div class="reply">reply</div></div></td>
+            </tr></table></td></tr>
+            <tr class="athing comtr noshow" id="2"><td>hidden</td></tr>
+            <tr class="athing comtr" id="3"><td><div class="comment">[deleted]</div></td></tr>
+            </table></body></html>''' % body
+
+            expected = list(fetch_job_postings.parse_soup(source))
+            self.assertEqual(len(expected), 2)
+            self.assertEqual(expected[1], ('None', None, None, 0))
+
+            self.assertEqual(list(parsers.parse_stream(source)), expected)
+            if lxml:
+                self.assertEqual(list(parsers.parse_lxml(source)), expected)
+
+    def test_format_attribute(self):
+        self.assertEqual(parsers.format_attribute('href', 'a?b=1&c=2'), ' href="a?b=1&amp;c=2"')
+        self.assertEqual(parsers.format_attribute('title', 'say "hi"'), ' title=\'say "hi"\'')
+        self.assertEqual(parsers.format_attribute('title', 'it\'s "hi"'), ' title="it\'s &quot;hi&quot;"')
+        self.assertEqual(parsers.format_attribute('class', ' a  b '), ' class="a b"')
+        self.assertEqual(parsers.format_attribute('nowrap', None), ' nowrap=""')
+
+    def test_is_comment_row(self):
+        self.assertTrue(parsers.is_comment_row('tr', [('class', 'athing comtr')]))
+        self.assertFalse(parsers.is_comment_row('tr', [('class', 'athing comtr noshow')]))
+        self.assertFalse(parsers.is_comment_row('tr', [('class', 'athing')]))
+        self.assertFalse(parsers.is_comment_row('td', [('class', 'athing comtr')]))
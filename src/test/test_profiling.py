@@ -0,0 +1,115 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import tempfile
+
+import unittest
+from unittest.mock import patch
+
+from .. import profiling
+
+
+def request(app, headers=(), query_string=b''):
+    """ Send a GET request to an ASGI app, returns the headers of the response """
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/api/job/1', 'headers': list(headers),
+             'query_string': query_string}
+    asyncio.run(app(scope, receive, send))
+
+    return dict(messages[0]['headers'])
+
+
+async def app(scope, receive, send):
+    sum(range(1000))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b'ok'})
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        patcher = patch.object(profiling, 'PROFILE_DIR', self.tmp_dir.name + '/profiles')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def get_profiles(self):
+        return sorted(os.listdir(profiling.PROFILE_DIR)) if os.path.exists(profiling.PROFILE_DIR) else []
+
+    def test_save_profile(self):
+        profiler = cProfile.Profile()
+        profiler.runcall(sum, range(10))
+
+        with patch.object(profiling, 'PROFILE_KEEP', 2):
+            names = [profiling.save_profile(profiler, 'GET /api/user/a b') for i in range(3)]
+
+        # Oldest profiles are removed
+        self.assertEqual(self.get_profiles(), names[1:])
+        self.assertTrue(names[0].endswith('-GET_api_user_a_b.prof'))
+
+        stats = pstats.Stats(os.path.join(profiling.PROFILE_DIR, names[2]))
+        self.assertTrue(any(function[2] == "<built-in method builtins.sum>" for function in stats.stats))
+
+    def test_profiled(self):
+        with profiling.profiled('auto_discard'):
+            pass
+        self.assertEqual(self.get_profiles(), [])
+
+        with patch.object(profiling, 'ENABLED', True), patch('builtins.print'):
+            with self.assertRaises(SystemExit):
+                with profiling.profiled('auto_discard'):
+                    raise SystemExit(1)
+
+        # Saved even when the tool exits
+        (name,) = self.get_profiles()
+        self.assertTrue(name.endswith('-auto_discard.prof'))
+
+    def test_is_requested(self):
+        scope = {'headers': [(b'x-profile-token', b'secret')], 'query_string': b''}
+        self.assertFalse(profiling.is_requested(scope))
+
+        with patch.object(profiling, 'TOKEN', 'secret'):
+            self.assertTrue(profiling.is_requested(scope))
+            self.assertTrue(profiling.is_requested({'headers': [], 'query_string': b'a=1&profile=secret'}))
+            self.assertFalse(profiling.is_requested({'headers': [(b'x-profile-token', b'other')],
+                                                     'query_string': b'profile=secret'}))
+            self.assertFalse(profiling.is_requested({'headers': [], 'query_string': b''}))
+
+        with patch.object(profiling, 'ENABLED', True):
+            self.assertTrue(profiling.is_requested({'headers': [], 'query_string': b''}))
+
+    def test_profiling_middleware(self):
+        middleware = profiling.ProfilingMiddleware(app)
+
+        with patch.object(profiling, 'TOKEN', 'secret'):
+            headers = request(middleware)
+            self.assertNotIn(b'x-profile', headers)
+            self.assertEqual(self.get_profiles(), [])
+
+            headers = request(middleware, headers=[(b'x-profile-token', b'secret')])
+
+        # Profile of the request, named in the response
+        (name,) = self.get_profiles()
+        self.assertEqual(headers[b'x-profile'], name.encode())
+        self.assertTrue(name.endswith('-GET_api_job_1.prof'))
+        stats = pstats.Stats(os.path.join(profiling.PROFILE_DIR, name))
+        self.assertTrue(any(function[2] == "<built-in method builtins.sum>" for function in stats.stats))
+
+        # A single request is profiled at a time
+        with patch.object(profiling, 'ENABLED', True):
+            with profiling._profile_lock:
+                headers = request(middleware)
+        self.assertNotIn(b'x-profile', headers)
+        self.assertEqual(len(self.get_profiles()), 1)
@@ -0,0 +1,93 @@
+import os
+
+import unittest
+from unittest.mock import patch
+
+from .. import render_jobs
+from .. import helper
+from ..helper import db_connect, db_init
+
+
+class Test(unittest.TestCase):
+
+    tmp_db_path = '/tmp/mock.db'
+
+    def setUp(self) -> None:
+        # Initialize the database
+        self.initialize_db()
+
+        # Create jobs
+        self.create_jobs()
+
+    def tearDown(self) -> None:
+        # Close pooled connections
+        helper.db_close()
+
+        # Delete the mock database
+        if os.path.exists(self.tmp_db_path):
+            os.remove(self.tmp_db_path)
+
+    @patch.object(helper, "get_db_path")
+    def initialize_db(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        # Initialize the database
+        db_init()
+
+    @patch.object(helper, "get_db_path")
+    def create_jobs(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        conn = db_connect()
+        cursor = conn.cursor()
+
+        jobs = [
+            # Never rendered
+            (123, '<p>test</p>', None, None),
+            # Rendered by an older version
+            (124, '<p>other test</p>', 'outdated', helper.RENDER_VERSION - 1),
+            # Up to date
+            (125, '<p>current</p>', 'current\n', helper.RENDER_VERSION),
+        ]
+
+        for job in jobs:
+            cursor.execute("""
+            INSERT INTO jobs (hn_id, hn_user, job_text, job_markdown, render_version, inserted_at, status)
+            VALUES (?, 'test_user', ?, ?, ?, '2024-09-16T11:40:43', 'new')
+            """, job)
+
+        conn.commit()
+        conn.close()
+
+    @patch.object(helper, "get_db_path")
+    def test_rerender(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        version = helper.get_data_version()
+        res = render_jobs.rerender()
+        self.assertEqual(res, 2)
+        self.assertEqual(helper.get_data_version(), version + 1)
+
+        rows = db_connect().execute(
+            'SELECT job_markdown, job_snippet, render_version FROM jobs ORDER BY id').fetchall()
+        self.assertEqual([row['job_markdown'] for row in rows],
+                         ['test\n', 'other test\n', 'current\n'])
+        self.assertEqual([row['job_snippet'] for row in rows[:2]], ['test', 'other test'])
+        for row in rows:
+            self.assertEqual(row['render_version'], helper.RENDER_VERSION)
+
+        # Second call has nothing left to render
+        res = render_jobs.rerender()
+        self.assertEqual(res, 0)
+
+    @patch.object(helper, "get_db_path")
+    def test_rerender_force(self, mock_get_db_path):
+        # Mock get_db_path
+        mock_get_db_path.return_value = self.tmp_db_path
+
+        with patch.object(render_jobs, 'BATCH_SIZE', 2):
+            res = render_jobs.rerender(force=True)
+        self.assertEqual(res, 3)
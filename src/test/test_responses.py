@@ -0,0 +1,151 @@
+import asyncio
+import gzip
+import os
+import tempfile
+
+import unittest
+from unittest.mock import patch
+
+from .. import responses
+
+
+def make_app(body, headers=None, parts=1):
+    """ ASGI app sending `body` in `parts` parts """
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] + (headers or [])})
+        size = len(body) // parts
+        for i in range(parts):
+            await send({'type': 'http.response.body', 'body': body[i * size:(i + 1) * size if i < parts - 1 else None],
+                        'more_body': i < parts - 1})
+
+    return app
+
+
+def request(app, accept_encoding=None):
+    """ Send a GET request to an ASGI app, returns the headers and the body of the response """
+
+    headers = [(b'accept-encoding', accept_encoding.encode())] if accept_encoding is not None else []
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app({'type': 'http', 'method': 'GET', 'path': '/', 'headers': headers}, receive, send))
+
+    return ({key.decode(): value.decode() for key, value in messages[0]['headers']},
+            b''.join(message.get('body', b'') for message in messages[1:]))
+
+
+class Test(unittest.TestCase):
+
+    body = b'{"jobs": [%s]}' % b', '.join(b'"job %d"' % i for i in range(200))
+
+    def test_parse_accept_encoding(self):
+        res = responses.parse_accept_encoding('gzip, deflate;q=0.5, BR;q=0.9, identity; q=0, *;q=invalid')
+        self.assertEqual(res, {'gzip': 1.0, 'deflate': 0.5, 'br': 0.9, 'identity': 0.0, '*': 0.0})
+        self.assertEqual(responses.parse_accept_encoding(None), {})
+
+    def test_choose_encoding(self):
+        self.assertEqual(responses.choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(responses.choose_encoding('*'), responses.ENCODINGS[0])
+        self.assertIsNone(responses.choose_encoding('gzip;q=0, *;q=0'))
+        self.assertIsNone(responses.choose_encoding('identity'))
+        self.assertIsNone(responses.choose_encoding(None))
+
+        # Preferred coding, unless the client prefers another one
+        with patch.object(responses, 'ENCODINGS', ['br', 'gzip']):
+            self.assertEqual(responses.choose_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(responses.choose_encoding('gzip, br;q=0.5'), 'gzip')
+
+            # Codings supported by the response
+            self.assertIsNone(responses.choose_encoding('br', ['gzip']))
+            self.assertEqual(responses.choose_encoding('br, *;q=0.1', ['gzip']), 'gzip')
+            self.assertIsNone(responses.choose_encoding('gzip;q=0, br', ['gzip']))
+
+    def test_make_etag(self):
+        res = responses.make_etag(1, '/api/', 'status=new', None)
+        self.assertRegex(res, r'^"[0-9a-f]{40}"$')
+        self.assertEqual(res, responses.make_etag(1, '/api/', 'status=new', None))
+        self.assertNotEqual(res, responses.make_etag(2, '/api/', 'status=new', None))
+
+    def test_hash_sources(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for path, content in [('app.py', 'a = 1'), ('models/JobModel.py', 'b = 2'), ('test/test_app.py', 't')]:
+                os.makedirs(os.path.dirname(os.path.join(directory, path)), exist_ok=True)
+                with open(os.path.join(directory, path), 'w') as f:
+                    f.write(content)
+
+            res = responses.hash_sources(directory)
+            self.assertEqual(res, responses.hash_sources(directory))
+
+            # Tests are not part of the release
+            with open(os.path.join(directory, 'test/test_app.py'), 'w') as f:
+                f.write('changed')
+            self.assertEqual(responses.hash_sources(directory), res)
+
+            with open(os.path.join(directory, 'models/JobModel.py'), 'w') as f:
+                f.write('b = 3')
+            self.assertNotEqual(responses.hash_sources(directory), res)
+
+    def test_make_etag_seed(self):
+        # Workers and restarts of a release share the seed, other releases do not
+        self.assertEqual(responses.make_etag_seed('abc', '0.7.0'), responses.make_etag_seed('abc', '0.7.0'))
+        self.assertNotEqual(responses.make_etag_seed('abc', '0.7.0'), responses.make_etag_seed('abd', '0.7.0'))
+        self.assertEqual(responses.ETAG_SEED, responses.make_etag_seed(
+            responses.hash_sources(), responses.fastui.__version__))
+
+    def test_match_etag(self):
+        etag = responses.make_etag(1)
+        self.assertEqual(responses.match_etag(etag, etag), etag)
+        self.assertEqual(responses.match_etag('"other", W/' + etag, etag), 'W/' + etag)
+        self.assertEqual(responses.match_etag('*', etag), etag)
+
+        # Representations compressed by the middleware
+        gzip_etag = etag[:-1] + '-gzip"'
+        self.assertEqual(responses.match_etag(gzip_etag, etag), gzip_etag)
+
+        self.assertIsNone(responses.match_etag('"other"', etag))
+        self.assertIsNone(responses.match_etag(etag[:-1] + '-deflate"', etag))
+        self.assertIsNone(responses.match_etag(None, etag))
+
+    def test_compression_middleware(self):
+        app = responses.CompressionMiddleware(make_app(self.body, [(b'etag', b'"abc"')]))
+
+        (headers, body) = request(app, 'gzip, deflate')
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(headers['content-length'], str(len(body)))
+        self.assertEqual(headers['vary'], 'Accept-Encoding')
+        self.assertEqual(headers['etag'], '"abc-gzip"')
+        self.assertEqual(gzip.decompress(body), self.body)
+        self.assertLess(len(body), len(self.body) / 4)
+
+        # Not accepted, the response still varies with Accept-Encoding
+        (headers, body) = request(app)
+        self.assertNotIn('content-encoding', headers)
+        self.assertEqual(headers['vary'], 'Accept-Encoding')
+        self.assertEqual(headers['etag'], '"abc"')
+        self.assertEqual(body, self.body)
+
+    def test_compression_middleware_skipped(self):
+        # Small, streaming or already encoded responses are sent as is
+        for app in [
+            make_app(b'{}'),
+            make_app(self.body, parts=3),
+            make_app(self.body, [(b'content-encoding', b'identity')]),
+        ]:
+            (headers, body) = request(responses.CompressionMiddleware(app), 'gzip')
+            self.assertNotIn('vary', headers)
+            self.assertEqual(body, request(app, 'gzip')[1])
+
+    @unittest.skipIf(responses.brotli is None, 'brotli is not installed')
+    def test_compression_middleware_brotli(self):
+        app = responses.CompressionMiddleware(make_app(self.body))
+
+        (headers, body) = request(app, 'gzip, deflate, br')
+        self.assertEqual(headers['content-encoding'], 'br')
+        self.assertEqual(responses.brotli.decompress(body), self.body)